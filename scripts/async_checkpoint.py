@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Adapter-only checkpoints written off the training thread.
+At each save step the LoRA weights, scheduler state, dataloader position and RNG
+state (and, at a slower cadence, the optimizer state) are copied to host memory; a background thread writes them as safetensors into
+checkpoint-<step>.tmp/, renames it into place and rotates old checkpoints.
+Training only blocks for the device-to-host copy.
+trainer_state.json, including the state of callbacks such as early stopping, is
+taken once the step's logging and evaluation have run, as the Trainer's own
+save does. On resume the checkpoints already in output_dir are picked up again,
+so rotation and the best checkpoint carry on where the interrupted run left off.
+"""
+
+import copy
+import dataclasses
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import torch
+from peft import get_peft_model_state_dict
+from safetensors.torch import save_file
+from transformers import TrainerCallback
+from transformers.trainer_callback import ExportableState
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from distributed import distributed_mode
+from resume import (
+    DATALOADER_STATE_NAME,
+    OPTIMIZER_NAME,
+    SCHEDULER_NAME,
+    dataloader_state,
+    latest_full_checkpoint,
+    rng_states,
+)
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint-(\d+)")
+
+
+def to_host(value):
+    """Copy every tensor in a (nested) state dict to CPU memory."""
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True).contiguous()
+    if isinstance(value, dict):
+        return {key: to_host(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_host(item) for item in value)
+    return value
+
+
+class AsyncCheckpointCallback(TrainerCallback):
+    """Replace the Trainer's synchronous checkpointing with background writes."""
+
+    def __init__(self, optimizer_save_steps: int = 0):
+        self.optimizer_save_steps = optimizer_save_steps
+        self.queue = queue.Queue(maxsize=1)  # at most one snapshot waiting on the writer
+        self.thread = None
+        self.error = None
+        self.saved = []  # checkpoint dirs, oldest first
+        self.with_optimizer = None  # newest checkpoint holding optimizer state
+        self.best = None
+        self.pending = None  # snapshot of the last save step, queued once its evaluation has run
+        # The Trainer's CallbackHandler, set by ResumableDataMixin: its ExportableState callbacks
+        # (early stopping's patience counter) are stored in trainer_state.json
+        self.callback_handler = None
+        self.blocked_s = 0.0
+        self.write_s = 0.0
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        # Checkpoints of an interrupted run still count toward save_total_limit and the best one
+        numbered = [
+            (int(match.group(1)), path)
+            for path in Path(args.output_dir).glob("checkpoint-*")
+            if path.is_dir() and (match := CHECKPOINT_PATTERN.fullmatch(path.name))
+        ]
+        self.saved = [path for _, path in sorted(numbered)]
+        self.with_optimizer = latest_full_checkpoint(args.output_dir)
+        self._update_best(args, state)
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._queue_pending(args, state, control)
+
+    def on_step_end(
+        self,
+        args,
+        state,
+        control,
+        model=None,
+        optimizer=None,
+        lr_scheduler=None,
+        train_dataloader=None,
+        **kwargs,
+    ):
+        self._update_best(args, state)
+        if not control.should_save:
+            return
+        # Evaluation for this step still runs; only the Trainer's own save is skipped
+        control.should_save = False
+        # Every rank's RNG state goes into the checkpoint, so every rank joins the gather
+        rng = rng_states(args)
+        if not state.is_world_process_zero:
+            return
+        self._raise_writer_error()
+
+        start = time.perf_counter()
+        adapter_name = model.active_adapter
+        peft_config = copy.deepcopy(model.peft_config[adapter_name])
+        peft_config.inference_mode = True
+        self.pending = {
+            "dir": Path(args.output_dir) / f"checkpoint-{state.global_step}",
+            "adapter": to_host(get_peft_model_state_dict(model, adapter_name=adapter_name)),
+            "peft_config": peft_config,
+            "keep": args.save_total_limit,
+            "dataloader": dataloader_state(args, state, train_dataloader),
+            "rng": rng,
+            # A few numbers, but without them a resumed run restarts the learning-rate schedule
+            "scheduler": copy.deepcopy(lr_scheduler.state_dict()),
+        }
+        if self.optimizer_save_steps and state.global_step % self.optimizer_save_steps == 0:
+            self.pending["optimizer"] = to_host(optimizer.state_dict())
+        self.blocked_s += time.perf_counter() - start
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        self._queue_pending(args, state, control)
+        self._update_best(args, state)
+        if control.should_training_stop or state.global_step >= state.max_steps:
+            # The Trainer loads the best checkpoint before on_train_end, so it must be on disk
+            self.flush()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._queue_pending(args, state, control)
+        self.flush()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            print(
+                f"Checkpointing blocked training for {self.blocked_s:.2f}s; "
+                f"background writes took {self.write_s:.2f}s"
+            )
+
+    def flush(self):
+        """Wait until every queued checkpoint has been written."""
+        self.queue.join()
+        self._raise_writer_error()
+
+    def _queue_pending(self, args, state, control):
+        """Hand the last save step's snapshot to the writer, with the trainer state as it is now."""
+        if self.pending is None:
+            return
+        job, self.pending = self.pending, None
+        if job["dir"] in self.saved:
+            self.saved.remove(job["dir"])  # rewritten after resuming from an earlier step
+        self.saved.append(job["dir"])
+        self._update_best(args, state)
+        self._export_callback_states(state, control)
+        job["state"] = json.dumps(dataclasses.asdict(state), indent=2, sort_keys=True) + "\n"
+
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._writer, name="checkpoint-writer", daemon=True
+            )
+            self.thread.start()
+        start = time.perf_counter()
+        self.queue.put(job)
+        self.blocked_s += time.perf_counter() - start
+
+    def _export_callback_states(self, state, control):
+        # As Trainer._save_checkpoint does, so the Trainer restores these callbacks on resume
+        callbacks = self.callback_handler.callbacks if self.callback_handler is not None else []
+        for callback in [*callbacks, control]:
+            if isinstance(callback, ExportableState):
+                name = type(callback).__name__
+                if isinstance(state.stateful_callbacks.get(name), list):
+                    state.stateful_callbacks[name].append(callback.state())
+                else:
+                    state.stateful_callbacks[name] = callback.state()
+
+    def _update_best(self, args, state):
+        # The Trainer records best_global_step after evaluating; point it at our checkpoint
+        if getattr(state, "best_global_step", None):
+            best = Path(args.output_dir) / f"checkpoint-{state.best_global_step}"
+            if best in self.saved:
+                self.best = best
+                state.best_model_checkpoint = str(best)
+
+    def _raise_writer_error(self):
+        if self.error is not None:
+            raise RuntimeError("Background checkpoint write failed") from self.error
+
+    def _writer(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is not None and self.error is None:
+                    start = time.perf_counter()
+                    self._write(job)
+                    self.write_s += time.perf_counter() - start
+            except Exception as error:  # surfaced on the training thread at the next save
+                self.error = error
+            finally:
+                self.queue.task_done()
+            if job is None:
+                return
+
+    def _write(self, job):
+        final = job["dir"]
+        partial = final.with_name(final.name + ".tmp")
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+
+        save_file(job["adapter"], partial / "adapter_model.safetensors", metadata={"format": "pt"})
+        job["peft_config"].save_pretrained(partial)
+        (partial / "trainer_state.json").write_text(job["state"])
+        if job["dataloader"] is not None:
+            (partial / DATALOADER_STATE_NAME).write_text(
+                json.dumps(job["dataloader"], indent=2) + "\n"
+            )
+        for name, rng in job["rng"].items():
+            torch.save(rng, partial / name)
+        torch.save(job["scheduler"], partial / SCHEDULER_NAME)
+        if "optimizer" in job:
+            torch.save(job["optimizer"], partial / OPTIMIZER_NAME)
+
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(partial, final)
+        if "optimizer" in job:
+            self.with_optimizer = final
+        self._rotate(job["keep"])
+
+    def _rotate(self, keep):
+        """Delete old checkpoints, keeping the best and the newest with optimizer state."""
+        if not keep:
+            return
+        protected = {self.best, self.with_optimizer}
+        written = [path for path in self.saved if path.exists()]
+        for path in written[:-keep]:
+            if path not in protected:
+                shutil.rmtree(path, ignore_errors=True)
+                self.saved.remove(path)
+
+
+def checkpoint_callbacks(config: dict) -> list:
+    """Return the async checkpoint callback unless disabled (or FSDP needs a gathered save)."""
+    output = config["output"]
+    if not output.get("async_checkpoint", True) or distributed_mode(config) == "fsdp":
+        return []
+
+    optimizer_save_steps = output.get("optimizer_save_steps", 0)
+    if optimizer_save_steps and optimizer_save_steps % output["save_steps"]:
+        raise ValueError(
+            f"output.optimizer_save_steps ({optimizer_save_steps}) must be a multiple of "
+            f"output.save_steps ({output['save_steps']})"
+        )
+    return [AsyncCheckpointCallback(optimizer_save_steps)]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Automatic per-device batch size and gradient accumulation tuning.
+Probes the largest batch that fits using the longest training sequences,
+then recomputes gradient accumulation to keep the configured effective batch.
+Under DDP every rank probes its own device and all of them use the smallest
+result, so the replicas keep identical batch sizes. Results are cached per (model, hardware, sequence length).
+"""
+
+import json
+import os
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+import torch
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from distributed import is_main_process, min_across_ranks
+
+
+def default_cache_path() -> Path:
+    """Return the per-machine autotune cache file."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(cache_home) / "lora-training" / "autotune.json"
+
+
+def hardware_fingerprint() -> str:
+    """Describe the local accelerator so cached results are not reused elsewhere."""
+    if not torch.cuda.is_available():
+        return "cpu"
+    props = torch.cuda.get_device_properties(0)
+    return f"{props.name} x{torch.cuda.device_count()} {props.total_memory / 2**30:.0f}GiB"
+
+
+def cache_key(model_name: str, hardware: str, max_seq_length: int) -> str:
+    return f"{model_name}|{hardware}|{max_seq_length}"
+
+
+def find_max_batch_size(fits: Callable[[int], bool], start: int = 1, limit: int = 256) -> int:
+    """Return the largest batch size in [1, limit] for which ``fits`` succeeds.
+
+    Doubles from ``start`` until a probe fails (or halves if ``start`` itself
+    fails), then bisects between the largest success and smallest failure.
+    """
+    low, high = 0, None
+    batch = min(start, limit)
+    while True:
+        if fits(batch):
+            low = batch
+            if batch >= limit:
+                break
+            batch = min(batch * 2, limit)
+        else:
+            high = batch
+            break
+
+    while low == 0:
+        if batch == 1:
+            raise RuntimeError("Batch size 1 does not fit; reduce max_seq_length or model size")
+        batch //= 2
+        if fits(batch):
+            low = batch
+        else:
+            high = batch
+
+    while high is not None and high - low > 1:
+        mid = (low + high) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def split_effective_batch(effective: int, max_batch: int) -> tuple[int, int]:
+    """Split an effective batch into (per-device batch, accumulation steps).
+
+    Picks the largest per-device batch that fits and divides the effective
+    batch exactly, so the optimizer sees the same batch as configured.
+    """
+    per_device = max(d for d in range(1, min(effective, max_batch) + 1) if effective % d == 0)
+    return per_device, effective // per_device
+
+
+def longest_examples(texts: list[str], tokenizer, max_length: int, count: int = 32) -> list:
+    """Tokenize the longest training texts, truncated to max_length."""
+    candidates = sorted(texts, key=len, reverse=True)[: count * 4]
+    encoded = tokenizer(candidates, truncation=True, max_length=max_length)["input_ids"]
+    return sorted(encoded, key=len, reverse=True)[:count]
+
+
+def make_probe(model, examples: list[list[int]], pad_token_id: int = 0) -> Callable[[int], bool]:
+    """Build a probe that runs one forward/backward pass on the longest examples."""
+    device = next(model.parameters()).device
+
+    def fits(batch_size: int) -> bool:
+        rows = [examples[i % len(examples)] for i in range(batch_size)]
+        width = max(len(row) for row in rows)
+        input_ids = torch.full((batch_size, width), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, : len(row)] = torch.tensor(row)
+            attention_mask[i, : len(row)] = 1
+        input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+
+        model.train()
+        try:
+            outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
+            outputs.loss.backward()
+            return True
+        except torch.cuda.OutOfMemoryError:
+            return False
+        finally:
+            outputs = None
+            model.zero_grad(set_to_none=True)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    return fits
+
+
+def load_cache(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text())
+    return {}
+
+
+def save_cache(path: Path, cache: dict):
+    """Write the cache from rank 0 only, replacing the file so readers never see it half-written."""
+    if not is_main_process():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_text(json.dumps(cache, indent=2, sort_keys=True))
+    os.replace(temporary, path)
+
+
+def autotune_batch_size(model, tokenizer, texts: list[str], config: dict, cache_path=None):
+    """Return (per-device batch size, gradient accumulation) for this machine."""
+    training = config["training"]
+    effective = training["batch_size"] * training["gradient_accumulation"]
+    cache_path = Path(cache_path) if cache_path else default_cache_path()
+    hardware = hardware_fingerprint()
+    key = cache_key(config["model"]["name"], hardware, training["max_seq_length"])
+
+    cache = load_cache(cache_path)
+    if key in cache:
+        max_batch = cache[key]["max_batch_size"]
+        print(f"Using cached max batch size {max_batch} for {key}")
+    elif hardware == "cpu":
+        print("No CUDA device to probe; keeping configured batch size")
+        return training["batch_size"], training["gradient_accumulation"]
+    else:
+        examples = longest_examples(texts, tokenizer, training["max_seq_length"])
+        probe = make_probe(model, examples, tokenizer.pad_token_id or 0)
+        max_batch = find_max_batch_size(probe, start=training["batch_size"], limit=effective)
+
+    # Ranks can differ (a busier device, a missing cache entry); the smallest fits everywhere
+    max_batch = min_across_ranks(max_batch)
+    if cache.get(key) != {"max_batch_size": max_batch}:
+        cache[key] = {"max_batch_size": max_batch}
+        save_cache(cache_path, cache)
+        print(f"Largest batch that fits on every rank: {max_batch} (cached in {cache_path})")
+
+    batch_size, accumulation = split_effective_batch(effective, max_batch)
+    print(
+        f"Auto batch: {batch_size} per device x {accumulation} accumulation steps "
+        f"(effective batch {effective})"
+    )
+    return batch_size, accumulation
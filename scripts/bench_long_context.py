@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Sequence-length sweep for long-context training settings.
+Runs LoRA forward+backward steps at each sequence length for each gradient
+checkpointing mode and records peak memory, activation memory kept for backward
+and tokens/s. Every measurement runs in a fresh process so peak memory is not
+inherited from an earlier, longer run. Defaults to a tiny random model on CPU.
+Usage: python bench_long_context.py --seq-lens 512 1024 2048 --output long_context.json
+       python bench_long_context.py --model Qwen/Qwen3-Coder-30B-A3B-Instruct --seq-lens 8192 32768 65536
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from long_context import CHECKPOINTING_MODES
+
+# Small enough for CPU, deep enough that per-layer checkpointing matters
+TINY_MODEL = {
+    "vocab_size": 1024,
+    "hidden_size": 128,
+    "intermediate_size": 256,
+    "num_hidden_layers": 4,
+    "num_attention_heads": 4,
+    "num_key_value_heads": 2,
+    "max_position_embeddings": 131072,
+    "tie_word_embeddings": False,
+}
+
+
+def build_model(model_name: str, attn_implementation: str):
+    """Load a model (or the tiny random one) with LoRA on the attention projections."""
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from transformers import AutoModelForCausalLM, Qwen2Config
+
+    if model_name is None:
+        torch.manual_seed(0)
+        model = AutoModelForCausalLM.from_config(
+            Qwen2Config(**TINY_MODEL), attn_implementation=attn_implementation
+        )
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16,
+            device_map="auto",
+            attn_implementation=attn_implementation,
+        )
+    lora_config = LoraConfig(
+        r=16, lora_alpha=32, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"
+    )
+    return get_peft_model(model, lora_config)
+
+
+def saved_tensor_bytes(model, run_forward):
+    """Run a forward pass and count the bytes autograd keeps for backward (weights excluded)."""
+    import torch
+
+    parameters = {p.untyped_storage().data_ptr() for p in model.parameters()}
+    seen = set()
+    total = 0
+
+    def pack(tensor):
+        nonlocal total
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() not in parameters and storage.data_ptr() not in seen:
+            seen.add(storage.data_ptr())
+            total += storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        loss = run_forward()
+    return loss, total
+
+
+def measure(
+    seq_len: int,
+    mode: str,
+    checkpoint_every: int,
+    attn_implementation: str,
+    model_name: str = None,
+    steps: int = 2,
+) -> dict:
+    """Time forward+backward at one sequence length in the current process."""
+    import torch
+
+    from long_context import apply_gradient_checkpointing
+    from telemetry import peak_memory
+
+    model = build_model(model_name, attn_implementation)
+    model.train()
+    apply_gradient_checkpointing(
+        model, {"training": {"gradient_checkpointing": mode, "checkpoint_every": checkpoint_every}}
+    )
+    device = next(model.parameters()).device
+    input_ids = torch.randint(1, model.config.vocab_size, (1, seq_len), device=device)
+
+    def run_forward():
+        return model(input_ids=input_ids, labels=input_ids).loss
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    baseline_mb = peak_memory()["peak_allocated_mb"]
+
+    loss, saved_bytes = saved_tensor_bytes(model, run_forward)
+    loss.backward()
+    model.zero_grad(set_to_none=True)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        run_forward().backward()
+        model.zero_grad(set_to_none=True)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    peak_mb = peak_memory()["peak_allocated_mb"]
+    return {
+        "seq_len": seq_len,
+        "mode": mode,
+        "attn_implementation": attn_implementation,
+        "tokens_per_s": seq_len * steps / elapsed,
+        "saved_activation_mb": saved_bytes / 2**20,
+        "peak_mb": peak_mb,
+        "peak_over_baseline_mb": peak_mb - baseline_mb,
+    }
+
+
+def measure_in_subprocess(**settings) -> dict:
+    """Run measure() in a fresh interpreter; out-of-memory becomes an error record."""
+    result = subprocess.run(
+        [sys.executable, __file__, "--measure", json.dumps(settings)],
+        capture_output=True,
+        text=True,
+    )
+    marker = [line for line in result.stdout.splitlines() if line.startswith("RESULT=")]
+    if result.returncode or not marker:
+        error = (result.stderr.strip().splitlines() or ["failed"])[-1]
+        return {"seq_len": settings["seq_len"], "mode": settings["mode"], "error": error}
+    return json.loads(marker[-1][len("RESULT=") :])
+
+
+def run_benchmark(
+    seq_lens, modes, checkpoint_every=2, attn_implementation="sdpa", model_name=None, steps=2
+) -> list[dict]:
+    """Measure every (mode, sequence length) pair."""
+    results = []
+    for mode in modes:
+        for seq_len in seq_lens:
+            results.append(
+                measure_in_subprocess(
+                    seq_len=seq_len,
+                    mode=mode,
+                    checkpoint_every=checkpoint_every,
+                    attn_implementation=attn_implementation,
+                    model_name=model_name,
+                    steps=steps,
+                )
+            )
+    return results
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [f"{'mode':<14} {'seq_len':>8} {'tokens/s':>10} {'saved MB':>10} {'peak MB':>10}"]
+    for r in results:
+        if "error" in r:
+            lines.append(f"{r['mode']:<14} {r['seq_len']:>8}  {r['error']}")
+            continue
+        lines.append(
+            f"{r['mode']:<14} {r['seq_len']:>8} {r['tokens_per_s']:>10.0f} "
+            f"{r['saved_activation_mb']:>10.1f} {r['peak_mb']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark memory and speed across sequence lengths"
+    )
+    parser.add_argument("--model", help="Model to load (default: tiny random model)")
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[512, 1024, 2048, 4096])
+    parser.add_argument(
+        "--modes", nargs="+", default=list(CHECKPOINTING_MODES), choices=CHECKPOINTING_MODES
+    )
+    parser.add_argument("--checkpoint-every", type=int, default=2)
+    parser.add_argument("--attn-implementation", default="sdpa")
+    parser.add_argument("--steps", type=int, default=2)
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print("RESULT=" + json.dumps(measure(**json.loads(args.measure))))
+        return
+
+    results = run_benchmark(
+        args.seq_lens,
+        args.modes,
+        args.checkpoint_every,
+        args.attn_implementation,
+        args.model,
+        args.steps,
+    )
+    print(format_results(results))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
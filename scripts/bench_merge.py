@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Parallel shard-merge benchmark.
+Runs the streaming merge with 1 worker and with each requested worker count
+into scratch directories, and reports time, read throughput and the speedup
+over single-process merging.
+Usage: python bench_merge.py --config config/avorion.yaml --workers 2 4 8
+       python bench_merge.py --config config/avorion.yaml --workers 8 --memory-budget-gb 96 --output merge.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+
+def run_benchmark(
+    base: str,
+    adapter_dir,
+    worker_counts: list[int],
+    dtype="float16",
+    memory_budget=None,
+    scratch=None,
+):
+    """Merge once per worker count (1 first) and return one summary per run with its speedup."""
+    from stream_merge import stream_merge
+
+    results = []
+    for workers in [1] + [count for count in worker_counts if count != 1]:
+        output_dir = Path(tempfile.mkdtemp(prefix=f"merge-{workers}-", dir=scratch))
+        try:
+            summary = stream_merge(
+                base, adapter_dir, output_dir, dtype, workers=workers, memory_budget=memory_budget
+            )
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        summary["requested_workers"] = workers
+        summary["read_gb_per_s"] = summary["input_bytes"] / 2**30 / summary["seconds"]
+        summary["speedup"] = results[0]["seconds"] / summary["seconds"] if results else 1.0
+        results.append(summary)
+    return results
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [f"{'workers':>7} {'seconds':>9} {'GB/s':>7} {'speedup':>8}"]
+    for result in results:
+        lines.append(
+            f"{result['workers']:>7} {result['seconds']:>9.2f} {result['read_gb_per_s']:>7.2f} "
+            f"{result['speedup']:>7.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parallel shard merging")
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--dtype", default="float16", choices=["float16", "bfloat16", "float32"])
+    parser.add_argument("--memory-budget-gb", type=float)
+    parser.add_argument(
+        "--scratch", help="Directory for the temporary merged outputs (default: system temp)"
+    )
+    parser.add_argument("--output", help="Save results as JSON")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    budget = args.memory_budget_gb * 2**30 if args.memory_budget_gb else None
+    results = run_benchmark(
+        config["model"]["name"],
+        config["output"]["adapter_dir"],
+        args.workers,
+        args.dtype,
+        budget,
+        args.scratch,
+    )
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
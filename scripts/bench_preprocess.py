@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tokenization throughput benchmark.
+Formats and tokenizes the training set one example at a time (the old path)
+and in batches across 1, 2, 4, ... processes, and reports examples/s and the
+speedup over one process.
+Usage: python bench_preprocess.py --config config/avorion.yaml
+       python bench_preprocess.py --config config/avorion.yaml --num-proc 1 2 4 8 --output tokenize.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from datasets import load_dataset
+from transformers import AutoTokenizer
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+from preprocess import default_num_proc, tokenize_dataset
+
+
+def core_counts(limit: int) -> list[int]:
+    """1, 2, 4, ... up to and including limit."""
+    counts = [1]
+    while counts[-1] * 2 < limit:
+        counts.append(counts[-1] * 2)
+    if limit > 1:
+        counts.append(limit)
+    return counts
+
+
+def time_per_example(dataset, tokenizer, config: dict) -> float:
+    """Seconds to format and tokenize every example individually, as the trainer did."""
+    template = config["prompt_template"]
+    max_length = config["training"]["max_seq_length"]
+    start = time.perf_counter()
+    for example in dataset:
+        tokenizer(template.format(**example), truncation=True, max_length=max_length)
+    return time.perf_counter() - start
+
+
+def time_batched(dataset, tokenizer, config: dict, num_proc: int, batch_size=None) -> float:
+    """Seconds for tokenize_dataset with num_proc workers, bypassing the cache."""
+    start = time.perf_counter()
+    tokenize_dataset(
+        dataset, tokenizer, config, cache_file=None, num_proc=num_proc, batch_size=batch_size
+    )
+    return time.perf_counter() - start
+
+
+def run_benchmark(
+    dataset, tokenizer, config: dict, num_procs: list[int], batch_size=None
+) -> list[dict]:
+    """Throughput of the per-example path and of batched tokenization at each process count."""
+    count = len(dataset)
+    results = [
+        {
+            "mode": "per_example",
+            "num_proc": 1,
+            "seconds": time_per_example(dataset, tokenizer, config),
+        }
+    ]
+    for num_proc in num_procs:
+        seconds = time_batched(dataset, tokenizer, config, num_proc, batch_size)
+        results.append({"mode": "batched", "num_proc": num_proc, "seconds": seconds})
+
+    single = next(
+        (r["seconds"] for r in results if r["mode"] == "batched" and r["num_proc"] == 1), None
+    )
+    for result in results:
+        result["examples_per_s"] = count / result["seconds"] if result["seconds"] else float("inf")
+        if single:
+            result["speedup"] = single / result["seconds"] if result["seconds"] else float("inf")
+    return results
+
+
+def format_results(results: list[dict], count: int) -> str:
+    lines = [
+        f"{count} examples",
+        f"{'mode':<12} {'procs':>5} {'seconds':>9} {'examples/s':>11} {'speedup':>8}",
+    ]
+    for result in results:
+        speedup = f"{result['speedup']:>7.2f}x" if "speedup" in result else f"{'-':>8}"
+        lines.append(
+            f"{result['mode']:<12} {result['num_proc']:>5} {result['seconds']:>9.2f} "
+            f"{result['examples_per_s']:>11.0f} {speedup}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batched, multi-process tokenization")
+    parser.add_argument(
+        "--config", required=True, help="Domain config (train file, template, tokenizer)"
+    )
+    parser.add_argument(
+        "--num-proc",
+        type=int,
+        nargs="+",
+        help="Process counts to try (default: 1, 2, 4, ... cores)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Examples per tokenizer call (default: data.tokenize_batch_size)",
+    )
+    parser.add_argument("--limit", type=int, help="Only use the first N training examples")
+    parser.add_argument("--output", help="Save results as JSON")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    dataset = load_dataset("json", data_files=config["data"]["train_file"], split="train")
+    if args.limit:
+        dataset = dataset.select(range(min(args.limit, len(dataset))))
+    tokenizer = AutoTokenizer.from_pretrained(config["model"]["name"])
+
+    num_procs = args.num_proc or core_counts(default_num_proc())
+    results = run_benchmark(dataset, tokenizer, config, num_procs, args.batch_size)
+    print(format_results(results, len(dataset)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"examples": len(dataset), "cores": default_num_proc(), "results": results},
+                f,
+                indent=2,
+            )
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
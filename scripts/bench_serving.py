@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmark for a served model.
+Replays prompts from data.eval_file (formatted with the prompt template) as
+streaming completions against any OpenAI-compatible endpoint (vLLM, SGLang,
+llama.cpp server, ...). Requests arrive as a Poisson process at --request-rate
+(default: all at once) with at most --concurrency in flight. Reports time to
+first token (TTFT), inter-token latency (ITL), time per output token (TPOT),
+end-to-end latency with mean/p50/p95/p99, and request and token throughput.
+Usage: python bench_serving.py --config config/avorion.yaml --concurrency 8 --output run.json
+       python bench_serving.py --config config/avorion.yaml --url http://gpu-box:8000/v1 --model avorion \\
+           --request-rate 2 --num-prompts 200 --baseline run.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+from smoke_client import DEFAULT_URL, format_prompt, request_json
+
+PERCENTILES = (50, 95, 99)
+LATENCY_METRICS = ("ttft", "itl", "tpot", "e2e")
+# Summary values where larger is better, for comparison against a baseline
+HIGHER_IS_BETTER = ("request_throughput", "output_tokens_per_s", "decode_tokens_per_s")
+
+
+def load_prompts(config: dict, num_prompts=None) -> list[str]:
+    """Prompts from the eval file (the train file if there is none), repeated to num_prompts."""
+    data_file = config["data"].get("eval_file")
+    if not data_file or not Path(data_file).exists():
+        data_file = config["data"]["train_file"]
+    with open(data_file) as f:
+        prompts = [
+            format_prompt(config["prompt_template"], json.loads(line)) for line in f if line.strip()
+        ]
+    if not prompts:
+        raise ValueError(f"No examples in {data_file}")
+    count = num_prompts or len(prompts)
+    return [prompts[index % len(prompts)] for index in range(count)]
+
+
+def stream_completion(
+    url: str,
+    model: str,
+    prompt: str,
+    max_tokens: int,
+    ignore_eos: bool = False,
+    timeout: float = 600,
+) -> dict:
+    """Send one streaming completion and time every chunk of text that arrives."""
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "temperature": 0,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    if ignore_eos:
+        payload["ignore_eos"] = True
+    request = urllib.request.Request(
+        f"{url}/completions",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    result = {"ok": False, "ttft": None, "itl": [], "output_tokens": 0}
+    chunks = 0
+    start = time.perf_counter()
+    last = None
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            for line in response:
+                line = line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if event.get("usage"):
+                    result["output_tokens"] = event["usage"].get("completion_tokens", 0)
+                if not any(choice.get("text") for choice in event.get("choices") or []):
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    result["ttft"] = now - start
+                else:
+                    result["itl"].append(now - last)
+                last = now
+                chunks += 1
+        result["ok"] = last is not None
+    except (urllib.error.URLError, OSError, ValueError) as error:
+        result["error"] = str(error)
+    result["e2e"] = time.perf_counter() - start
+    # Servers that do not report usage stream one token per chunk
+    result["output_tokens"] = result["output_tokens"] or chunks
+    if result["ok"] and result["output_tokens"] > 1:
+        result["tpot"] = (result["e2e"] - result["ttft"]) / (result["output_tokens"] - 1)
+    return result
+
+
+def arrival_times(count: int, request_rate: float, seed: int = 0) -> list[float]:
+    """Send offsets in seconds: a Poisson process at request_rate per second, or all at 0 if it is infinite."""
+    if request_rate == float("inf"):
+        return [0.0] * count
+    generator = random.Random(seed)
+    times, now = [], 0.0
+    for _ in range(count):
+        times.append(now)
+        now += generator.expovariate(request_rate)
+    return times
+
+
+def run_benchmark(
+    url: str,
+    model: str,
+    prompts: list[str],
+    concurrency: int = 8,
+    request_rate: float = float("inf"),
+    max_tokens: int = 256,
+    ignore_eos: bool = False,
+    seed: int = 0,
+) -> tuple[list[dict], float]:
+    """Replay prompts against the endpoint; returns the per-request results and the wall time."""
+    results = [None] * len(prompts)
+    slots = threading.Semaphore(concurrency)
+
+    def send(index: int):
+        try:
+            results[index] = stream_completion(url, model, prompts[index], max_tokens, ignore_eos)
+        finally:
+            slots.release()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, offset in enumerate(arrival_times(len(prompts), request_rate, seed)):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Arrivals wait here while every slot is busy, as they would queue at a client
+            slots.acquire()
+            pool.submit(send, index)
+    return results, time.perf_counter() - start
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The q-th percentile with linear interpolation between the closest ranks."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(results: list[dict], duration: float) -> dict:
+    """Throughput and the mean and percentiles (in ms) of every latency metric."""
+    completed = [result for result in results if result["ok"]]
+    output_tokens = sum(result["output_tokens"] for result in completed)
+    summary = {
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "duration_s": duration,
+        "request_throughput": len(completed) / duration,
+        "output_tokens": output_tokens,
+        "output_tokens_per_s": output_tokens / duration,
+    }
+    for metric in LATENCY_METRICS:
+        if metric == "itl":
+            values = [gap for result in completed for gap in result["itl"]]
+        else:
+            values = [result[metric] for result in completed if result.get(metric) is not None]
+        if not values:
+            continue
+        summary[f"mean_{metric}_ms"] = sum(values) / len(values) * 1000
+        for q in PERCENTILES:
+            summary[f"p{q}_{metric}_ms"] = percentile(values, q) * 1000
+    if "mean_tpot_ms" in summary:
+        # What one stream sees, comparable to single-user generation tok/s
+        summary["decode_tokens_per_s"] = 1000 / summary["mean_tpot_ms"]
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    lines = [
+        f"Completed {summary['completed']} requests ({summary['failed']} failed) in {summary['duration_s']:.2f}s",
+        f"Throughput: {summary['request_throughput']:.2f} req/s, {summary['output_tokens_per_s']:.1f} output tok/s"
+        + (
+            f", {summary['decode_tokens_per_s']:.1f} tok/s per stream"
+            if "decode_tokens_per_s" in summary
+            else ""
+        ),
+        f"{'ms':<6} {'mean':>9} " + " ".join(f"{'p' + str(q):>9}" for q in PERCENTILES),
+    ]
+    for metric in LATENCY_METRICS:
+        if f"mean_{metric}_ms" in summary:
+            values = [summary[f"mean_{metric}_ms"]] + [
+                summary[f"p{q}_{metric}_ms"] for q in PERCENTILES
+            ]
+            lines.append(f"{metric.upper():<6} " + " ".join(f"{value:>9.1f}" for value in values))
+    return "\n".join(lines)
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> tuple[list[str], list[str]]:
+    """Relative change of every shared metric against a saved run, and those worse than tolerance."""
+    lines, regressions = [], []
+    for key, value in summary.items():
+        previous = baseline.get(key)
+        if not isinstance(value, float) or not previous or key == "duration_s":
+            continue
+        change = value / previous - 1
+        lines.append(f"{key:<24} {previous:>10.2f} -> {value:>10.2f} ({change:+.1%})")
+        worse = -change if key in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append(f"{key} {previous:.2f} -> {value:.2f}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark a served model's latency and throughput"
+    )
+    parser.add_argument(
+        "--config", required=True, help="Domain config whose eval_file supplies the prompts"
+    )
+    parser.add_argument("--url", default=DEFAULT_URL, help="OpenAI-compatible base URL")
+    parser.add_argument(
+        "--model", help="Served model or adapter name (default: the first one listed)"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument(
+        "--request-rate", type=float, default=float("inf"), help="Requests per second (Poisson)"
+    )
+    parser.add_argument(
+        "--num-prompts", type=int, help="Requests to send (default: one per eval example)"
+    )
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument(
+        "--ignore-eos", action="store_true", help="Always generate --max-tokens (vLLM extension)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save settings, summary and per-request results as JSON")
+    parser.add_argument("--baseline", help="Compare with a saved run and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    prompts = load_prompts(config, args.num_prompts)
+    model = args.model or request_json(f"{args.url}/models")["data"][0]["id"]
+    print(
+        f"Sending {len(prompts)} requests to {model} at {args.url} (concurrency {args.concurrency}, rate {args.request_rate}/s)"
+    )
+
+    results, duration = run_benchmark(
+        args.url,
+        model,
+        prompts,
+        args.concurrency,
+        args.request_rate,
+        args.max_tokens,
+        args.ignore_eos,
+        args.seed,
+    )
+    summary = summarize(results, duration)
+    print(format_summary(summary))
+
+    if args.output:
+        run = {
+            "settings": {
+                "url": args.url,
+                "model": model,
+                "config": args.config,
+                "concurrency": args.concurrency,
+                "request_rate": args.request_rate,
+                "num_prompts": len(prompts),
+                "max_tokens": args.max_tokens,
+                "ignore_eos": args.ignore_eos,
+                "date": datetime.now(UTC).isoformat(timespec="seconds"),
+            },
+            "summary": summary,
+            "requests": results,
+        }
+        Path(args.output).write_text(json.dumps(run, indent=2))
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        lines, regressions = compare(
+            summary, json.loads(Path(args.baseline).read_text())["summary"], args.tolerance
+        )
+        print(f"\nAgainst {args.baseline}:")
+        print("\n".join(lines))
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
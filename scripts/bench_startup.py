@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the `lora` CLI.
+Times `lora <command> --help` in fresh interpreters and checks that no heavy
+dependency is imported before a command actually runs.
+Usage: python bench_startup.py --output startup.json
+       python bench_startup.py --baseline startup.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+HEAVY_MODULES = ("torch", "transformers", "peft", "trl", "datasets", "anthropic", "accelerate")
+
+# Runs one CLI invocation and reports which heavy modules it imported
+PROBE = """
+import json, sys
+sys.path.insert(0, {scripts_dir!r})
+import cli
+try:
+    cli.main({argv!r})
+except SystemExit:
+    pass
+heavy = [m for m in {heavy!r} if m in sys.modules]
+sys.stderr.write("HEAVY=" + json.dumps(heavy) + "\\n")
+"""
+
+
+def measure_command(argv: list[str], repeats: int = 5) -> dict:
+    """Time a CLI invocation in fresh interpreters and list the heavy modules it imports."""
+    code = PROBE.format(scripts_dir=str(SCRIPTS_DIR), argv=argv, heavy=HEAVY_MODULES)
+    timings = []
+    heavy = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        timings.append(time.perf_counter() - start)
+        marker = [line for line in result.stderr.splitlines() if line.startswith("HEAVY=")]
+        heavy = json.loads(marker[-1][len("HEAVY=") :])
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "heavy": heavy}
+
+
+def run_benchmark(repeats: int = 5) -> dict:
+    """Measure `lora --help` and `lora <command> --help` for every command."""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    from cli import COMMANDS
+
+    results = {"lora --help": measure_command(["--help"], repeats)}
+    for command in COMMANDS:
+        results[f"lora {command} --help"] = measure_command([command, "--help"], repeats)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Compare against a saved run; slower than baseline * (1 + tolerance) is a regression."""
+    problems = []
+    for name, result in results.items():
+        if result["heavy"]:
+            problems.append(f"{name} imports {', '.join(result['heavy'])}")
+        previous = baseline.get(name)
+        if previous and result["median_s"] > previous["median_s"] * (1 + tolerance):
+            problems.append(
+                f"{name} took {result['median_s']:.3f}s, baseline {previous['median_s']:.3f}s"
+            )
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Save results as JSON for later comparison")
+    parser.add_argument("--baseline", help="Fail if slower than this saved run")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown fraction")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.repeats)
+    for name, result in results.items():
+        heavy = f"  imports {', '.join(result['heavy'])}" if result["heavy"] else ""
+        print(f"{name:<26} {result['median_s'] * 1000:7.1f} ms{heavy}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Saved results to {args.output}")
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else {}
+    problems = find_regressions(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Causal LM loss computed over sequence chunks instead of full-vocab logits.
+The model returns its final hidden states (logits for one position only); each
+chunk of tokens is projected through the LM head and scored under activation
+checkpointing, so at most one chunk's [chunk, vocab] logits exist at a time,
+in forward and in backward. Loss and gradients match the standard path.
+"""
+
+import os
+import sys
+
+import torch
+from torch.nn import functional
+from torch.utils.checkpoint import checkpoint
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from distributed import distributed_mode
+
+IGNORE_INDEX = -100
+
+
+def _chunk_loss_sum(hidden, weight, bias, labels):
+    logits = functional.linear(hidden, weight, bias).float()
+    return functional.cross_entropy(logits, labels, ignore_index=IGNORE_INDEX, reduction="sum")
+
+
+def chunked_causal_lm_loss(
+    hidden_states, lm_head, labels, chunk_size: int, num_items_in_batch=None
+):
+    """Next-token cross-entropy over [batch, seq, hidden] states, chunk_size tokens at a time.
+
+    Reduces like transformers' ForCausalLMLoss: a sum divided by num_items_in_batch
+    when given (gradient accumulation), otherwise the mean over unmasked tokens.
+    """
+    # Shift so that position i predicts token i + 1
+    labels = functional.pad(labels, (0, 1), value=IGNORE_INDEX)[..., 1:]
+    hidden = hidden_states.reshape(-1, hidden_states.shape[-1])
+    labels = labels.reshape(-1).to(hidden.device)
+
+    total = hidden.new_zeros((), dtype=torch.float32)
+    for start in range(0, hidden.shape[0], chunk_size):
+        total = total + checkpoint(
+            _chunk_loss_sum,
+            hidden[start : start + chunk_size],
+            lm_head.weight,
+            lm_head.bias,
+            labels[start : start + chunk_size],
+            use_reentrant=False,
+        )
+
+    if num_items_in_batch is not None:
+        if torch.is_tensor(num_items_in_batch):
+            num_items_in_batch = num_items_in_batch.to(total.device)
+        return total / num_items_in_batch
+    return total / (labels != IGNORE_INDEX).sum()
+
+
+class ChunkedLossMixin:
+    """Trainer mixin that replaces the model's full-logits loss with the chunked loss.
+
+    Trainer-specific extras computed from the full logits (such as SFTTrainer's
+    token accuracy) are not logged on this path.
+    """
+
+    loss_chunk_size = None
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        if not self.loss_chunk_size or "labels" not in inputs:
+            return super().compute_loss(model, inputs, return_outputs, num_items_in_batch)
+
+        labels = inputs["labels"]
+        inputs = {key: value for key, value in inputs.items() if key != "labels"}
+        # Only the last position's logits are computed; the loss uses the hidden states
+        outputs = model(**inputs, output_hidden_states=True, logits_to_keep=1, use_cache=False)
+        lm_head = self.accelerator.unwrap_model(model).get_output_embeddings()
+        loss = chunked_causal_lm_loss(
+            outputs.hidden_states[-1], lm_head, labels, self.loss_chunk_size, num_items_in_batch
+        )
+
+        if self.args.average_tokens_across_devices and num_items_in_batch is not None:
+            # num_items_in_batch counts tokens on every rank; DDP averages gradients over ranks
+            loss = loss * self.accelerator.num_processes
+        return (loss, outputs) if return_outputs else loss
+
+
+def chunked_loss_trainer(trainer_class, config: dict):
+    """Return trainer_class, extended with the chunked loss if training.loss_chunk_size is set."""
+    chunk_size = config["training"].get("loss_chunk_size")
+    if not chunk_size:
+        return trainer_class
+    if distributed_mode(config) == "fsdp":
+        raise ValueError(
+            "training.loss_chunk_size needs the full LM head and is not supported with FSDP"
+        )
+    return type(
+        f"ChunkedLoss{trainer_class.__name__}",
+        (ChunkedLossMixin, trainer_class),
+        {"loss_chunk_size": chunk_size},
+    )
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Unified entry point for the LoRA training pipeline.
+Usage: lora train --config config/avorion.yaml
+       lora merge --config config/avorion.yaml --output ./avorion-merged
+       lora validate --config config/avorion.yaml --data
+
+Each subcommand's module is imported only when that subcommand runs, and the
+modules themselves defer torch/transformers/anthropic imports until after
+argument parsing, so `lora --help` and `lora <command> --help` are instant.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# subcommand -> (module, description)
+COMMANDS = {
+    "generate": ("generate_dataset", "Generate training pairs with the Anthropic API"),
+    "score": ("score", "Score training examples by loss for pruning"),
+    "train": ("train", "Train one or more LoRA adapters"),
+    "reduce-rank": ("reduce_rank", "Shrink a trained adapter's rank by truncated SVD"),
+    "compose": ("compose", "Compose several domain adapters into one"),
+    "merge": ("merge", "Merge an adapter into its base model"),
+    "reshard": ("reshard", "Rewrite a checkpoint into evenly sized safetensors shards"),
+    "quantize": ("quantize", "Quantize a merged model for serving"),
+    "convert": ("convert_vllm", "Prepare a merged model (or base model plus adapters) for vLLM"),
+    "smoke": ("smoke_client", "Send one request per domain adapter to a vLLM server"),
+    "bench": ("bench_serving", "Benchmark a served model's latency and throughput"),
+    "validate": ("validate", "Validate configs and datasets"),
+    "pipeline": ("pipeline", "Run every stage, skipping those that are up to date"),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="lora",
+        description="LoRA training pipeline",
+        epilog="Run 'lora <command> --help' for a command's options.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>", required=True)
+    for name, (_, description) in COMMANDS.items():
+        # Options are parsed by the command's own parser
+        subparsers.add_parser(name, help=description, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args, rest = build_parser().parse_known_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    # Make the command's own --help and usage lines read "lora <command>"
+    sys.argv[0] = f"lora {args.command}"
+    importlib.import_module(module_name).main(rest)
+
+
+if __name__ == "__main__":
+    main()
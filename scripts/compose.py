@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Compose several domain adapters into one unified adapter, on CPU.
+Combines each config's output.adapter_dir module by module with weighted
+linear, TIES or DARE merging (see composition.py) and writes a standard PEFT
+adapter directory that merge.py, convert_vllm.py and vLLM's --lora-modules
+accept like a trained one. The per-module report is printed and saved as
+composition_report.json in the output directory.
+Usage: python compose.py --config config/avorion.yaml config/gdscript.yaml --output ./adapters/unified
+       python compose.py --config config/avorion.yaml config/gdscript.yaml --output ./adapters/unified \\
+           --method ties --density 0.3 --weights 1.0 0.8 --rank 32
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+METHODS = ("linear", "ties", "dare_linear", "dare_ties")
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'module':<56} {'adapters':>8} {'rank':>5} {'energy':>8}"]
+    for module in report["modules"]:
+        lines.append(
+            f"{module['module']:<56} {module['adapters']:>8} {module['rank']:>5} {module['retained_energy']:>7.1%}"
+        )
+    lines.append(
+        f"Composed {len(report['adapters'])} adapters with {report['method']} (weights {report['weights']}) "
+        f"in {report['seconds']:.1f}s: max rank {report['max_rank']}, "
+        f"{report['output_bytes'] / 2**20:.1f} MiB, min retained energy {report['min_retained_energy']:.1%}"
+    )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compose domain adapters into one adapter")
+    parser.add_argument(
+        "--config", required=True, nargs="+", help="Domain configs whose adapters to compose"
+    )
+    parser.add_argument("--output", required=True, help="Directory for the composed adapter")
+    parser.add_argument("--method", default="linear", choices=METHODS)
+    parser.add_argument(
+        "--weights", type=float, nargs="+", help="One weight per config (default: 1.0 each)"
+    )
+    parser.add_argument(
+        "--density", type=float, default=0.5, help="Fraction of entries TIES/DARE keep"
+    )
+    parser.add_argument(
+        "--rank", type=int, help="Output rank (default: exact for linear, largest input rank else)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="DARE's random drop seed")
+    args = parser.parse_args(argv)
+    if args.weights and len(args.weights) != len(args.config):
+        parser.error(f"--weights needs one value per config ({len(args.config)})")
+
+    configs = [load_config(path) for path in args.config]
+    for config in configs[1:]:
+        if config["model"]["name"] != configs[0]["model"]["name"]:
+            parser.error(f"{config['domain']} and {configs[0]['domain']} use different base models")
+
+    # Heavy imports happen after argument parsing so --help is instant
+    from composition import REPORT_NAME, compose_adapters
+
+    report = compose_adapters(
+        [config["output"]["adapter_dir"] for config in configs],
+        args.output,
+        method=args.method,
+        weights=args.weights,
+        density=args.density,
+        rank=args.rank,
+        seed=args.seed,
+    )
+    report["domains"] = [config["domain"] for config in configs]
+
+    print(format_report(report))
+    report_file = Path(args.output) / REPORT_NAME
+    report_file.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved report to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
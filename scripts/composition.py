@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Offline composition of several LoRA adapters into one, on CPU.
+Works one module at a time: each adapter's A and B for that module are read
+from its safetensors file (never the whole adapter), combined, and released,
+so peak memory is the composed adapter plus one module's dense updates.
+- linear: sum of weight * scaling * B @ A. Concatenating the factors makes it
+  exact at the summed rank; --rank truncates it by SVD.
+- ties: trim each update to its largest-magnitude density fraction, elect
+  each entry's sign by the weighted sum, and average the entries that agree.
+- dare_linear / dare_ties: drop entries at random (keeping density of them,
+  rescaled by 1 / density), then sum (linear) or elect signs (ties).
+The dense results are factored back to low rank by SVD. As in rank_reduction,
+the scaling is folded into the factors, so the output is a plain adapter
+directory that PEFT and vLLM load. Fused MoE experts are combined expert by
+expert and stacked back at one rank.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rank_reduction import (
+    ADAPTER_CONFIG,
+    ADAPTER_WEIGHTS,
+    truncated_expert_factors,
+    unit_scaling_config,
+)
+from stream_merge import (
+    ADAPTER_PREFIX,
+    LORA_KEY,
+    adapter_targets,
+    expert_factors,
+    fused_factors,
+    lora_scaling,
+)
+
+METHODS = ("linear", "ties", "dare_linear", "dare_ties")
+REPORT_NAME = "composition_report.json"
+
+
+def adapter_modules(adapter_dir) -> tuple[dict, dict]:
+    """An adapter's config and, per target, its module, A/B tensor names, scaling and experts (from the header only).
+
+    Targets are PEFT's keys: the module itself, or the fused parameter (experts.gate_up_proj) for fused experts.
+    """
+    adapter_dir = Path(adapter_dir)
+    config = json.loads((adapter_dir / ADAPTER_CONFIG).read_text())
+    if config.get("use_dora"):
+        raise ValueError(
+            f"{adapter_dir} uses DoRA, whose magnitude vectors cannot be composed; merge it instead"
+        )
+    with safe_open(adapter_dir / ADAPTER_WEIGHTS, framework="pt") as f:
+        rows = {key: f.get_slice(key).get_shape()[0] for key in f.keys()}  # noqa: SIM118
+
+    pairs = {}
+    for key in rows:
+        match = LORA_KEY.match(key.removeprefix(ADAPTER_PREFIX))
+        if match is None:
+            raise ValueError(
+                f"{adapter_dir}: cannot compose {key} (modules_to_save, bias or embedding adapters)"
+            )
+        pairs.setdefault(match["module"], {})[match["part"]] = key
+    modules = {}
+    for module, target in adapter_targets(config, pairs).items():
+        rank, scaling = lora_scaling(config, target)
+        experts = rows[pairs[module]["A"]] // rank if target != module else 1
+        modules[target] = {
+            **pairs[module],
+            "module": module,
+            "scaling": scaling,
+            "experts": experts,
+        }
+    return config, modules
+
+
+def trim(delta: torch.Tensor, density: float) -> torch.Tensor:
+    """Keep the density fraction of entries with the largest magnitude (TIES)."""
+    if density >= 1.0:
+        return delta
+    keep = max(1, round(density * delta.numel()))
+    threshold = delta.abs().flatten().kthvalue(delta.numel() - keep + 1).values
+    return delta * (delta.abs() >= threshold)
+
+
+def drop(delta: torch.Tensor, density: float, generator: torch.Generator) -> torch.Tensor:
+    """Keep each entry with probability density, rescaled so the expected update is unchanged (DARE)."""
+    if density >= 1.0:
+        return delta
+    mask = torch.rand(delta.shape, generator=generator, dtype=delta.dtype) < density
+    return delta * mask / density
+
+
+def combine(
+    deltas: list[torch.Tensor],
+    weights: list[float],
+    method: str,
+    density: float = 1.0,
+    generator=None,
+):
+    """Combine same-shaped dense updates with one of METHODS."""
+    if method.startswith("dare"):
+        deltas = [drop(delta, density, generator) for delta in deltas]
+    elif method == "ties":
+        deltas = [trim(delta, density) for delta in deltas]
+    weighted = torch.stack([weight * delta for weight, delta in zip(weights, deltas, strict=True)])
+    if method in ("ties", "dare_ties"):
+        sign = weighted.sum(0).sign()
+        agree = weighted.sign() == sign
+        return (weighted * agree).sum(0) / agree.sum(0).clamp(min=1)
+    return weighted.sum(0)
+
+
+def svd_factors(delta: torch.Tensor, rank: int) -> tuple[torch.Tensor, torch.Tensor, float]:
+    """Rank-limited (A, B) of a dense update and the fraction of its energy they keep."""
+    u, singular, vh = torch.linalg.svd(delta, full_matrices=False)
+    rank = max(1, min(rank, len(singular)))
+    total = (singular**2).sum()
+    retained = ((singular[:rank] ** 2).sum() / total).item() if total > 0 else 1.0
+    root = singular[:rank].sqrt()
+    return root.unsqueeze(1) * vh[:rank], u[:, :rank] * root, retained
+
+
+def composed_targets(configs: list[dict]):
+    """target_modules covering every input adapter's (a list if all are lists, else one regex)."""
+    targets = [config.get("target_modules") or [] for config in configs]
+    if all(isinstance(target, list) for target in targets):
+        return sorted({name for target in targets for name in target})
+    patterns = []
+    for target in targets:
+        if isinstance(target, str):
+            patterns.append(target)
+        else:
+            patterns.extend(rf"(.*\.)?{re.escape(name)}" for name in target)
+    return "|".join(f"(?:{pattern})" for pattern in patterns)
+
+
+def compose_adapters(
+    adapter_dirs: list,
+    output_dir,
+    method: str = "linear",
+    weights=None,
+    density: float = 0.5,
+    rank=None,
+    seed: int = 0,
+) -> dict:
+    """Compose adapters into output_dir module by module; returns the per-module report.
+
+    rank limits every module's output rank (default: exact for linear, else the largest input rank).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}, got {method!r}")
+    if not 0.0 < density <= 1.0:
+        raise ValueError(f"density must be in (0, 1], got {density}")
+    weights = list(weights) if weights is not None else [1.0] * len(adapter_dirs)
+    if len(weights) != len(adapter_dirs):
+        raise ValueError(f"{len(weights)} weights for {len(adapter_dirs)} adapters")
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+
+    configs, module_maps = zip(
+        *(adapter_modules(adapter_dir) for adapter_dir in adapter_dirs), strict=True
+    )
+    for key in ("base_model_name_or_path", "fan_in_fan_out"):
+        values = {config.get(key) for config in configs}
+        if len(values) > 1:
+            raise ValueError(
+                f"Adapters must share {key} to be composed, got {sorted(map(str, values))}"
+            )
+    for target in set().union(*module_maps):
+        # PEFT nests fused expert wrappers by which parameters an adapter targets
+        layouts = {(m[target]["module"], m[target]["experts"]) for m in module_maps if target in m}
+        if len(layouts) > 1:
+            raise ValueError(
+                f"Adapters hold {target} in different layouts {sorted(layouts)}; they cannot be composed"
+            )
+    generator = torch.Generator().manual_seed(seed)
+
+    tensors, modules = {}, []
+    with ExitStack() as stack:
+        files = [
+            stack.enter_context(safe_open(Path(adapter_dir) / ADAPTER_WEIGHTS, framework="pt"))
+            for adapter_dir in adapter_dirs
+        ]
+        dtype = files[0].get_tensor(next(iter(module_maps[0].values()))["A"]).dtype
+        for target in sorted(set().union(*module_maps)):
+            # Per adapter: one (A, scaling * B) pair per expert (a single one for plain modules), and its weight
+            parts = []
+            for file, module_map, weight in zip(files, module_maps, weights, strict=True):
+                if target in module_map:
+                    entry = module_map[target]
+                    lora_a = file.get_tensor(entry["A"]).double()
+                    lora_b = file.get_tensor(entry["B"]).double()
+                    factors = expert_factors(lora_a, entry["scaling"] * lora_b, entry["experts"])
+                    parts.append((factors, weight))
+            experts = len(parts[0][0])
+
+            if method == "linear":
+                # Exact: [w1 s1 B1 | w2 s2 B2] @ [A1; A2] is the weighted sum of the updates (per expert)
+                cat_a, cat_b = fused_factors(
+                    [
+                        (
+                            torch.cat([factors[expert][0] for factors, _ in parts]),
+                            torch.cat(
+                                [weight * factors[expert][1] for factors, weight in parts], dim=1
+                            ),
+                        )
+                        for expert in range(experts)
+                    ]
+                )
+                new_a, new_b, stats = truncated_expert_factors(
+                    cat_a, cat_b, 1.0, experts, rank=rank or cat_a.shape[0] // experts
+                )
+                retained = stats["retained_energy"]
+            else:
+                factored = []
+                for expert in range(experts):
+                    deltas = [factors[expert][1] @ factors[expert][0] for factors, _ in parts]
+                    merged = combine(
+                        deltas, [weight for _, weight in parts], method, density, generator
+                    )
+                    input_rank = max(factors[expert][0].shape[0] for factors, _ in parts)
+                    factored.append(svd_factors(merged, rank or input_rank))
+                new_a, new_b = fused_factors([(new_a, new_b) for new_a, new_b, _ in factored])
+                retained = min(expert_retained for *_, expert_retained in factored)
+
+            module = next(m[target]["module"] for m in module_maps if target in m)
+            tensors[f"{ADAPTER_PREFIX}{module}.lora_A.weight"] = new_a.to(dtype).contiguous()
+            tensors[f"{ADAPTER_PREFIX}{module}.lora_B.weight"] = new_b.to(dtype).contiguous()
+            rank_out = new_a.shape[0] // experts
+            modules.append(
+                {
+                    "module": target,
+                    "adapters": len(parts),
+                    "rank": rank_out,
+                    "retained_energy": retained,
+                }
+            )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    save_file(tensors, output_dir / ADAPTER_WEIGHTS, metadata={"format": "pt"})
+    config = unit_scaling_config(
+        configs[0], {module["module"]: module["rank"] for module in modules}
+    )
+    config["target_modules"] = composed_targets(configs)
+    target_parameters = sorted({name for c in configs for name in c.get("target_parameters") or []})
+    if target_parameters:
+        config["target_parameters"] = target_parameters
+    (output_dir / ADAPTER_CONFIG).write_text(json.dumps(config, indent=2) + "\n")
+
+    return {
+        "method": method,
+        "adapters": [str(adapter_dir) for adapter_dir in adapter_dirs],
+        "weights": weights,
+        "density": density if method != "linear" else None,
+        "rank": rank,
+        "modules": modules,
+        "max_rank": config["r"],
+        "min_retained_energy": min(module["retained_energy"] for module in modules),
+        "output_bytes": os.path.getsize(output_dir / ADAPTER_WEIGHTS),
+        "seconds": time.perf_counter() - start,
+    }
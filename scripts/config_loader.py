@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Shared config loading for every pipeline stage.
+Domain configs are deep-merged over config/base.yaml at every nesting level,
+so a domain can override a single nested key and keep its siblings.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import yaml
+
+
+def deep_merge(base: dict, override: dict) -> dict:
+    """Recursively merge ``override`` into a copy of ``base``."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(config_path: str, base_path: str = None) -> dict:
+    """Load a domain config deep-merged over base.yaml (next to it by default)."""
+    config_path = Path(config_path)
+    base_path = Path(base_path) if base_path else config_path.parent / "base.yaml"
+
+    with open(base_path) as f:
+        config = yaml.safe_load(f) or {}
+    with open(config_path) as f:
+        domain_config = yaml.safe_load(f) or {}
+    return deep_merge(config, domain_config)
+
+
+def config_hash(config: dict) -> str:
+    """Content hash of a resolved config, independent of key order."""
+    payload = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()
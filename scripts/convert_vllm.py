@@ -1,66 +1,232 @@
 #!/usr/bin/env python3
 """
 Convert merged model to vLLM format for local inference.
+The merged model is staged into <name>_vllm without copying its weights:
+files are hardlinked, reflinked or symlinked (copying only as a fallback), and
+files already staged by an earlier conversion are skipped. vllm_config.yaml is
+written next to them, with the quantization the checkpoint actually carries
+(see quantize.py) unless --quantization overrides it. max_model_len,
+max_num_seqs, max_num_batched_tokens, gpu_memory_utilization and
+tensor_parallel_size are derived from the model's config.json, the token
+lengths of the training data and the serving device (see serving_params.py),
+and the reasoning is written to serving_params.md beside the config.
+With --multi-lora nothing is merged: the config serves the base model once
+with --enable-lora and every config's adapter (staged the same way) under its
+domain name, sized by the adapters' largest rank.
 Usage: python convert_vllm.py --model ./avorion-merged --name avorion-coder --config config/avorion.yaml
+       python convert_vllm.py --model ./avorion-merged --name avorion-coder --config config/avorion.yaml --link symlink
+       python convert_vllm.py --multi-lora --name game-coder --config config/avorion.yaml config/gdscript.yaml
 """
 
 import argparse
+import json
 import os
-import subprocess
+import sys
+from pathlib import Path
+
 import yaml
 
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--model", required=True, help="Path to merged model")
-    parser.add_argument("--name", required=True, help="Output model name for vLLM")
-    parser.add_argument("--config", required=True)
-    parser.add_argument("--quantization", default="awq")
-    args = parser.parse_args()
-
-    with open(args.config) as f:
-        config = yaml.safe_load(f)
-
-    # Convert to vLLM format using HF to vLLM conversion
-    print(f"Converting {args.model} to vLLM format...")
-    
-    # Create output directory
-    output_dir = f"{args.name}_vllm"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # For vLLM, we typically just copy the model and ensure it's properly formatted
-    # vLLM handles quantization differently, so we'll use the standard HuggingFace conversion
-    
-    # Copy the model to vLLM format directory
-    try:
-        subprocess.run([
-            "cp", "-r", args.model, output_dir
-        ], check=True)
-        print(f"Copied model to {output_dir}")
-    except subprocess.CalledProcessError:
-        print("Failed to copy model directory")
-        return
-
-    # Generate vLLM config file
-    vllm_config = {
-        "model": output_dir,
-        "tokenizer": args.model,  # Use same directory for tokenizer
-        "quantization": args.quantization,
+from config_loader import load_config
+from estimate import HARDWARE, load_model_config
+from serving_params import example_lengths, recommend, weight_bytes
+from staging import STRATEGIES, stage_directory
+
+VLLM_CONFIG_NAME = "vllm_config.yaml"
+REASONING_NAME = "serving_params.md"
+# Values vLLM accepts for --max-lora-rank
+VLLM_LORA_RANKS = (1, 8, 16, 32, 64, 128, 256, 320, 512)
+
+
+def checkpoint_quantization(model_dir) -> str | None:
+    """The quant_method recorded in a model's config.json, or None for full-precision weights."""
+    config_file = Path(model_dir) / "config.json"
+    if not config_file.exists():
+        return None
+    return json.loads(config_file.read_text()).get("quantization_config", {}).get("quant_method")
+
+
+def write_vllm_config(output_dir: Path, vllm_config: dict) -> Path:
+    # vLLM turns every value into "--key str(value)", so an unset option must be left out, not written as null
+    vllm_config = {key: value for key, value in vllm_config.items() if value is not None}
+    # Replace rather than rewrite, so an existing file can never be a link back into the model
+    config_file = output_dir / VLLM_CONFIG_NAME
+    temporary = config_file.with_suffix(".yaml.tmp")
+    with open(temporary, "w") as f:
+        yaml.dump(vllm_config, f)
+    os.replace(temporary, config_file)
+    return config_file
+
+
+def stage(source, target: Path, strategies, **kwargs):
+    counts = stage_directory(source, target, strategies, **kwargs)
+    staged = ", ".join(f"{counts[strategy]} {strategy}" for strategy in strategies if counts[strategy])
+    print(
+        f"Staged {source} into {target}: {staged or 'nothing new'}, {counts['unchanged']} unchanged, "
+        f"{counts['bytes_copied'] / 2**20:.1f} MiB copied"
+    )
+
+
+def adapter_rank(adapter_dir) -> int:
+    """Largest LoRA rank in an adapter, refusing features vLLM cannot serve unmerged."""
+    config = json.loads((Path(adapter_dir) / "adapter_config.json").read_text())
+    if config.get("use_dora") or config.get("modules_to_save"):
+        raise ValueError(f"{adapter_dir} uses DoRA or modules_to_save, which vLLM cannot serve as a LoRA; merge it")
+    if config.get("target_parameters"):
+        raise ValueError(
+            f"{adapter_dir} adapts fused MoE expert weights (target_parameters), which vLLM's LoRA loader "
+            "does not accept; merge it (lora merge) and serve the merged model instead"
+        )
+    return max([config["r"], *(config.get("rank_pattern") or {}).values()])
+
+
+def vllm_lora_rank(rank: int) -> int:
+    """Smallest max_lora_rank vLLM accepts that fits rank."""
+    for supported in VLLM_LORA_RANKS:
+        if supported >= rank:
+            return supported
+    raise ValueError(f"LoRA rank {rank} exceeds vLLM's largest max_lora_rank ({VLLM_LORA_RANKS[-1]})")
+
+
+def multi_lora_config(configs: list[dict], output_dir: Path, strategies) -> dict:
+    """Stage every config's adapter under adapters/<domain> and describe one base model serving them all."""
+    base = configs[0]["model"]["name"]
+    for config in configs[1:]:
+        if config["model"]["name"] != base:
+            raise ValueError(
+                f"{config['domain']} uses model.name={config['model']['name']!r}, but {configs[0]['domain']} "
+                f"uses {base!r}; adapters served together must share one base model"
+            )
+
+    modules, ranks = [], []
+    for config in configs:
+        adapter_dir = Path(config["output"]["adapter_dir"])
+        ranks.append(adapter_rank(adapter_dir))
+        target = output_dir / "adapters" / config["domain"]
+        stage(adapter_dir, target, strategies, recursive=False)
+        # vLLM passes list items through str() and parses each --lora-modules value as JSON
+        modules.append(json.dumps({"name": config["domain"], "path": str(target), "base_model_name": base}))
+
+    return {
+        "model": base,
+        "tokenizer": base,
+        "quantization": checkpoint_quantization(base),
         "dtype": "auto",
-        "max_model_len": 32768,
-        "tensor_parallel_size": 1
+        "enable_lora": True,
+        "lora_modules": modules,
+        "max_lora_rank": vllm_lora_rank(max(ranks)),
+        # Every domain can be in the same batch, and none is ever evicted to CPU
+        "max_loras": len(modules),
+        "max_cpu_loras": len(modules),
     }
-    
-    # Save config for vLLM
-    config_file = f"{output_dir}/vllm_config.yaml"
-    with open(config_file, "w") as f:
-        yaml.dump(vllm_config, f)
-    
-    print(f"vLLM configuration saved to {config_file}")
+
+
+def load_tokenizer(name_or_path):
+    """The model's tokenizer for counting example lengths, or None if it cannot be loaded."""
+    from transformers import AutoTokenizer
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(name_or_path)
+    except (OSError, ValueError):
+        return None
+    # Without tokenizer files, recent transformers builds an empty tokenizer from config.json alone
+    return tokenizer if len(tokenizer) > 1 else None
+
+
+def serving_params(configs: list[dict], model, model_config: dict, weights: int, serving: dict) -> dict:
+    """Recommend vLLM's sizing parameters for model serving the configs' data (see serving_params.py)."""
+    return recommend(
+        model_config,
+        weights,
+        example_lengths(configs, load_tokenizer(model)),
+        hardware=serving["hardware"],
+        gpus=serving["gpus"],
+        gpu_memory_utilization=serving["gpu_memory_utilization"],
+        kv_cache_dtype=serving["kv_cache_dtype"],
+        headroom=serving["context_headroom"],
+        min_context=max(config["training"]["max_seq_length"] for config in configs),
+    )
+
+
+def write_reasoning(output_dir: Path, recommendation: dict) -> Path:
+    reasoning_file = output_dir / REASONING_NAME
+    params = "\n".join(f"{key}: {value}" for key, value in recommendation["params"].items())
+    reasons = "\n".join(f"- {line}" for line in recommendation["reasoning"])
+    temporary = reasoning_file.with_suffix(".md.tmp")
+    temporary.write_text(f"# vLLM serving parameters\n\n```yaml\n{params}\n```\n\n{reasons}\n")
+    os.replace(temporary, reasoning_file)
+    return reasoning_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="Path to merged model (not used with --multi-lora)")
+    parser.add_argument("--name", required=True, help="Output model name for vLLM")
+    parser.add_argument("--config", required=True, nargs="+", help="Domain config (several with --multi-lora)")
+    parser.add_argument(
+        "--multi-lora",
+        action="store_true",
+        help="Serve the base model with every config's adapter, registered under its domain name",
+    )
+    parser.add_argument("--quantization", help="Default: read from the model's config.json (none if unquantized)")
+    parser.add_argument(
+        "--link",
+        default="hardlink",
+        choices=STRATEGIES,
+        help="First staging method to try; later ones (ending with copy) are fallbacks",
+    )
+    parser.add_argument("--hardware", choices=sorted(HARDWARE), help="Serving device (default: serving.hardware)")
+    parser.add_argument("--gpus", type=int, help="Devices available for tensor parallelism (default: serving.gpus)")
+    args = parser.parse_args(argv)
+    if not args.multi_lora and (args.model is None or len(args.config) > 1):
+        parser.error("a merged model needs --model and exactly one --config; use --multi-lora to serve adapters")
+
+    configs = [load_config(path) for path in args.config]
+    output_dir = Path(f"{args.name}_vllm")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    strategies = STRATEGIES[STRATEGIES.index(args.link) :]
+    serving = dict(configs[0]["serving"])
+    serving.update({key: getattr(args, key) for key in ("hardware", "gpus") if getattr(args, key) is not None})
+
+    if args.multi_lora:
+        print(f"Preparing {configs[0]['model']['name']} with {len(configs)} LoRA adapters for vLLM...")
+        vllm_config = multi_lora_config(configs, output_dir, strategies)
+        if args.quantization:
+            vllm_config["quantization"] = args.quantization
+        # The base weights come from the hub, so they are counted from its config; adapters from disk
+        adapters = sum(path.stat().st_size for path in (output_dir / "adapters").glob("*/*.safetensors"))
+        model_config = load_model_config(vllm_config["model"])
+        weights = weight_bytes(model_config, quantization=vllm_config["quantization"]) + adapters
+    else:
+        print(f"Converting {args.model} to vLLM format...")
+        stage(args.model, output_dir, strategies, keep={VLLM_CONFIG_NAME, REASONING_NAME})
+        vllm_config = {
+            "model": str(output_dir),
+            "tokenizer": str(output_dir),
+            "quantization": args.quantization or checkpoint_quantization(args.model),
+            "dtype": "auto",
+        }
+        model_config = load_model_config(output_dir)
+        weights = weight_bytes(model_config, output_dir, vllm_config["quantization"])
+    recommendation = serving_params(configs, vllm_config["model"], model_config, weights, serving)
+    vllm_config.update(recommendation["params"])
+    if serving["kv_cache_dtype"] != "auto":
+        vllm_config["kv_cache_dtype"] = serving["kv_cache_dtype"]
+    config_file = write_vllm_config(output_dir, vllm_config)
+    reasoning_file = write_reasoning(output_dir, recommendation)
+
+    print(f"vLLM configuration saved to {config_file} (reasoning in {reasoning_file})")
+    print("\n".join(recommendation["reasoning"]))
     print(f"Model ready for vLLM inference in {output_dir}")
     print("\nTo run with vLLM:")
-    print(f"vLLM serve {output_dir} --host 0.0.0.0 --port 8000")
+    if args.multi_lora:
+        print(f"vllm serve --config {config_file} --host 0.0.0.0 --port 8000")
+        print(f"python scripts/smoke_client.py --config {' '.join(args.config)}")
+    else:
+        print(f"vLLM serve {output_dir} --host 0.0.0.0 --port 8000")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
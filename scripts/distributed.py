@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Multi-process (DDP/FSDP) training support.
+Launched through accelerate (or torchrun), every process trains on its own shard
+of each batch; only rank 0 prints, writes telemetry and saves the adapter.
+Usage: accelerate launch --config_file config/accelerate.yaml scripts/train.py --config config/avorion.yaml
+"""
+
+import os
+from contextlib import contextmanager
+
+DISTRIBUTED_MODES = ("ddp", "fsdp")
+
+
+def world_size() -> int:
+    return int(os.environ.get("WORLD_SIZE", 1))
+
+
+def rank() -> int:
+    return int(os.environ.get("RANK", 0))
+
+
+def local_rank() -> int:
+    return int(os.environ.get("LOCAL_RANK", 0))
+
+
+def is_distributed() -> bool:
+    """True when launched as one of several processes."""
+    return world_size() > 1
+
+
+def is_main_process() -> bool:
+    return rank() == 0
+
+
+def log(*args, **kwargs):
+    """print() on rank 0 only, so N processes do not repeat every line."""
+    if is_main_process():
+        print(*args, **kwargs)
+
+
+def distributed_mode(config: dict):
+    """The configured multi-process mode, or None for a single-process run."""
+    if not is_distributed():
+        return None
+    mode = config.get("distributed", {}).get("mode", "ddp")
+    if mode not in DISTRIBUTED_MODES:
+        raise ValueError(f"distributed.mode must be one of {DISTRIBUTED_MODES}, got {mode!r}")
+    return mode
+
+
+def model_placement(config: dict) -> dict:
+    """from_pretrained() placement arguments for the current launch mode."""
+    mode = distributed_mode(config)
+    if mode is None:
+        return {"device_map": "auto"}
+    if mode == "ddp":
+        # Each rank holds a full replica on its own GPU
+        return {"device_map": {"": local_rank()}}
+    # FSDP loads on CPU and shards the weights across ranks when the trainer wraps the model
+    return {}
+
+
+def fsdp_loading_env(config: dict) -> dict:
+    """Environment that makes from_pretrained() load real weights on rank 0 only (FSDP mode).
+
+    Transformers reads these variables while loading, before TrainingArguments exists, so
+    fsdp_config's cpu_ram_efficient_loading alone comes too late to save any memory.
+    """
+    if distributed_mode(config) != "fsdp":
+        return {}
+    return {"ACCELERATE_USE_FSDP": "true", "FSDP_CPU_RAM_EFFICIENT_LOADING": "true"}
+
+
+def prepare_model_loading(config: dict):
+    """Set up the process group and loading environment before from_pretrained()."""
+    env = fsdp_loading_env(config)
+    if not env:
+        return
+    os.environ.update(env)
+    from accelerate import PartialState
+
+    # Rank-0-only loading needs torch.distributed up; the other ranks load on the meta device
+    PartialState()
+
+
+def distributed_arguments(config: dict) -> dict:
+    """TrainingArguments for the current launch mode (empty for a single process)."""
+    mode = distributed_mode(config)
+    if mode is None:
+        return {}
+
+    settings = config.get("distributed", {})
+    arguments = {"ddp_backend": settings.get("backend")}
+    if mode == "ddp":
+        # Frozen base weights never receive gradients; skip DDP's per-step graph search
+        arguments["ddp_find_unused_parameters"] = False
+    else:
+        arguments["fsdp"] = f"{settings.get('fsdp_sharding', 'full_shard')} auto_wrap"
+        arguments["fsdp_config"] = {
+            # Frozen base and trainable LoRA weights share each wrapped unit
+            "use_orig_params": True,
+            # Rank 0 loaded the weights (see fsdp_loading_env); broadcast them when wrapping
+            "cpu_ram_efficient_loading": True,
+            "sync_module_states": True,
+        }
+    return arguments
+
+
+@contextmanager
+def main_process_first():
+    """Let rank 0 build shared caches (tokenized eval set, ...) before the others read them."""
+    if not is_distributed():
+        yield
+        return
+    from accelerate import PartialState
+
+    with PartialState().main_process_first():
+        yield
+
+
+def min_across_ranks(value: int) -> int:
+    """The smallest value any rank passed in, so every process settles on the same choice."""
+    if not is_distributed():
+        return value
+    import torch
+    import torch.distributed as dist
+    from accelerate import PartialState
+
+    tensor = torch.tensor(value, device=PartialState().device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.MIN)
+    return int(tensor.item())
+
+
+def save_adapter(trainer, tokenizer, output_dir: str):
+    """Save the trained adapter from rank 0, gathering FSDP shards first."""
+    trainer.save_model(output_dir)
+    if tokenizer is not None and trainer.is_world_process_zero():
+        tokenizer.save_pretrained(output_dir)
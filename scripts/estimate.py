@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Pre-flight memory and step-time estimates for training configs.
+Reads only the model's config.json, so a config that will not fit can be
+caught before spending minutes loading and quantizing the base model.
+"""
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+GIB = 2**30
+
+# Bytes per parameter for NF4 weights: 4-bit values, plus the double-quantized
+# absmax (8 bits per 64-value block, and an fp32 scale per 256 blocks).
+NF4_BYTES_PER_PARAM = 0.5 + (8 / 64 + 32 / (64 * 256)) / 8
+
+# Optimizer state bytes per trainable parameter
+OPTIMIZER_STATE_BYTES = {
+    "paged_adamw_8bit": 2,
+    "adamw_8bit": 2,
+    "adamw_torch": 8,
+    "adamw_torch_fused": 8,
+}
+
+# Usable memory (GiB) and dense bf16 TFLOPs of common training devices
+HARDWARE = {
+    "h100": (80, 989),
+    "a100": (80, 312),
+    "l40s": (48, 362),
+    "rtx4090": (24, 165),
+    "gb10": (128, 125),  # DGX Spark; bf16 dense derived from 1 PFLOP sparse FP4
+}
+
+# Fixed allowance for the CUDA context, allocator fragmentation and workspaces
+FRAMEWORK_OVERHEAD_BYTES = 1.5 * GIB
+
+# Fraction of peak FLOPs a QLoRA step typically achieves (dequantization and
+# small adapter matmuls keep it well below dense pretraining)
+DEFAULT_MFU = 0.25
+
+
+def load_model_config(name_or_path: str) -> dict:
+    """Load a model's config.json from a local directory or the Hugging Face Hub."""
+    local = Path(name_or_path) / "config.json"
+    if local.exists():
+        return json.loads(local.read_text())
+
+    from huggingface_hub import hf_hub_download
+
+    return json.loads(Path(hf_hub_download(name_or_path, "config.json")).read_text())
+
+
+@dataclass
+class LinearGroup:
+    """Linear layers sharing a name and shape, e.g. every expert's gate_proj."""
+
+    name: str
+    in_features: int
+    out_features: int
+    count: int  # instances in the whole model
+    active: int  # instances each token passes through
+
+    @property
+    def params(self) -> int:
+        return self.in_features * self.out_features * self.count
+
+
+@dataclass
+class ModelShape:
+    """The dimensions of a decoder-only (optionally MoE) transformer."""
+
+    hidden_size: int
+    num_layers: int
+    num_heads: int
+    num_kv_heads: int
+    head_dim: int
+    intermediate_size: int
+    vocab_size: int
+    max_position_embeddings: int
+    num_experts: int = 0
+    experts_per_token: int = 0
+    moe_intermediate_size: int = 0
+    shared_expert_intermediate_size: int = 0
+    num_moe_layers: int = 0
+    tie_word_embeddings: bool = False
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ModelShape":
+        """Build a shape from a Hugging Face config.json dict."""
+        config = config.get("text_config", config)
+        num_layers = config["num_hidden_layers"]
+        num_heads = config["num_attention_heads"]
+        num_experts = config.get("num_experts") or config.get("num_local_experts") or 0
+
+        num_moe_layers = 0
+        if num_experts:
+            sparse_step = config.get("decoder_sparse_step", 1) or 1
+            dense_layers = set(config.get("mlp_only_layers") or [])
+            num_moe_layers = sum(
+                1
+                for layer in range(num_layers)
+                if layer not in dense_layers and (layer + 1) % sparse_step == 0
+            )
+
+        return cls(
+            hidden_size=config["hidden_size"],
+            num_layers=num_layers,
+            num_heads=num_heads,
+            num_kv_heads=config.get("num_key_value_heads") or num_heads,
+            head_dim=config.get("head_dim") or config["hidden_size"] // num_heads,
+            intermediate_size=config.get("intermediate_size", 0),
+            vocab_size=config["vocab_size"],
+            max_position_embeddings=config.get("max_position_embeddings", 0),
+            num_experts=num_experts,
+            experts_per_token=config.get("num_experts_per_tok", 0),
+            moe_intermediate_size=config.get("moe_intermediate_size", 0),
+            shared_expert_intermediate_size=config.get("shared_expert_intermediate_size", 0),
+            num_moe_layers=num_moe_layers,
+            tie_word_embeddings=config.get("tie_word_embeddings", False),
+        )
+
+    def linear_groups(self) -> list[LinearGroup]:
+        """List every group of linear layers in the decoder stack."""
+        hidden, layers = self.hidden_size, self.num_layers
+        q_out = self.num_heads * self.head_dim
+        kv_out = self.num_kv_heads * self.head_dim
+        groups = [
+            LinearGroup("q_proj", hidden, q_out, layers, layers),
+            LinearGroup("k_proj", hidden, kv_out, layers, layers),
+            LinearGroup("v_proj", hidden, kv_out, layers, layers),
+            LinearGroup("o_proj", q_out, hidden, layers, layers),
+        ]
+
+        dense_layers = layers - self.num_moe_layers
+        if dense_layers:
+            groups += _mlp_groups("", hidden, self.intermediate_size, dense_layers, dense_layers)
+
+        if self.num_moe_layers:
+            moe = self.num_moe_layers
+            groups += _mlp_groups(
+                "experts.",
+                hidden,
+                self.moe_intermediate_size,
+                moe * self.num_experts,
+                moe * self.experts_per_token,
+            )
+            if self.shared_expert_intermediate_size:
+                groups += _mlp_groups(
+                    "shared_expert.", hidden, self.shared_expert_intermediate_size, moe, moe
+                )
+            groups.append(LinearGroup("router", hidden, self.num_experts, moe, moe))
+        return groups
+
+    @property
+    def embedding_params(self) -> int:
+        """Input embedding plus (untied) output head parameters."""
+        heads = 1 if self.tie_word_embeddings else 2
+        return self.vocab_size * self.hidden_size * heads
+
+
+def _mlp_groups(prefix: str, hidden: int, inter: int, count: int, active: int) -> list:
+    return [
+        LinearGroup(f"{prefix}gate_proj", hidden, inter, count, active),
+        LinearGroup(f"{prefix}up_proj", hidden, inter, count, active),
+        LinearGroup(f"{prefix}down_proj", inter, hidden, count, active),
+    ]
+
+
+def _is_target(group: LinearGroup, target_modules: list[str]) -> bool:
+    # PEFT matches target_modules against the last component of the module name
+    return group.name.split(".")[-1] in target_modules
+
+
+def _activation_bytes_per_token_layer(shape: ModelShape, lora_inputs: int) -> float:
+    """Estimate activation bytes a bf16 decoder layer keeps for backward, per token."""
+    hidden = shape.hidden_size
+    q = shape.num_heads * shape.head_dim
+    kv = shape.num_kv_heads * shape.head_dim
+    # norm input, q/k/v input, q, k, v, attention output, o_proj output and residuals
+    attention = 4 * hidden + q + 2 * kv + q
+    if shape.num_moe_layers:
+        experts = shape.experts_per_token
+        # each routed expert keeps its input, gate/up outputs and the activation
+        mlp = hidden + experts * (hidden + 3 * shape.moe_intermediate_size)
+        mlp += 2 * shape.num_experts  # fp32 router logits
+        if shape.shared_expert_intermediate_size:
+            mlp += hidden + 3 * shape.shared_expert_intermediate_size
+    else:
+        mlp = hidden + 3 * shape.intermediate_size
+    # LoRA dropout keeps a copy of each adapted module's input
+    return 2 * (attention + mlp + lora_inputs)
+
+
+def estimate_training(config: dict, model_config: dict, hardware: str = "h100") -> dict:
+    """Estimate peak training memory (bytes) and step time for a merged config."""
+    shape = ModelShape.from_config(model_config)
+    training = config["training"]
+    lora = config["lora"]
+    quantized = config["model"].get("load_in_4bit", False)
+    # Configs without the key get what prepare_model_for_kbit_training used to enable
+    checkpointing = training.get("gradient_checkpointing", quantized)
+    if checkpointing in (False, None, "off"):
+        checkpointed_layers = 0
+    elif checkpointing == "selective":
+        every = training.get("checkpoint_every", 2)
+        checkpointed_layers = -(-shape.num_layers // every)
+    else:
+        checkpointed_layers = shape.num_layers
+    attn_implementation = training.get("attn_implementation", "sdpa")
+    optimizer = training.get("optim", "paged_adamw_8bit")
+
+    batch = training["batch_size"]
+    seq = training["max_seq_length"]
+    tokens = batch * seq
+
+    groups = shape.linear_groups()
+    linear_params = sum(g.params for g in groups if g.name != "router")
+    other_params = shape.embedding_params + sum(g.params for g in groups if g.name == "router")
+    targets = [g for g in groups if _is_target(g, lora["target_modules"])]
+    lora_params = sum(lora["r"] * (g.in_features + g.out_features) * g.count for g in targets)
+    lora_inputs = sum(g.in_features * g.active for g in targets) / shape.num_layers
+
+    if quantized:
+        # non-quantized parameters (embeddings, head, router) are upcast to fp32
+        weight_bytes = linear_params * NF4_BYTES_PER_PARAM + other_params * 4
+    else:
+        weight_bytes = (linear_params + other_params) * 2
+
+    per_layer = _activation_bytes_per_token_layer(shape, lora_inputs)
+    attention_scores = 0
+    if attn_implementation == "eager":
+        # bf16 scores plus fp32 softmax, per layer
+        attention_scores = batch * shape.num_heads * seq * seq * 6
+    # Checkpointed layers keep only their bf16 input; one is recomputed at a time
+    stored_layers = shape.num_layers - checkpointed_layers
+    activations = tokens * checkpointed_layers * 2 * shape.hidden_size
+    activations += (tokens * per_layer + attention_scores) * (
+        stored_layers + bool(checkpointed_layers)
+    )
+    # bf16 logits, their fp32 upcast for the loss, and the fp32 gradient; the
+    # chunked loss only ever holds one chunk of them
+    logit_tokens = min(tokens, training.get("loss_chunk_size") or tokens)
+    logits = logit_tokens * shape.vocab_size * (2 + 4 + 4)
+
+    memory = {
+        "weights": weight_bytes,
+        "adapter": lora_params * 4,
+        "gradients": lora_params * 4,
+        "optimizer": lora_params * OPTIMIZER_STATE_BYTES.get(optimizer, 8),
+        "activations": activations,
+        "logits": logits,
+        "overhead": FRAMEWORK_OVERHEAD_BYTES,
+    }
+
+    # Frozen weights need no weight gradients, so backward costs ~2x forward;
+    # checkpointing adds a second forward of the checkpointed layers. Causal attention scores cost
+    # ~2 * seq * heads * head_dim per token and layer.
+    active_params = sum(g.in_features * g.out_features * g.active for g in groups)
+    active_params += shape.vocab_size * shape.hidden_size
+    attention_flops = 2 * seq * shape.num_heads * shape.head_dim * shape.num_layers
+    forward_flops = 2 * active_params + attention_flops
+    flops_per_token = forward_flops * (3 + checkpointed_layers / shape.num_layers)
+    memory_gib, peak_tflops = HARDWARE[hardware]
+    step_tokens = tokens * training["gradient_accumulation"]
+    step_time = step_tokens * flops_per_token / (peak_tflops * 1e12 * DEFAULT_MFU)
+
+    return {
+        "hardware": hardware,
+        "device_memory": memory_gib * GIB,
+        "memory": memory,
+        "total_memory": sum(memory.values()),
+        "total_params": linear_params + other_params,
+        "active_params": active_params,
+        "lora_params": lora_params,
+        "gradient_checkpointing": checkpointing,
+        "step_tokens": step_tokens,
+        "step_time": step_time,
+        "tokens_per_s": step_tokens / step_time,
+    }
+
+
+def format_estimate(estimate: dict) -> str:
+    """Render an estimate as a human-readable report."""
+    checkpointing = estimate["gradient_checkpointing"]
+    if isinstance(checkpointing, bool) or checkpointing is None:
+        checkpointing = "on" if checkpointing else "off"
+    lines = [
+        f"Parameters: {estimate['total_params'] / 1e9:.2f}B total, "
+        f"{estimate['active_params'] / 1e9:.2f}B active per token, "
+        f"{estimate['lora_params'] / 1e6:.1f}M LoRA",
+        f"Gradient checkpointing: {checkpointing}",
+        "",
+        "Memory estimate:",
+    ]
+    for name, value in estimate["memory"].items():
+        lines.append(f"  {name:<12} {value / GIB:8.2f} GiB")
+    total = estimate["total_memory"]
+    available = estimate["device_memory"]
+    lines.append(f"  {'total':<12} {total / GIB:8.2f} GiB")
+    verdict = "fits" if total <= available else "does NOT fit"
+    lines.append(f"  {estimate['hardware']}: {available / GIB:.0f} GiB available, {verdict}")
+    lines += [
+        "",
+        f"Step time: ~{estimate['step_time']:.1f}s for {estimate['step_tokens']} tokens "
+        f"(~{estimate['tokens_per_s']:.0f} tokens/s, full-length sequences)",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Periodic evaluation and early stopping for LoRA training.
+The eval set is formatted and tokenized once, cached next to the eval file,
+and evaluated by the Trainer in batched no-grad passes.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from datasets import load_dataset
+from transformers import EarlyStoppingCallback
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from preprocess import resolve_num_proc, tokenize_dataset, tokenized_cache_path
+
+
+def eval_cache_path(config: dict, tokenizer_name: str) -> Path:
+    """Return the cache file for the tokenized eval set."""
+    return tokenized_cache_path(config["data"]["eval_file"], config, tokenizer_name, "eval")
+
+
+def build_eval_dataset(config: dict, tokenizer):
+    """Load, format and tokenize the eval set, or return None if there is none."""
+    eval_file = config["data"].get("eval_file")
+    if not eval_file or not Path(eval_file).exists():
+        print(f"No eval file at {eval_file}, skipping evaluation")
+        return None
+
+    cache_file = eval_cache_path(config, tokenizer.name_or_path)
+    dataset = load_dataset("json", data_files=eval_file, split="train")
+    dataset = tokenize_dataset(dataset, tokenizer, config, cache_file, resolve_num_proc(config))
+    print(f"Evaluating on {len(dataset)} examples (cached at {cache_file})")
+    return dataset
+
+
+def evaluation_arguments(config: dict, enabled: bool) -> dict:
+    """Build the TrainingArguments kwargs for periodic evaluation."""
+    if not enabled:
+        return {"eval_strategy": "no"}
+
+    eval_config = config.get("evaluation", {})
+    save_steps = config["output"]["save_steps"]
+    eval_steps = eval_config.get("eval_steps", save_steps)
+    if save_steps % eval_steps:
+        raise ValueError(
+            f"output.save_steps ({save_steps}) must be a multiple of "
+            f"evaluation.eval_steps ({eval_steps}) to keep the best checkpoint"
+        )
+
+    return {
+        "eval_strategy": "steps",
+        "eval_steps": eval_steps,
+        "per_device_eval_batch_size": eval_config.get(
+            "batch_size", config["training"]["batch_size"]
+        ),
+        "prediction_loss_only": True,
+        "load_best_model_at_end": True,
+        "metric_for_best_model": "eval_loss",
+        "greater_is_better": False,
+        # Resuming keeps early stopping's patience counter, stored in trainer_state.json
+        "restore_callback_states_from_checkpoint": True,
+    }
+
+
+def early_stopping_callbacks(config: dict, enabled: bool) -> list:
+    """Return the early stopping callback, if evaluation runs and patience is set."""
+    patience = config.get("evaluation", {}).get("early_stopping_patience")
+    if not enabled or not patience:
+        return []
+    threshold = config["evaluation"].get("early_stopping_threshold", 0.0)
+    return [
+        EarlyStoppingCallback(
+            early_stopping_patience=patience,
+            early_stopping_threshold=threshold,
+        )
+    ]
@@ -12,9 +12,6 @@ import time
 import argparse
 from pathlib import Path
 
-# Import Anthropic client
-import anthropic
-
 # Add scripts directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,8 +21,19 @@ from prompts import get_prompt_template
 # Import JSON parsing utility
 from json_utils import safe_json_parse
 
-# Initialize Anthropic client
-client = anthropic.Anthropic()
+# Anthropic client, created on first use so importing this module stays fast
+_client = None
+
+
+def get_client():
+    """Return the shared Anthropic client, creating it on first use."""
+    global _client
+    if _client is None:
+        import anthropic
+
+        _client = anthropic.Anthropic()
+    return _client
+
 
 # Model configuration - Use only Sonnet 4.5 as requested
 MODEL_NAME = "claude-3-5-sonnet-20241022"  # Latest Sonnet model as of 2026
@@ -155,10 +163,10 @@ def submit_batch(jsonl_path: Path) -> str:
     try:
         # Upload the file first
         with open(jsonl_path, "rb") as f:
-            file_response = client.files.create(file=f, purpose="batch")
+            file_response = get_client().files.create(file=f, purpose="batch")
 
         # Create batch job
-        batch = client.batches.create(
+        batch = get_client().batches.create(
             input_file_id=file_response.id,
             endpoint="/v1/messages",
             completion_window="24h"
@@ -178,7 +186,7 @@ def wait_for_batch(batch_id: str, poll_interval: int = 300) -> object:
 
     while True:
         try:
-            batch = client.batches.retrieve(batch_id)
+            batch = get_client().batches.retrieve(batch_id)
             status = batch.processing_status
 
             print(f"[{time.strftime('%H:%M:%S')}] Batch {batch_id}: {status}")
@@ -211,7 +219,7 @@ def download_batch_results(batch: object, domain: str, output_path: Path) -> int
             raise RuntimeError("Batch does not have an output file ID")
 
         # Download the results file
-        results_file = client.files.content(batch.output_file_id)
+        results_file = get_client().files.content(batch.output_file_id)
         results_text = results_file.text
 
         # Process each line in the results
@@ -294,7 +302,7 @@ def process_sample_live(sample: dict, domain: str, output_dir: Path, idx: int) -
 
     try:
         # Call Claude API directly for this single sample
-        response = client.messages.create(
+        response = get_client().messages.create(
             model=MODEL_NAME,
             max_tokens=MAX_TOKENS,
             messages=[{"role": "user", "content": prompt}],
@@ -443,7 +451,7 @@ def validate_dataset(dataset_path: Path, domain: str) -> bool:
         return False
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--domain", required=True, choices=["avorion", "gdscript"])
     parser.add_argument(
@@ -461,9 +469,9 @@ def main():
         "--limit",
         type=int,
         default=3,
-        help="Limit number of samples to process (for testing). Default is 3 to reduce costs.",
+        help="Limit number of samples to process (for testing); 0 processes all. Default is 3 to reduce costs.",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     domain = args.domain
     extension = ".lua" if domain == "avorion" else ".gd"
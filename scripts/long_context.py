@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Long-context memory settings: gradient checkpointing and attention implementation.
+training.gradient_checkpointing picks how activations are recomputed in backward:
+  off            keep every activation (fastest, most memory)
+  reentrant      torch's original checkpointing; single process only
+  non_reentrant  saved-tensor-hook checkpointing; works with DDP/FSDP
+  selective      non_reentrant on every Nth decoder layer (training.checkpoint_every)
+"""
+
+import functools
+import importlib.util
+import os
+import sys
+
+import torch
+from torch.utils.checkpoint import checkpoint
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from distributed import distributed_mode
+
+CHECKPOINTING_MODES = ("off", "reentrant", "non_reentrant", "selective")
+ATTN_ALIASES = {"flash": "flash_attention_2", "flash2": "flash_attention_2"}
+
+
+def checkpointing_mode(config: dict) -> str:
+    """Normalize training.gradient_checkpointing (booleans are accepted too)."""
+    mode = config["training"].get("gradient_checkpointing", "non_reentrant")
+    if mode is True:
+        mode = "non_reentrant"
+    elif mode in (False, None):
+        mode = "off"
+    if mode not in CHECKPOINTING_MODES:
+        raise ValueError(
+            f"training.gradient_checkpointing must be one of {CHECKPOINTING_MODES}, got {mode!r}"
+        )
+    return mode
+
+
+def resolve_attn_implementation(name: str) -> str:
+    """Map a configured attention implementation to one transformers can load."""
+    name = ATTN_ALIASES.get(name, name)
+    if name == "flash_attention_2" and importlib.util.find_spec("flash_attn") is None:
+        print("flash-attn is not installed; falling back to sdpa attention")
+        return "sdpa"
+    return name
+
+
+def find_decoder_layers(model) -> torch.nn.ModuleList:
+    """Return the model's stack of decoder layers."""
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.ModuleList) and name.endswith("layers") and len(module):
+            return module
+    raise ValueError(f"No decoder layer stack found in {type(model).__name__}")
+
+
+def checkpointed(forward):
+    """Wrap a layer's forward so training recomputes it in backward instead of storing it."""
+
+    @functools.wraps(forward)
+    def wrapper(*args, **kwargs):
+        if torch.is_grad_enabled():
+            return checkpoint(forward, *args, use_reentrant=False, **kwargs)
+        return forward(*args, **kwargs)
+
+    return wrapper
+
+
+def apply_gradient_checkpointing(model, config: dict) -> str:
+    """Configure activation checkpointing on a loaded model and return the mode used."""
+    mode = checkpointing_mode(config)
+    if mode == "reentrant" and distributed_mode(config):
+        raise ValueError(
+            "reentrant gradient checkpointing re-runs hooks that DDP/FSDP must only see "
+            "once; use non_reentrant or selective"
+        )
+
+    if mode == "off":
+        model.gradient_checkpointing_disable()
+        return mode
+
+    # Cached keys/values are useless when training and defeat recomputation
+    model.config.use_cache = False
+    if mode == "selective":
+        every = config["training"].get("checkpoint_every", 2)
+        for index, layer in enumerate(find_decoder_layers(model)):
+            if index % every == 0:
+                layer.forward = checkpointed(layer.forward)
+        return mode
+
+    model.gradient_checkpointing_enable(
+        gradient_checkpointing_kwargs={"use_reentrant": mode == "reentrant"}
+    )
+    if mode == "reentrant":
+        # Reentrant checkpoints only backpropagate if their inputs require grad
+        model.enable_input_require_grads()
+    return mode
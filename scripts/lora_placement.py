@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+MoE-aware LoRA placement.
+lora.target_modules names projections (q_proj, gate_proj, ...); on a mixture-of-
+experts model the MLP names match every routed expert. lora.placement narrows
+the modules that actually get an adapter. Each policy includes the one above it:
+  attention      attention projections only
+  shared_expert  + shared experts and dense (non-MoE) MLPs, which see every token
+  top_k_experts  + the lora.top_k_experts most-routed experts per layer, from a
+                 routing histogram over the training set
+  all            every matching module (including all routed experts)
+Models that stack their experts into 3D weights (transformers 5: experts.gate_up_proj
+and experts.down_proj) are adapted through PEFT's target_parameters, one rank-r pair
+per expert. PEFT cannot adapt part of such a stack, so top_k_experts adapts the
+whole stack of each layer and holds the unchosen experts' slices at zero.
+"""
+
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+
+import torch
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from estimate import OPTIMIZER_STATE_BYTES
+
+PLACEMENT_POLICIES = ("attention", "shared_expert", "top_k_experts", "all")
+
+LAYER_PATTERN = re.compile(r"\.layers\.(\d+)\.")
+EXPERT_PATTERN = re.compile(r"\.experts\.(\d+)\.")
+SHARED_PATTERN = re.compile(r"\.shared_experts?\.")
+# Fused expert parameters and the per-expert projections they stack
+FUSED_PROJECTIONS = {"gate_up_proj": ("gate_proj", "up_proj"), "down_proj": ("down_proj",)}
+
+
+@dataclass
+class TargetModule:
+    """A linear layer matched by lora.target_modules."""
+
+    name: str
+    kind: str  # attention, shared_expert, dense_mlp or routed_expert
+    layer: int
+    expert: int  # routed experts only
+    in_features: int
+    out_features: int
+    fused: bool = False  # one expert's slice of a stacked 3D parameter (name is the parameter)
+
+
+@dataclass
+class Placement:
+    """LoRA targets of a placement policy, as get_peft_model needs them."""
+
+    target_modules: list[str]
+    target_parameters: list[str] = field(default_factory=list)
+    # Fused parameter -> experts whose slice trains (see restrict_fused_experts)
+    experts: dict[str, set[int]] = field(default_factory=dict)
+    fused_experts: bool = False  # PEFT adapts stacked expert weights, which rules out lora_dropout
+
+
+def classify(name: str) -> str:
+    if SHARED_PATTERN.search(name):
+        return "shared_expert"
+    if EXPERT_PATTERN.search(name):
+        return "routed_expert"
+    if "attn" in name.split(".")[-2]:
+        return "attention"
+    return "dense_mlp"
+
+
+def fused_parameters(module) -> list[tuple[str, torch.nn.Parameter]]:
+    """The stacked 3D weights (gate_up_proj, down_proj) of a fused experts module."""
+    if isinstance(module, torch.nn.ModuleList):
+        return []
+    return [
+        (name, parameter)
+        for name, parameter in module.named_parameters(recurse=False)
+        if parameter.dim() == 3 and name in FUSED_PROJECTIONS
+    ]
+
+
+def find_target_modules(model, target_modules: list[str]) -> list[TargetModule]:
+    """List the linear layers (and fused expert slices) that lora.target_modules would adapt."""
+    targets = []
+    for name, module in model.named_modules():
+        layer = LAYER_PATTERN.search(name + ".")
+        if name.split(".")[-1] == "experts":
+            for parameter_name, parameter in fused_parameters(module):
+                if not any(
+                    target in target_modules for target in FUSED_PROJECTIONS[parameter_name]
+                ):
+                    continue
+                experts, out_features, in_features = parameter.shape
+                if getattr(module, "is_transposed", False):
+                    in_features, out_features = out_features, in_features
+                targets += [
+                    TargetModule(
+                        name=f"{name}.{parameter_name}",
+                        kind="routed_expert",
+                        layer=int(layer.group(1)) if layer else -1,
+                        expert=expert,
+                        in_features=in_features,
+                        out_features=out_features,
+                        fused=True,
+                    )
+                    for expert in range(experts)
+                ]
+        if not isinstance(module, torch.nn.Linear) or name.split(".")[-1] not in target_modules:
+            continue
+        expert = EXPERT_PATTERN.search(name)
+        targets.append(
+            TargetModule(
+                name=name,
+                kind=classify(name),
+                layer=int(layer.group(1)) if layer else -1,
+                expert=int(expert.group(1)) if expert else -1,
+                in_features=module.in_features,
+                out_features=module.out_features,
+            )
+        )
+    return targets
+
+
+def moe_blocks(model) -> dict[int, torch.nn.Module]:
+    """Map layer index to sparse MoE block (a module with both experts and a router gate)."""
+    blocks = {}
+    for name, module in model.named_modules():
+        if hasattr(module, "experts") and hasattr(module, "gate"):
+            layer = LAYER_PATTERN.search(name + ".")
+            blocks[int(layer.group(1)) if layer else len(blocks)] = module
+    return blocks
+
+
+def num_routed_experts(model) -> tuple[int, int]:
+    """Return (experts per layer, experts chosen per token)."""
+    config = model.config
+    experts = getattr(config, "num_experts", None) or getattr(config, "n_routed_experts", 0)
+    return experts, getattr(config, "num_experts_per_tok", 0)
+
+
+@torch.no_grad()
+def routing_histogram(model, examples: list[dict]) -> dict[int, torch.Tensor]:
+    """Count how often each expert is chosen per MoE layer over tokenized examples."""
+    experts, top_k = num_routed_experts(model)
+    counts = {layer: torch.zeros(experts, dtype=torch.long) for layer in moe_blocks(model)}
+
+    def make_hook(layer):
+        def hook(module, inputs, output):
+            if isinstance(output, tuple):
+                selected = output[-1]  # routers that return (logits, weights, indices)
+            else:
+                selected = output.topk(top_k, dim=-1).indices  # routers that return logits
+            counts[layer] += torch.bincount(selected.flatten().cpu(), minlength=experts)
+
+        return hook
+
+    handles = [
+        block.gate.register_forward_hook(make_hook(layer))
+        for layer, block in moe_blocks(model).items()
+    ]
+    was_training = model.training
+    model.eval()
+    device = next(model.parameters()).device
+    try:
+        # One example at a time so padding never reaches the router
+        for example in examples:
+            model(input_ids=torch.tensor([example["input_ids"]], device=device))
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.train(was_training)
+    return counts
+
+
+def top_experts(histogram: dict[int, torch.Tensor], count: int) -> dict[int, set[int]]:
+    """The `count` most-routed experts of each layer."""
+    return {
+        layer: set(counts.topk(min(count, len(counts))).indices.tolist())
+        for layer, counts in histogram.items()
+    }
+
+
+def select_targets(
+    targets: list[TargetModule], policy: str, chosen_experts=None
+) -> list[TargetModule]:
+    """Apply a placement policy to the matched modules."""
+    if policy not in PLACEMENT_POLICIES:
+        raise ValueError(f"lora.placement must be one of {PLACEMENT_POLICIES}, got {policy!r}")
+    if policy == "all":
+        return list(targets)
+
+    allowed = {"attention"}
+    if policy in ("shared_expert", "top_k_experts"):
+        allowed |= {"shared_expert", "dense_mlp"}
+    selected = [t for t in targets if t.kind in allowed]
+    if policy == "top_k_experts":
+        chosen_experts = chosen_experts or {}
+        selected += [
+            t
+            for t in targets
+            if t.kind == "routed_expert" and t.expert in chosen_experts.get(t.layer, ())
+        ]
+    return selected
+
+
+def expert_token_share(target: TargetModule, histogram, experts: int, top_k: int) -> float:
+    """Fraction of tokens that pass through a module."""
+    if target.kind != "routed_expert":
+        return 1.0
+    if histogram is None or target.layer not in histogram:
+        return top_k / experts if experts else 1.0
+    counts = histogram[target.layer]
+    tokens = counts.sum().item() / max(top_k, 1)
+    return counts[target.expert].item() / tokens if tokens else 0.0
+
+
+def placement_report(model, config: dict, histogram=None) -> list[dict]:
+    """Trainable parameters, training memory and per-token LoRA compute of every policy."""
+    rank = config["lora"]["r"]
+    optimizer_bytes = OPTIMIZER_STATE_BYTES.get(
+        config["training"].get("optim", "paged_adamw_8bit"), 8
+    )
+    experts, top_k = num_routed_experts(model)
+    count = config["lora"].get("top_k_experts", top_k)
+    chosen = (
+        top_experts(histogram, count)
+        if histogram
+        else {layer: set(range(count)) for layer in moe_blocks(model)}
+    )
+    targets = find_target_modules(model, config["lora"]["target_modules"])
+
+    rows = []
+    for policy in PLACEMENT_POLICIES:
+        selected = select_targets(targets, policy, chosen)
+        params = sum(rank * (t.in_features + t.out_features) for t in selected)
+        # A fused stack is adapted whole, so its unchosen experts still take memory
+        stacks = {t.name for t in selected if t.fused}
+        allocated = params + sum(
+            rank * (t.in_features + t.out_features)
+            for t in targets
+            if t.name in stacks and t not in selected
+        )
+        active = sum(
+            rank
+            * (t.in_features + t.out_features)
+            * expert_token_share(t, histogram, experts, top_k)
+            for t in selected
+        )
+        rows.append(
+            {
+                "policy": policy,
+                "modules": len(selected),
+                "lora_params": params,
+                # fp32 adapter weights and gradients plus optimizer state
+                "memory_bytes": allocated * (4 + 4 + optimizer_bytes),
+                "active_params_per_token": active,
+            }
+        )
+    full = rows[-1]
+    for row in rows:
+        row["params_vs_all"] = (
+            row["lora_params"] / full["lora_params"] if full["lora_params"] else 1.0
+        )
+        row["compute_vs_all"] = (
+            row["active_params_per_token"] / full["active_params_per_token"]
+            if full["active_params_per_token"]
+            else 1.0
+        )
+    return rows
+
+
+def format_placement_report(rows: list[dict], selected: str) -> str:
+    lines = [
+        f"{'placement':<15} {'modules':>8} {'LoRA params':>12} {'memory':>10} {'params':>7} {'compute':>8}"
+    ]
+    for row in rows:
+        marker = " <-" if row["policy"] == selected else ""
+        lines.append(
+            f"{row['policy']:<15} {row['modules']:>8} {row['lora_params'] / 1e6:>11.1f}M "
+            f"{row['memory_bytes'] / 2**20:>8.0f}MB {row['params_vs_all']:>7.1%} "
+            f"{row['compute_vs_all']:>8.1%}{marker}"
+        )
+    return "\n".join(lines)
+
+
+def resolve_placement(model, config: dict, examples=None) -> Placement:
+    """Resolve lora.placement to LoRA targets for this model, printing the savings report.
+
+    Keeps the configured lora.target_modules for the "all" policy (PEFT maps
+    gate_proj/up_proj/down_proj onto fused experts itself) and lists module
+    and fused parameter names otherwise.
+    """
+    lora = config["lora"]
+    policy = lora.get("placement", "all")
+    if policy not in PLACEMENT_POLICIES:
+        raise ValueError(f"lora.placement must be one of {PLACEMENT_POLICIES}, got {policy!r}")
+    if not moe_blocks(model):
+        if policy != "all":
+            print(f"lora.placement={policy} has no effect on a dense model")
+        return Placement(lora["target_modules"])
+
+    histogram = routing_histogram(model, examples or []) if policy == "top_k_experts" else None
+    rows = placement_report(model, config, histogram)
+    print(format_placement_report(rows, policy))
+
+    experts, top_k = num_routed_experts(model)
+    chosen = top_experts(histogram, lora.get("top_k_experts", top_k)) if histogram else None
+    selected = select_targets(find_target_modules(model, lora["target_modules"]), policy, chosen)
+    fused = {}
+    for target in selected:
+        if target.fused:
+            fused.setdefault(target.name, set()).add(target.expert)
+    if policy == "all":
+        return Placement(lora["target_modules"], fused_experts=bool(fused))
+    return Placement(
+        target_modules=[t.name for t in selected if not t.fused],
+        target_parameters=sorted(fused),
+        experts={name: chosen for name, chosen in fused.items() if len(chosen) < experts},
+        fused_experts=bool(fused),
+    )
+
+
+def restrict_fused_experts(model, experts: dict[str, set[int]]):
+    """Hold the LoRA slices of unchosen experts at zero in PEFT's fused-parameter wrappers.
+
+    PEFT stores a stack's factors as lora_A [experts * r, in] (expert-major rows)
+    and lora_B [out, r * experts] (expert-minor columns); the other slices are
+    zeroed and their gradients masked, so they never move.
+    """
+    for name, module in model.named_modules():
+        parameter_name = getattr(module, "parameter_name", None)
+        if parameter_name is None:
+            continue
+        key = (
+            f"{name.removeprefix('base_model.model.').replace('.base_layer', '')}.{parameter_name}"
+        )
+        if key not in experts:
+            continue
+        chosen = torch.zeros(module.num_experts, dtype=torch.bool)
+        chosen[sorted(experts[key])] = True
+        for adapter in module.lora_A:
+            lora_a, lora_b = module.lora_A[adapter].weight, module.lora_B[adapter].weight
+            rank = lora_a.shape[0] // module.num_experts
+            mask_a = chosen.repeat_interleave(rank).unsqueeze(1).to(lora_a)
+            mask_b = chosen.repeat(rank).unsqueeze(0).to(lora_b)
+            with torch.no_grad():
+                lora_a.mul_(mask_a)
+                lora_b.mul_(mask_b)
+            lora_a.register_hook(lambda grad, mask=mask_a: grad * mask)
+            lora_b.register_hook(lambda grad, mask=mask_b: grad * mask)
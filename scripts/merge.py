@@ -1,41 +1,37 @@
 #!/usr/bin/env python3
 """
 Merge LoRA adapter with base model.
+By default the base checkpoint is streamed one safetensors shard at a time, so
+memory stays at about one shard plus the adapter. With --workers N, N shards
+are merged in parallel and each worker holds a shard and the adapter, so peak
+memory approaches N x (largest shard + adapter) unless --memory-budget-gb caps
+the shards in flight. --in-memory loads the whole model and uses PEFT's
+merge_and_unload instead.
 Usage: python merge.py --config config/avorion.yaml --output ./avorion-merged
+       python merge.py --config config/avorion.yaml --output ./avorion-merged --workers 8 --memory-budget-gb 96
+       python merge.py --config config/avorion.yaml --output ./avorion-merged --in-memory
 """
 
 import argparse
-import torch
-import yaml
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftModel
-
-
-def load_config(config_path: str, base_path: str = "config/base.yaml") -> dict:
-    with open(base_path) as f:
-        config = yaml.safe_load(f)
-    with open(config_path) as f:
-        domain_config = yaml.safe_load(f)
-    for key, value in domain_config.items():
-        if isinstance(value, dict) and key in config:
-            config[key].update(value)
-        else:
-            config[key] = value
-    return config
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--config", required=True)
-    parser.add_argument("--output", required=True)
-    args = parser.parse_args()
+import os
+import sys
 
-    config = load_config(args.config)
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+
+def merge_in_memory(config: dict, output: str, dtype: str = "float16"):
+    """Load the full base model, apply the adapter with merge_and_unload and save."""
+    import torch
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
 
     print(f"Loading base model: {config['model']['name']}")
     base_model = AutoModelForCausalLM.from_pretrained(
         config["model"]["name"],
-        torch_dtype=torch.float16,
+        torch_dtype=getattr(torch, dtype),
         device_map="auto",
         trust_remote_code=True,
     )
@@ -46,11 +42,64 @@ def main():
     print("Merging weights...")
     merged = model.merge_and_unload()
 
-    print(f"Saving to {args.output}")
-    merged.save_pretrained(args.output)
+    print(f"Saving to {output}")
+    merged.save_pretrained(output)
 
     tokenizer = AutoTokenizer.from_pretrained(config["model"]["name"])
-    tokenizer.save_pretrained(args.output)
+    tokenizer.save_pretrained(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="Load the whole model and merge with PEFT (needed for DoRA or modules_to_save adapters)",
+    )
+    parser.add_argument("--dtype", default="float16", choices=["float16", "bfloat16", "float32"])
+    parser.add_argument(
+        "--workers", type=int, help="Shards merged in parallel (default: output.merge_workers)"
+    )
+    parser.add_argument(
+        "--memory-budget-gb",
+        type=float,
+        help="Cap on the estimated memory of shards in flight (default: output.merge_memory_gb)",
+    )
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    workers = args.workers or config["output"].get("merge_workers", 1)
+    budget_gb = args.memory_budget_gb or config["output"].get("merge_memory_gb")
+
+    if args.in_memory:
+        merge_in_memory(config, args.output, args.dtype)
+    else:
+        # Heavy imports happen after argument parsing so --help is instant
+        from stream_merge import stream_merge
+
+        print(
+            f"Streaming merge of {config['output']['adapter_dir']} into {config['model']['name']}"
+        )
+        if workers > 1 and not budget_gb:
+            print(
+                f"No merge memory budget: up to {workers} shards (each with the adapter) are held at once"
+            )
+        summary = stream_merge(
+            config["model"]["name"],
+            config["output"]["adapter_dir"],
+            args.output,
+            args.dtype,
+            workers=workers,
+            memory_budget=budget_gb * 2**30 if budget_gb else None,
+        )
+        print(
+            f"Merged {summary['merged']} weights across {summary['shards']} shards "
+            f"with {summary['workers']} workers in {summary['seconds']:.1f}s "
+            f"(largest shard {summary['largest_shard_bytes'] / 2**30:.2f} GiB, "
+            f"adapter {summary['adapter_bytes'] / 2**20:.0f} MiB)"
+        )
     print("Done!")
 
 
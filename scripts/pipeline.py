@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Incremental runner for the raw files -> dataset -> adapter -> merged -> vLLM chain
+(with a scoring stage before training when pruning is enabled, and a
+quantization stage before conversion when quantization.format is set).
+Each stage records a content hash of its inputs (raw files, prompt template,
+resolved config, adapter weights). Stages whose hash is unchanged and whose
+outputs exist are skipped; anything downstream of a stage that runs reruns too.
+Usage: python pipeline.py --config config/avorion.yaml
+       python pipeline.py --config config/avorion.yaml --until train --dry-run
+       python pipeline.py --config config/avorion.yaml --force train
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import config_hash, load_config
+from pruning import pruning_enabled, scores_path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+# Config keys that only name later artifacts and must not invalidate training
+NON_TRAINING_OUTPUT_KEYS = (
+    "merged_dir",
+    "quantized_dir",
+    "vllm_name",
+    "merge_workers",
+    "merge_memory_gb",
+)
+# Config sections that only affect stages after training
+NON_TRAINING_SECTIONS = ("description", "generation", "quantization", "serving")
+
+
+@dataclass
+class Stage:
+    """One step of the pipeline and everything that determines its outputs."""
+
+    name: str
+    command: list[str]
+    inputs: list[Path] = field(default_factory=list)  # hashed by content
+    params: dict = field(default_factory=dict)  # settings that change the outputs
+    outputs: list[Path] = field(default_factory=list)
+    deps: list[str] = field(default_factory=list)
+    # Outputs that exist with no recorded state were made by hand: adopt them instead of overwriting
+    adopt_existing: bool = False
+
+
+def hash_path(path: Path) -> str:
+    """Content hash of a file, or of every file under a directory."""
+    digest = hashlib.sha256()
+    path = Path(path)
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(str(file.relative_to(path)).encode())
+            digest.update(hash_path(file).encode())
+    elif path.is_file():
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage: Stage, upstream: dict[str, str]) -> str:
+    """Hash a stage's inputs, parameters and upstream fingerprints."""
+    digest = hashlib.sha256(stage.name.encode())
+    for dep in stage.deps:
+        digest.update(upstream[dep].encode())
+    for path in stage.inputs:
+        digest.update(str(path).encode())
+        digest.update(hash_path(path).encode())
+    digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def stale_reason(stage: Stage, state: dict, fingerprint: str, force, ran: set):
+    """Return why a stage must run, or None if it is up to date."""
+    if stage.name in force:
+        return "forced"
+    for dep in stage.deps:
+        if dep in ran:
+            return f"upstream '{dep}' reran"
+    if stage.name not in state:
+        if (
+            stage.adopt_existing
+            and stage.outputs
+            and all(Path(path).exists() for path in stage.outputs)
+        ):
+            return None
+        return "never run"
+    if state[stage.name] != fingerprint:
+        return "inputs changed"
+    missing = [str(path) for path in stage.outputs if not Path(path).exists()]
+    if missing:
+        return f"outputs missing: {', '.join(missing)}"
+    return None
+
+
+def run_subprocess(stage: Stage):
+    subprocess.run(stage.command, check=True)
+
+
+def run_pipeline(
+    stages: list[Stage],
+    state_path: Path,
+    runner: Callable[[Stage], None] = run_subprocess,
+    force=(),
+    dry_run: bool = False,
+) -> list[str]:
+    """Run out-of-date stages in order and return the names of those that ran."""
+    state_path = Path(state_path)
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    fingerprints = {}
+    ran = []
+
+    for stage in stages:
+        # Fingerprint after upstream stages ran, so freshly written inputs count
+        fingerprint = stage_fingerprint(stage, fingerprints)
+        fingerprints[stage.name] = fingerprint
+        reason = stale_reason(stage, state, fingerprint, force, set(ran))
+        if reason is None:
+            if stage.name in state:
+                print(f"[skip] {stage.name}: up to date")
+                continue
+            outputs = ", ".join(map(str, stage.outputs))
+            print(
+                f"[skip] {stage.name}: adopting existing {outputs} (--force {stage.name} redoes it)"
+            )
+            if not dry_run:
+                state[stage.name] = fingerprint
+                state_path.parent.mkdir(parents=True, exist_ok=True)
+                state_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+            continue
+
+        print(f"[run]  {stage.name}: {reason}")
+        ran.append(stage.name)
+        if dry_run:
+            continue
+        runner(stage)
+        state[stage.name] = stage_fingerprint(stage, fingerprints)
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        state_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    return ran
+
+
+def training_config(config: dict) -> dict:
+    """The parts of a resolved config that affect the trained adapter."""
+    config = {key: value for key, value in config.items() if key not in NON_TRAINING_SECTIONS}
+    config["output"] = {
+        key: value
+        for key, value in config.get("output", {}).items()
+        if key not in NON_TRAINING_OUTPUT_KEYS
+    }
+    return config
+
+
+def build_stages(config_path: str, config: dict) -> list[Stage]:
+    """Describe the pipeline for one domain config."""
+    from generate_dataset import MAX_TOKENS, MODEL_NAME
+    from prompts import get_prompt_template
+
+    domain = config["domain"]
+    python = sys.executable
+    # generate_dataset.py reads and writes fixed per-domain paths
+    raw_dir = Path(f"data/{domain}/raw")
+    train_file = Path(f"data/{domain}/train.jsonl")
+    adapter_dir = Path(config["output"]["adapter_dir"])
+    merged_dir = Path(config["output"].get("merged_dir", f"output/{domain}/merged"))
+    vllm_name = config["output"].get("vllm_name", f"{domain}-coder")
+    quantization = config.get("quantization", {})
+    generation = config.get("generation", {})
+
+    stages = []
+    generate_deps = []
+    source_dir = config["data"].get("source_dir")
+    if source_dir:
+        stages.append(
+            Stage(
+                name="prepare",
+                command=[
+                    python,
+                    str(SCRIPTS_DIR / "prepare_avorion_dataset.py"),
+                    "--source",
+                    source_dir,
+                    "--target",
+                    str(raw_dir),
+                ],
+                inputs=[Path(source_dir)],
+                outputs=[raw_dir],
+            )
+        )
+        generate_deps = ["prepare"]
+
+    # Always pass the limit: generate_dataset.py's own default (3 samples) is meant for trying it out
+    generate_args = [
+        "--mode",
+        generation.get("mode", "live"),
+        "--limit",
+        str(generation.get("limit") or 0),
+    ]
+    eval_file = config["data"].get("eval_file")
+    train_inputs = [Path(config["data"]["train_file"])]
+    if eval_file:
+        train_inputs.append(Path(eval_file))
+    train_deps = ["generate"]
+    score_stages = []
+    if pruning_enabled(config):
+        scores_file = scores_path(config)
+        train_inputs.append(scores_file)
+        train_deps.append("score")
+        score_stages.append(
+            Stage(
+                name="score",
+                command=[python, str(SCRIPTS_DIR / "score.py"), "--config", config_path],
+                inputs=[Path(config["data"]["train_file"])],
+                params={"model": config["model"]["name"], "template": config["prompt_template"]},
+                outputs=[scores_file],
+                deps=["generate"],
+            )
+        )
+
+    stages += [
+        Stage(
+            name="generate",
+            command=[
+                python,
+                str(SCRIPTS_DIR / "generate_dataset.py"),
+                "--domain",
+                domain,
+                *generate_args,
+            ],
+            inputs=[raw_dir],
+            params={
+                "template": get_prompt_template(domain),
+                "model": MODEL_NAME,
+                "max_tokens": MAX_TOKENS,
+                "args": generate_args,
+            },
+            outputs=[train_file],
+            deps=generate_deps,
+            # A train.jsonl from before the pipeline (or written by hand) is never regenerated unasked
+            adopt_existing=True,
+        ),
+        *score_stages,
+        Stage(
+            name="train",
+            command=[python, str(SCRIPTS_DIR / "train.py"), "--config", config_path],
+            inputs=train_inputs,
+            params={"config": config_hash(training_config(config))},
+            outputs=[adapter_dir / "adapter_model.safetensors"],
+            deps=train_deps,
+        ),
+        Stage(
+            name="merge",
+            command=[
+                python,
+                str(SCRIPTS_DIR / "merge.py"),
+                "--config",
+                config_path,
+                "--output",
+                str(merged_dir),
+            ],
+            inputs=[adapter_dir / "adapter_model.safetensors", adapter_dir / "adapter_config.json"],
+            params={"model": config["model"]["name"]},
+            outputs=[merged_dir / "config.json"],
+            deps=["train"],
+        ),
+    ]
+
+    serve_dir, convert_deps = merged_dir, ["merge"]
+    if quantization.get("format"):
+        serve_dir = Path(
+            config["output"].get(
+                "quantized_dir", f"output/{domain}/quantized-{quantization['format']}"
+            )
+        )
+        convert_deps = ["quantize"]
+        stages.append(
+            Stage(
+                name="quantize",
+                command=[
+                    python,
+                    str(SCRIPTS_DIR / "quantize.py"),
+                    "--config",
+                    config_path,
+                    "--model",
+                    str(merged_dir),
+                    "--output",
+                    str(serve_dir),
+                ],
+                inputs=[Path(config["data"]["train_file"])],
+                params={"quantization": quantization, "template": config["prompt_template"]},
+                outputs=[serve_dir / "config.json"],
+                deps=["merge"],
+            )
+        )
+    stages.append(
+        Stage(
+            name="convert",
+            command=[
+                python,
+                str(SCRIPTS_DIR / "convert_vllm.py"),
+                "--model",
+                str(serve_dir),
+                "--name",
+                vllm_name,
+                "--config",
+                config_path,
+            ],
+            # Serving parameters follow the data's lengths and the serving section
+            inputs=[
+                Path(config["data"][key])
+                for key in ("train_file", "eval_file")
+                if config["data"].get(key)
+            ],
+            params={
+                "name": vllm_name,
+                "serving": config.get("serving", {}),
+                "max_seq_length": config["training"]["max_seq_length"],
+            },
+            outputs=[Path(f"{vllm_name}_vllm") / "vllm_config.yaml"],
+            deps=convert_deps,
+        )
+    )
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline, skipping up-to-date stages")
+    parser.add_argument("--config", required=True, help="Path to domain config")
+    parser.add_argument("--until", help="Stop after this stage")
+    parser.add_argument("--force", action="append", default=[], help="Rerun this stage")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would run")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    stages = build_stages(args.config, config)
+    names = [stage.name for stage in stages]
+    for name in [args.until, *args.force]:
+        if name and name not in names:
+            parser.error(f"unknown stage '{name}', expected one of {names}")
+    if args.until:
+        stages = stages[: names.index(args.until) + 1]
+
+    state_path = Path(f"output/{config['domain']}/pipeline_state.json")
+    ran = run_pipeline(stages, state_path, force=set(args.force), dry_run=args.dry_run)
+    print(f"{'Would run' if args.dry_run else 'Ran'}: {', '.join(ran) or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Batched, multi-process formatting and tokenization.
+Examples are formatted with the prompt template and tokenized by the fast
+tokenizer a batch at a time (data.tokenize_batch_size) across data.num_proc
+worker processes. The result is cached next to the data file, keyed by
+everything that changes it, and handed to the trainer already tokenized;
+with training.packing the trainer packs it into full-length sequences.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+from datasets import load_dataset
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def default_num_proc() -> int:
+    """CPU cores available to this process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_num_proc(config: dict) -> int:
+    num_proc = config["data"].get("num_proc") or default_num_proc()
+    if num_proc < 1:
+        raise ValueError(f"data.num_proc must be at least 1, got {num_proc}")
+    return num_proc
+
+
+def tokenized_cache_path(data_file: str, config: dict, tokenizer_name: str, prefix: str) -> Path:
+    """Return the cache file for a tokenized data file.
+
+    The name hashes everything that changes the tokenized output, so editing
+    the data, template, tokenizer or sequence length invalidates it.
+    """
+    data_file = Path(data_file)
+    digest = hashlib.sha256()
+    digest.update(data_file.read_bytes())
+    digest.update(config["prompt_template"].encode())
+    digest.update(tokenizer_name.encode())
+    digest.update(str(config["training"]["max_seq_length"]).encode())
+    return data_file.parent / ".cache" / f"{prefix}-{digest.hexdigest()[:16]}.arrow"
+
+
+def format_batch(batch: dict[str, list], template: str) -> list[str]:
+    """Format a columnar batch of examples with the prompt template."""
+    rows = [dict(zip(batch, values, strict=True)) for values in zip(*batch.values(), strict=True)]
+    return [template.format(**row) for row in rows]
+
+
+class BatchTokenizer:
+    """Format and tokenize one batch; a class rather than a closure so workers can unpickle it cheaply."""
+
+    def __init__(self, tokenizer, template: str, max_length: int):
+        self.tokenizer = tokenizer
+        self.template = template
+        self.max_length = max_length
+
+    def __call__(self, batch: dict[str, list]) -> dict:
+        texts = format_batch(batch, self.template)
+        return self.tokenizer(texts, truncation=True, max_length=self.max_length)
+
+
+def tokenize_dataset(
+    dataset, tokenizer, config: dict, cache_file=None, num_proc: int = 1, batch_size=None
+):
+    """Format and tokenize a dataset of raw examples into input_ids and attention_mask."""
+    if cache_file is not None:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    return dataset.map(
+        BatchTokenizer(tokenizer, config["prompt_template"], config["training"]["max_seq_length"]),
+        batched=True,
+        batch_size=batch_size or config["data"].get("tokenize_batch_size", DEFAULT_BATCH_SIZE),
+        num_proc=num_proc if num_proc > 1 else None,
+        remove_columns=dataset.column_names,
+        cache_file_name=str(cache_file) if cache_file is not None else None,
+        load_from_cache_file=cache_file is not None,
+        desc="Tokenizing",
+    )
+
+
+def build_train_dataset(config: dict, tokenizer):
+    """Load the training file and return (raw, tokenized) datasets, tokenizing in parallel once."""
+    train_file = config["data"]["train_file"]
+    raw = load_dataset("json", data_files=train_file, split="train")
+    cache_file = tokenized_cache_path(train_file, config, tokenizer.name_or_path, "train")
+    num_proc = resolve_num_proc(config)
+    dataset = tokenize_dataset(raw, tokenizer, config, cache_file, num_proc)
+    print(
+        f"Tokenized {len(dataset)} training examples with {num_proc} processes (cached at {cache_file})"
+    )
+    return raw, dataset
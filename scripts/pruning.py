@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Loss-based pruning of the training set.
+`lora score` stores every example's mean token loss under the base model (or an
+early checkpoint) in scores.json next to the training file, together with the
+data, template, tokenizer and sequence length it tokenized with; training
+refuses scores whose settings differ from its own. Training then drops
+examples by the pruning section of the config:
+  drop_easiest    fraction of examples with the lowest loss to drop
+  max_per_source  keep at most N examples (the hardest) per source file
+"""
+
+import hashlib
+import json
+from collections import defaultdict
+from pathlib import Path
+
+
+def file_digest(path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def scores_path(config: dict) -> Path:
+    """Return the scores file: pruning.scores_file, or scores.json next to the training file."""
+    configured = config.get("pruning", {}).get("scores_file")
+    if configured:
+        return Path(configured)
+    return Path(config["data"]["train_file"]).with_name("scores.json")
+
+
+def source_of(example: dict, key: str):
+    """Look up a dotted key such as metadata.file_path in a training example."""
+    value = example
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def scored_inputs(config: dict) -> dict:
+    """Everything that decides which tokens an example's score was computed on."""
+    return {
+        "train_file_sha256": file_digest(config["data"]["train_file"]),
+        "prompt_template": config["prompt_template"],
+        "tokenizer": config["model"]["name"],
+        "max_seq_length": config["training"]["max_seq_length"],
+    }
+
+
+def write_scores(path, config: dict, scored_with: str, scores: list[dict]):
+    """Save per-example scores, tied to the exact training file and tokenization they were computed on."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {**scored_inputs(config), "scored_with": scored_with, "examples": scores}
+    path.write_text(json.dumps(document) + "\n")
+
+
+def load_scores(config: dict) -> list[dict]:
+    path = scores_path(config)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Pruning is enabled but {path} does not exist; run `lora score` first"
+        )
+    document = json.loads(path.read_text())
+    changed = [key for key, value in scored_inputs(config).items() if document.get(key) != value]
+    if changed:
+        raise ValueError(
+            f"{path} was computed with a different {', '.join(changed)}; rerun `lora score`"
+        )
+    return document["examples"]
+
+
+def select_examples(
+    scores: list[dict], drop_easiest: float = 0.0, max_per_source=None
+) -> list[int]:
+    """Indices of the examples to keep, in their original order."""
+    if not 0.0 <= drop_easiest < 1.0:
+        raise ValueError(f"pruning.drop_easiest must be in [0, 1), got {drop_easiest}")
+    hardest_first = sorted(
+        range(len(scores)), key=lambda index: scores[index]["loss"], reverse=True
+    )
+    kept = hardest_first[: len(scores) - int(len(scores) * drop_easiest)]
+
+    if max_per_source:
+        per_source = defaultdict(int)
+        capped = []
+        for index in kept:
+            source = scores[index].get("source")
+            if source is not None:
+                per_source[source] += 1
+                if per_source[source] > max_per_source:
+                    continue
+            capped.append(index)
+        kept = capped
+    return sorted(kept)
+
+
+def pruning_enabled(config: dict) -> bool:
+    pruning = config.get("pruning", {})
+    return bool(pruning.get("drop_easiest") or pruning.get("max_per_source"))
+
+
+def pruned_indices(config: dict) -> list[int]:
+    """Apply the configured pruning policies to the scored training set and print the savings."""
+    pruning = config["pruning"]
+    scores = load_scores(config)
+    kept = select_examples(scores, pruning.get("drop_easiest", 0.0), pruning.get("max_per_source"))
+
+    tokens = sum(score["tokens"] for score in scores)
+    kept_tokens = sum(scores[index]["tokens"] for index in kept)
+    print(
+        f"Pruning kept {len(kept)}/{len(scores)} examples and "
+        f"{kept_tokens}/{tokens} tokens ({kept_tokens / tokens:.1%}) per epoch"
+        if tokens
+        else f"Pruning kept {len(kept)}/{len(scores)} examples"
+    )
+    return kept
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Offline weight quantization of a safetensors checkpoint, shard by shard.
+Decoder-layer linear weights are written in formats vLLM loads directly:
+int8 and int4 as GPTQ-packed weight-only tensors (qweight, qzeros, scales,
+g_idx; symmetric, per group of input channels) and fp8 as E4M3 weights with a
+per-tensor weight_scale. Embeddings, norms, the LM head, MoE routers and
+shared-expert gates keep their original dtype.
+For the integer formats, the clipping range of every group is searched to
+minimise the quantization error weighted by the mean squared input activation
+of each channel (the diagonal of GPTQ's Hessian), collected from calibration
+prompts. Only the clipping is calibrated: weights are not rescaled per channel
+as AWQ does, and no error is compensated as GPTQ does. Without calibration
+statistics the full range is used (round to nearest). Fused MoE experts (3D gate_up_proj / down_proj)
+are calibrated per expert on the tokens routed to it, matching the per-expert
+experts.N.*_proj weights their checkpoints store.
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lora_placement import FUSED_PROJECTIONS, fused_parameters
+from stream_merge import INDEX_NAME, resolve_model_dir, shard_names, write_index
+
+FORMATS = {"int8": 8, "int4": 4, "fp8": 8}
+FP8_MAX = torch.finfo(torch.float8_e4m3fn).max
+CLIP_RATIOS = [1.0 - 0.05 * step for step in range(10)]
+# MoE routers and shared-expert gates stay in full precision (vLLM builds them unquantized)
+UNQUANTIZED = re.compile(r"(\.mlp\.gate|\.router|\.shared_expert_gate)\.weight$")
+REPORT_NAME = "quantization_report.json"
+
+
+def quantizable(key: str, shape: list[int], fmt: str, group_size: int) -> bool:
+    """Whether a checkpoint tensor is a decoder-layer linear weight this format can quantize."""
+    if (
+        len(shape) != 2
+        or ".layers." not in key
+        or not key.endswith(".weight")
+        or UNQUANTIZED.search(key)
+    ):
+        return False
+    if fmt == "fp8":
+        return True
+    return shape[1] % group_size == 0 and shape[0] % (32 // FORMATS[fmt]) == 0
+
+
+def quantization_config(fmt: str, group_size: int) -> dict:
+    """The quantization_config that config.json needs for vLLM and transformers to load the output."""
+    if fmt == "fp8":
+        return {"quant_method": "fp8", "activation_scheme": "dynamic"}
+    return {
+        "quant_method": "gptq",
+        "bits": FORMATS[fmt],
+        "group_size": group_size,
+        "desc_act": False,
+        "sym": True,
+        "lm_head": False,
+        "checkpoint_format": "gptq",
+    }
+
+
+def quantize_groups(weight: torch.Tensor, bits: int, group_size: int, importance=None):
+    """Symmetric per-group quantization of an [out, in] weight.
+
+    Returns the integer levels ([out, in], in [-2^(bits-1), 2^(bits-1) - 1]) and the
+    scales ([out, in / group_size]). With importance (mean squared input per channel)
+    each group's clipping ratio minimises the importance-weighted squared error.
+    """
+    out_features, in_features = weight.shape
+    groups = weight.float().reshape(out_features, in_features // group_size, group_size)
+    max_level = 2 ** (bits - 1) - 1
+    absmax = groups.abs().amax(-1, keepdim=True).clamp(min=1e-8)
+    weights = (
+        torch.ones(1, 1, group_size)
+        if importance is None
+        else importance.float().reshape(1, in_features // group_size, group_size)
+    )
+
+    best_scale = absmax / max_level
+    best_error = None
+    for ratio in CLIP_RATIOS if importance is not None else [1.0]:
+        scale = absmax * ratio / max_level
+        levels = (groups / scale).round().clamp(-max_level - 1, max_level)
+        error = ((levels * scale - groups) ** 2 * weights).sum(-1, keepdim=True)
+        if best_error is None:
+            best_scale, best_error = scale, error
+        else:
+            better = error < best_error
+            best_scale = torch.where(better, scale, best_scale)
+            best_error = torch.where(better, error, best_error)
+
+    levels = (groups / best_scale).round().clamp(-max_level - 1, max_level)
+    return levels.reshape(out_features, in_features).to(torch.int64), best_scale.squeeze(-1)
+
+
+def pack_rows(values: torch.Tensor, bits: int) -> torch.Tensor:
+    """Pack unsigned values along dim 0 into int32, 32 / bits consecutive rows per word (GPTQ order)."""
+    per_word = 32 // bits
+    rows, cols = values.shape
+    values = values.to(torch.int64).reshape(rows // per_word, per_word, cols)
+    packed = torch.zeros(rows // per_word, cols, dtype=torch.int64)
+    for position in range(per_word):
+        packed |= values[:, position, :] << (bits * position)
+    # Reinterpret as signed 32-bit
+    return torch.where(packed >= 2**31, packed - 2**32, packed).to(torch.int32)
+
+
+def unpack_rows(packed: torch.Tensor, bits: int) -> torch.Tensor:
+    per_word = 32 // bits
+    words = packed.to(torch.int64) & 0xFFFFFFFF
+    values = torch.stack(
+        [(words >> (bits * position)) & (2**bits - 1) for position in range(per_word)], dim=1
+    )
+    return values.reshape(-1, packed.shape[1])
+
+
+def quantize_tensor(
+    key: str, weight: torch.Tensor, fmt: str, group_size: int, importance=None
+) -> dict:
+    """Quantized checkpoint tensors replacing one weight, keyed by their checkpoint names."""
+    module = key.removesuffix(".weight")
+    if fmt == "fp8":
+        scale = (weight.float().abs().max() / FP8_MAX).clamp(min=1e-12)
+        quantized = (weight.float() / scale).clamp(-FP8_MAX, FP8_MAX).to(torch.float8_e4m3fn)
+        return {key: quantized, f"{module}.weight_scale": scale.reshape(())}
+
+    bits = FORMATS[fmt]
+    levels, scales = quantize_groups(weight, bits, group_size, importance)
+    offset = 2 ** (bits - 1)
+    groups = scales.shape[1]
+    # GPTQ stores the zero point minus one
+    zeros = torch.full((groups, weight.shape[0]), offset - 1, dtype=torch.int64)
+    return {
+        f"{module}.qweight": pack_rows((levels + offset).T.contiguous(), bits),
+        f"{module}.qzeros": pack_rows(zeros.T.contiguous(), bits).T.contiguous(),
+        f"{module}.scales": scales.T.contiguous().to(torch.float16),
+        f"{module}.g_idx": (torch.arange(weight.shape[1]) // group_size).to(torch.int32),
+    }
+
+
+def dequantize_tensors(tensors: dict, module: str, fmt: str) -> torch.Tensor:
+    """Reconstruct a float32 [out, in] weight from its quantized checkpoint tensors."""
+    if fmt == "fp8":
+        return tensors[f"{module}.weight"].float() * tensors[f"{module}.weight_scale"].float()
+    bits = FORMATS[fmt]
+    levels = unpack_rows(tensors[f"{module}.qweight"], bits)
+    zeros = unpack_rows(tensors[f"{module}.qzeros"].T.contiguous(), bits).T + 1
+    g_idx = tensors[f"{module}.g_idx"].long()
+    scales = tensors[f"{module}.scales"].float()
+    return ((levels - zeros[g_idx]) * scales[g_idx]).T.contiguous()
+
+
+def quantize_shard(source: Path, target: Path, fmt: str, group_size: int, importance: dict) -> dict:
+    """Quantize the eligible weights of one shard and write it to target."""
+    tensors = {}
+    quantized = []
+    error = norm = 0.0
+    with safe_open(source, framework="pt") as shard:
+        metadata = shard.metadata() or {}
+        for key in shard.keys():  # noqa: SIM118 - safe_open handles are not iterable
+            tensor = shard.get_tensor(key)
+            if not tensor.is_floating_point() or not quantizable(
+                key, list(tensor.shape), fmt, group_size
+            ):
+                tensors[key] = tensor
+                continue
+            replacement = quantize_tensor(key, tensor, fmt, group_size, importance.get(key))
+            restored = dequantize_tensors(replacement, key.removesuffix(".weight"), fmt)
+            error += (restored - tensor.float()).pow(2).sum().item()
+            norm += tensor.float().pow(2).sum().item()
+            tensors.update(replacement)
+            quantized.append(key)
+    save_file(tensors, target, metadata={**metadata, "format": "pt"})
+    return {
+        "shard": source.name,
+        "quantized": quantized,
+        "squared_error": error,
+        "squared_norm": norm,
+        "tensors": {
+            key: tensor.nelement() * tensor.element_size() for key, tensor in tensors.items()
+        },
+    }
+
+
+def copy_model_files(model_dir: Path, output_dir: Path, fmt: str, group_size: int):
+    """Copy config, tokenizer and other non-weight files, recording the quantization in config.json."""
+    for path in model_dir.iterdir():
+        if (
+            path.is_file()
+            and not path.name.endswith(".safetensors")
+            and path.name not in (INDEX_NAME, REPORT_NAME)
+        ):
+            shutil.copy2(path, output_dir / path.name)
+    config_file = output_dir / "config.json"
+    if config_file.exists():
+        config = json.loads(config_file.read_text())
+        config["quantization_config"] = quantization_config(fmt, group_size)
+        config_file.write_text(json.dumps(config, indent=2) + "\n")
+
+
+def quantize_model(model, output_dir, fmt: str, group_size: int = 128, importance=None) -> dict:
+    """Quantize a checkpoint shard by shard into output_dir; returns a summary."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown quantization format {fmt!r}, expected one of {sorted(FORMATS)}")
+    start = time.perf_counter()
+    model_dir = resolve_model_dir(str(model))
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    names = shard_names(model_dir)
+
+    results = []
+    for number, name in enumerate(names, 1):
+        results.append(
+            quantize_shard(model_dir / name, output_dir / name, fmt, group_size, importance or {})
+        )
+        print(f"[{number}/{len(names)}] {name}: quantized {len(results[-1]['quantized'])} weights")
+
+    if not any(result["quantized"] for result in results):
+        raise ValueError(
+            f"No weights in {model_dir} can be quantized to {fmt} with group size {group_size}"
+        )
+    if len(names) > 1 or (model_dir / INDEX_NAME).exists():
+        write_index(output_dir, results)
+    copy_model_files(model_dir, output_dir, fmt, group_size)
+
+    input_bytes = sum((model_dir / name).stat().st_size for name in names)
+    output_bytes = sum((output_dir / name).stat().st_size for name in names)
+    return {
+        "format": fmt,
+        "group_size": None if fmt == "fp8" else group_size,
+        "quantized": sum(len(result["quantized"]) for result in results),
+        "calibrated": len(importance or {}),
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "size_reduction": 1 - output_bytes / input_bytes,
+        "weight_relative_error": (
+            sum(result["squared_error"] for result in results)
+            / sum(result["squared_norm"] for result in results)
+        )
+        ** 0.5,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def dequantized_shards(output_dir):
+    """Yield the weights of a quantized checkpoint as they will be served, one shard at a time."""
+    output_dir = Path(output_dir)
+    fmt_config = json.loads((output_dir / "config.json").read_text())["quantization_config"]
+    fmt = "fp8" if fmt_config["quant_method"] == "fp8" else f"int{fmt_config['bits']}"
+    for name in shard_names(output_dir):
+        with safe_open(output_dir / name, framework="pt") as shard:
+            tensors = {key: shard.get_tensor(key) for key in shard.keys()}  # noqa: SIM118
+        state = {}
+        for key, tensor in tensors.items():
+            if key.endswith(".qweight"):
+                module = key.removesuffix(".qweight")
+                state[f"{module}.weight"] = dequantize_tensors(tensors, module, fmt)
+            elif (
+                key.endswith(".weight") and f"{key.removesuffix('.weight')}.weight_scale" in tensors
+            ):
+                state[key] = dequantize_tensors(tensors, key.removesuffix(".weight"), fmt)
+            elif not key.endswith((".qzeros", ".scales", ".g_idx", ".weight_scale")):
+                state[key] = tensor
+        yield state
+
+
+def expert_weight(module, parameter_name: str, expert: int) -> torch.Tensor:
+    """One expert's [out, in] slice of a fused expert parameter."""
+    weight = getattr(module, parameter_name)[expert]
+    return weight.T if getattr(module, "is_transposed", False) else weight
+
+
+def fused_expert_slices(model) -> dict[str, tuple]:
+    """Map per-expert checkpoint weight names to (module, parameter name, expert, rows) of the fused parameters."""
+    slices = {}
+    for name, module in model.named_modules():
+        for parameter_name, _ in fused_parameters(module):
+            projections = FUSED_PROJECTIONS[parameter_name]
+            for expert in range(getattr(module, parameter_name).shape[0]):
+                rows = expert_weight(module, parameter_name, expert).shape[0] // len(projections)
+                for position, projection in enumerate(projections):
+                    key = f"{name}.{expert}.{projection}.weight"
+                    slices[key] = (
+                        module,
+                        parameter_name,
+                        expert,
+                        slice(position * rows, (position + 1) * rows),
+                    )
+    return slices
+
+
+def load_dequantized(model, output_dir):
+    """Copy the served weights of a quantized checkpoint into a model, refusing one that misses any weight.
+
+    Per-expert checkpoint weights are copied into their slices of the model's fused expert parameters.
+    """
+    fused = fused_expert_slices(model)
+    loaded = set()
+    with torch.no_grad():
+        for state in dequantized_shards(output_dir):
+            for key in [key for key in state if key in fused]:
+                module, parameter_name, expert, rows = fused[key]
+                expert_weight(module, parameter_name, expert)[rows].copy_(state.pop(key))
+                loaded.add(key)
+            result = model.load_state_dict(state, strict=False)
+            loaded.update(set(state) - set(result.unexpected_keys))
+    # named_parameters lists tied weights once, under the name the checkpoint stores
+    expected = {
+        name
+        for name, _ in model.named_parameters()
+        if name.rsplit(".", 1)[-1] not in FUSED_PROJECTIONS
+    }
+    missing = sorted((expected | set(fused)) - loaded)
+    if missing:
+        raise ValueError(
+            f"{len(missing)} model weights are not in the quantized checkpoint {output_dir}, e.g. {missing[0]}; "
+            "the evaluation would mix quantized and original weights"
+        )
+
+
+def collect_importance(model, prompts: list[torch.Tensor]) -> dict[str, torch.Tensor]:
+    """Mean squared input activation per channel of every decoder-layer linear, keyed by weight name.
+
+    Fused experts are recorded per expert, on the tokens routed to it, under the checkpoint's
+    experts.N.gate_proj / up_proj / down_proj names.
+    """
+    sums, counts, hooks = {}, {}, []
+
+    def accumulate(name, x):
+        sums[name] = sums.get(name, 0) + x.pow(2).sum(0)
+        counts[name] = counts.get(name, 0) + x.shape[0]
+
+    def record(name):
+        def hook(module, inputs, output):
+            accumulate(name, inputs[0].detach().float().reshape(-1, inputs[0].shape[-1]))
+
+        return hook
+
+    def record_experts(name, parameters):
+        def hook(module, args, kwargs, output):
+            hidden_states = args[0] if args else kwargs["hidden_states"]
+            top_k_index = args[1] if len(args) > 1 else kwargs["top_k_index"]
+            hidden_states = hidden_states.detach().reshape(-1, hidden_states.shape[-1])
+            top_k_index = top_k_index.reshape(hidden_states.shape[0], -1)
+            for expert in range(getattr(module, parameters[0]).shape[0]):
+                x = hidden_states[(top_k_index == expert).any(-1)]
+                if not len(x):
+                    continue
+                if "gate_up_proj" in parameters:
+                    for projection in FUSED_PROJECTIONS["gate_up_proj"]:
+                        accumulate(f"{name}.{expert}.{projection}.weight", x.float())
+                if "down_proj" in parameters and hasattr(module, "act_fn"):
+                    # down_proj's input is act(gate) * up, recomputed from the fused weight
+                    gate, up = torch.nn.functional.linear(
+                        x, expert_weight(module, "gate_up_proj", expert)
+                    ).chunk(2, -1)
+                    accumulate(
+                        f"{name}.{expert}.down_proj.weight", (module.act_fn(gate) * up).float()
+                    )
+
+        return hook
+
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.Linear) and ".layers." in name:
+            hooks.append(module.register_forward_hook(record(f"{name}.weight")))
+        parameters = [parameter_name for parameter_name, _ in fused_parameters(module)]
+        if parameters and ".layers." in name:
+            hooks.append(
+                module.register_forward_hook(record_experts(name, parameters), with_kwargs=True)
+            )
+    try:
+        with torch.no_grad():
+            for input_ids in prompts:
+                model(input_ids=input_ids.unsqueeze(0).to(model.device), use_cache=False)
+    finally:
+        for hook in hooks:
+            hook.remove()
+    return {name: (sums[name] / counts[name]).cpu() for name in sums}
+
+
+def prompt_metrics(model, prompts: list[torch.Tensor]) -> list[dict]:
+    """Next-token loss and greedy predictions of the model on each prompt."""
+    metrics = []
+    with torch.no_grad():
+        for input_ids in prompts:
+            input_ids = input_ids.unsqueeze(0).to(model.device)
+            outputs = model(input_ids=input_ids, labels=input_ids, use_cache=False)
+            metrics.append(
+                {
+                    "loss": outputs.loss.item(),
+                    "predictions": outputs.logits[0, :-1].argmax(-1).cpu(),
+                }
+            )
+    return metrics
+
+
+def compare_metrics(reference: list[dict], quantized: list[dict]) -> dict:
+    """Loss change and greedy-token agreement of the quantized model on the sample prompts."""
+    loss_before = sum(metric["loss"] for metric in reference) / len(reference)
+    loss_after = sum(metric["loss"] for metric in quantized) / len(quantized)
+    agree = sum(
+        (a["predictions"] == b["predictions"]).sum().item()
+        for a, b in zip(reference, quantized, strict=True)
+    )
+    total = sum(metric["predictions"].numel() for metric in reference)
+    return {
+        "prompts": len(reference),
+        "loss_before": loss_before,
+        "loss_after": loss_after,
+        "loss_change": loss_after - loss_before,
+        "top1_agreement": agree / total,
+    }
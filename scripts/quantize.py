@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Quantize a merged model for serving (int8, int4 or fp8 weights).
+Shards are quantized one at a time (see quantization.py). For int8/int4,
+calibration prompts drawn from data.train_file pick each group's clipping
+range (an importance-weighted search, not AWQ's per-channel scaling); a further held-out set of sample prompts measures the loss change and
+greedy-token agreement of the quantized weights. Both passes run the merged
+model on CPU by default. The report is printed and saved as
+quantization_report.json in the output directory.
+Usage: python quantize.py --config config/avorion.yaml --model ./avorion-merged --output ./avorion-int4 --format int4
+       python quantize.py --config config/avorion.yaml --model ./avorion-merged --output ./avorion-fp8 --format fp8 --eval-samples 0
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+
+def sample_prompts(
+    config: dict, tokenizer, count: int, max_length: int, seed: int = 0, data_file=None
+) -> list:
+    """Tokenize count shuffled training examples (formatted with the prompt template) as 1-D tensors."""
+    import torch
+
+    with open(data_file or config["data"]["train_file"]) as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    random.Random(seed).shuffle(examples)
+    prompts = []
+    for example in examples[:count]:
+        text = config["prompt_template"].format(**example)
+        input_ids = tokenizer(text, truncation=True, max_length=max_length)["input_ids"]
+        prompts.append(torch.tensor(input_ids))
+    return prompts
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Quantized {report['quantized']} weights to {report['format']} "
+        f"({report['calibrated']} calibrated) in {report['seconds']:.1f}s",
+        f"Size: {report['input_bytes'] / 2**30:.2f} GiB -> {report['output_bytes'] / 2**30:.2f} GiB "
+        f"({report['size_reduction']:.1%} smaller)",
+        f"Weight relative error: {report['weight_relative_error']:.4f}",
+    ]
+    prompts = report.get("prompts")
+    if prompts:
+        lines.append(
+            f"Sample prompts ({prompts['prompts']}): loss {prompts['loss_before']:.4f} -> "
+            f"{prompts['loss_after']:.4f} ({prompts['loss_change']:+.4f}), "
+            f"top-1 agreement {prompts['top1_agreement']:.1%}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantize a merged model for serving")
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--model", required=True, help="Path to merged model")
+    parser.add_argument("--output", required=True)
+    parser.add_argument(
+        "--format", choices=["int8", "int4", "fp8"], help="Default: quantization.format"
+    )
+    parser.add_argument(
+        "--group-size",
+        type=int,
+        help="Input channels per int scale (default: quantization.group_size)",
+    )
+    parser.add_argument(
+        "--calibration-samples", type=int, help="Default: quantization.calibration_samples"
+    )
+    parser.add_argument(
+        "--eval-samples",
+        type=int,
+        help="Sample prompts to measure (default: quantization.eval_samples)",
+    )
+    parser.add_argument(
+        "--device", default="cpu", help="Device for the calibration and sample-prompt passes"
+    )
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    settings = config.get("quantization", {})
+    fmt = args.format or settings.get("format")
+    if fmt is None:
+        parser.error("no format: pass --format or set quantization.format")
+    group_size = args.group_size or settings.get("group_size", 128)
+    calibration_samples = args.calibration_samples
+    if calibration_samples is None:
+        calibration_samples = settings.get("calibration_samples", 128)
+    if fmt == "fp8":
+        calibration_samples = 0
+    eval_samples = (
+        args.eval_samples if args.eval_samples is not None else settings.get("eval_samples", 8)
+    )
+    max_length = settings.get("max_length", 512)
+
+    # Heavy imports happen after argument parsing so --help is instant
+    from quantization import (
+        REPORT_NAME,
+        collect_importance,
+        compare_metrics,
+        load_dequantized,
+        prompt_metrics,
+        quantize_model,
+    )
+
+    model = None
+    importance, reference = None, None
+    if calibration_samples or eval_samples:
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        print(f"Loading {args.model} on {args.device}")
+        model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype="auto").to(args.device)
+        model.eval()
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        prompts = sample_prompts(config, tokenizer, calibration_samples + eval_samples, max_length)
+        calibration, held_out = prompts[:calibration_samples], prompts[calibration_samples:]
+        if calibration:
+            print(f"Calibrating on {len(calibration)} prompts")
+            importance = collect_importance(model, calibration)
+        if held_out:
+            reference = prompt_metrics(model, held_out)
+
+    report = quantize_model(args.model, args.output, fmt, group_size, importance)
+    if reference:
+        load_dequantized(model, args.output)
+        report["prompts"] = compare_metrics(reference, prompt_metrics(model, held_out))
+
+    print(format_report(report))
+    report_file = Path(args.output) / REPORT_NAME
+    report_file.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved report to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Post-hoc LoRA rank reduction by truncated SVD.
+Each module's update scaling * B @ A is factored exactly through its rank-r
+core (QR of B and A^T, then the SVD of the r x r product), so the SVD costs
+O((in + out) r^2) instead of a dense decomposition of the full weight. Each
+module keeps its top singular directions up to a target rank or until an
+energy threshold (fraction of the sum of squared singular values) is reached.
+The scaling is folded into the new factors and lora_alpha is set equal to each
+module's rank, so the adapter means the same in PEFT (which reads rank_pattern
+and alpha_pattern) and vLLM (which only reads r and lora_alpha). Fused MoE
+experts are reduced expert by expert and keep one rank, the largest any of
+their experts needs.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import torch
+from safetensors.torch import load_file, save_file
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from stream_merge import ADAPTER_PREFIX, expert_factors, fused_factors, load_adapter
+
+REPORT_NAME = "rank_reduction_report.json"
+ADAPTER_WEIGHTS = "adapter_model.safetensors"
+ADAPTER_CONFIG = "adapter_config.json"
+
+
+def truncated_factors(
+    lora_a: torch.Tensor, lora_b: torch.Tensor, scaling: float, rank=None, energy=None
+):
+    """New (A, B) of scaling * B @ A truncated to rank or to the energy fraction, and its statistics.
+
+    The singular values are split evenly between the factors (B = U sqrt(S), A = sqrt(S) V^T).
+    """
+    lora_a, lora_b = lora_a.double(), lora_b.double()
+    q_b, r_b = torch.linalg.qr(lora_b)
+    q_a, r_a = torch.linalg.qr(lora_a.T)
+    u, singular, vh = torch.linalg.svd(scaling * r_b @ r_a.T)
+
+    squared = singular**2
+    total = squared.sum()
+    cumulative = torch.cumsum(squared, 0) / total if total > 0 else torch.ones_like(squared)
+    keep = len(singular)
+    if energy is not None:
+        keep = int((cumulative < energy - 1e-12).sum().item()) + 1
+    if rank is not None:
+        keep = min(keep, rank)
+    keep = max(1, min(keep, len(singular)))
+
+    root = singular[:keep].sqrt()
+    new_b = (q_b @ u[:, :keep]) * root
+    new_a = root.unsqueeze(1) * (vh[:keep] @ q_a.T)
+    stats = {
+        "rank_before": lora_a.shape[0],
+        "rank_after": keep,
+        "retained_energy": cumulative[keep - 1].item(),
+    }
+    return new_a, new_b, stats
+
+
+def truncated_expert_factors(lora_a, lora_b, scaling: float, experts: int, rank=None, energy=None):
+    """truncated_factors of each expert in a fused stack (one "expert" for a plain module), at one shared rank."""
+    factors = expert_factors(lora_a, lora_b, experts)
+    results = [truncated_factors(A, B, scaling, rank, energy) for A, B in factors]
+    keep = max(stats["rank_after"] for *_, stats in results)
+    if any(stats["rank_after"] != keep for *_, stats in results):
+        results = [truncated_factors(A, B, scaling, keep) for A, B in factors]
+    new_a, new_b = fused_factors([(new_a, new_b) for new_a, new_b, _ in results])
+    stats = {
+        "rank_before": lora_a.shape[0] // experts,
+        "rank_after": keep,
+        "retained_energy": min(stats["retained_energy"] for *_, stats in results),
+    }
+    return new_a, new_b, stats
+
+
+def unit_scaling_config(config: dict, ranks: dict[str, int]) -> dict:
+    """Adapter config for factors that already carry their scaling: alpha equals rank in every module."""
+    top_rank = max(ranks.values())
+    smaller = {module: rank for module, rank in ranks.items() if rank != top_rank}
+    return {
+        **config,
+        "r": top_rank,
+        "lora_alpha": top_rank,
+        "rank_pattern": smaller,
+        "alpha_pattern": dict(smaller),
+        "use_rslora": False,
+    }
+
+
+def reduce_adapter(adapter_dir, output_dir, rank=None, energy=None) -> dict:
+    """Write a rank-reduced copy of a LoRA adapter to output_dir; returns the per-module report."""
+    if rank is None and energy is None:
+        raise ValueError("Pass a target rank or an energy threshold")
+    if energy is not None and not 0.0 < energy <= 1.0:
+        raise ValueError(f"energy must be in (0, 1], got {energy}")
+    start = time.perf_counter()
+    adapter_dir, output_dir = Path(adapter_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    config = json.loads((adapter_dir / ADAPTER_CONFIG).read_text())
+    dtype = next(iter(load_file(adapter_dir / ADAPTER_WEIGHTS).values())).dtype
+    deltas = load_adapter(adapter_dir)
+
+    tensors, modules = {}, []
+    for key in sorted(deltas):
+        delta = deltas[key]
+        new_a, new_b, stats = truncated_expert_factors(
+            delta.lora_a, delta.lora_b, delta.scaling, delta.experts, rank, energy
+        )
+        tensors[f"{ADAPTER_PREFIX}{delta.module}.lora_A.weight"] = new_a.to(dtype).contiguous()
+        tensors[f"{ADAPTER_PREFIX}{delta.module}.lora_B.weight"] = new_b.to(dtype).contiguous()
+        # Fused experts are keyed by their parameter (experts.gate_up_proj), as rank_pattern expects
+        modules.append({"module": key.removesuffix(".weight"), **stats})
+    save_file(tensors, output_dir / ADAPTER_WEIGHTS, metadata={"format": "pt"})
+
+    config = unit_scaling_config(
+        config, {module["module"]: module["rank_after"] for module in modules}
+    )
+    (output_dir / ADAPTER_CONFIG).write_text(json.dumps(config, indent=2) + "\n")
+    for path in adapter_dir.iterdir():
+        if path.is_file() and path.name not in (ADAPTER_CONFIG, ADAPTER_WEIGHTS, REPORT_NAME):
+            shutil.copy2(path, output_dir / path.name)
+
+    params_before = sum(d.lora_a.numel() + d.lora_b.numel() for d in deltas.values())
+    params_after = sum(tensor.numel() for tensor in tensors.values())
+    retained = [module["retained_energy"] for module in modules]
+    return {
+        "target_rank": rank,
+        "energy_threshold": energy,
+        "modules": modules,
+        "max_rank": config["r"],
+        "params_before": params_before,
+        "params_after": params_after,
+        "mean_retained_energy": sum(retained) / len(retained),
+        "min_retained_energy": min(retained),
+        "seconds": time.perf_counter() - start,
+    }
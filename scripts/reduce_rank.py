@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Shrink a trained LoRA adapter by truncated SVD of every module's B @ A.
+Keeps each module's top singular directions up to --rank, or as many as hold
+--energy of its squared singular values (see rank_reduction.py), and writes a
+standard adapter that PEFT and vLLM load like the original. The report lists
+every module's rank and retained energy and, with --eval-samples, the loss of
+the original and reduced adapters on held-out prompts (data.eval_file, else
+data.train_file). It is printed and saved as rank_reduction_report.json in the
+output directory.
+Usage: python reduce_rank.py --config config/avorion.yaml --rank 8 --output ./adapters/avorion-r8
+       python reduce_rank.py --config config/avorion.yaml --energy 0.9 --output ./adapters/avorion-e90 --eval-samples 0
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'module':<56} {'rank':>9} {'energy':>8}"]
+    for module in report["modules"]:
+        lines.append(
+            f"{module['module']:<56} {module['rank_before']:>4} -> {module['rank_after']:<2} "
+            f"{module['retained_energy']:>7.1%}"
+        )
+    lines.append(
+        f"Parameters: {report['params_before']:,} -> {report['params_after']:,} "
+        f"({1 - report['params_after'] / report['params_before']:.1%} fewer), max rank {report['max_rank']}"
+    )
+    lines.append(
+        f"Retained energy: mean {report['mean_retained_energy']:.1%}, min {report['min_retained_energy']:.1%}"
+    )
+    prompts = report.get("prompts")
+    if prompts:
+        lines.append(
+            f"Eval prompts ({prompts['prompts']}): loss {prompts['loss_before']:.4f} -> "
+            f"{prompts['loss_after']:.4f} ({prompts['loss_change']:+.4f}), "
+            f"top-1 agreement {prompts['top1_agreement']:.1%}"
+        )
+    return "\n".join(lines)
+
+
+def eval_loss_change(
+    config: dict, adapter_dir, reduced_dir, samples: int, max_length: int, device: str
+) -> dict:
+    """Loss and greedy agreement of the reduced adapter against the original on held-out prompts."""
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from quantization import compare_metrics, prompt_metrics
+    from quantize import sample_prompts
+
+    print(f"Loading {config['model']['name']} on {device}")
+    base = AutoModelForCausalLM.from_pretrained(config["model"]["name"], torch_dtype="auto").to(
+        device
+    )
+    tokenizer = AutoTokenizer.from_pretrained(config["model"]["name"])
+    eval_file = config["data"].get("eval_file")
+    data_file = (
+        eval_file if eval_file and Path(eval_file).exists() else config["data"]["train_file"]
+    )
+    prompts = sample_prompts(config, tokenizer, samples, max_length, data_file=data_file)
+
+    model = PeftModel.from_pretrained(base, str(adapter_dir), adapter_name="original")
+    model.load_adapter(str(reduced_dir), adapter_name="reduced")
+    model.eval()
+    model.set_adapter("original")
+    reference = prompt_metrics(model, prompts)
+    model.set_adapter("reduced")
+    return compare_metrics(reference, prompt_metrics(model, prompts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reduce a LoRA adapter's rank by truncated SVD")
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--adapter", help="Adapter directory (default: output.adapter_dir)")
+    parser.add_argument("--output", required=True, help="Directory for the reduced adapter")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--rank", type=int, help="Keep at most this many singular directions per module"
+    )
+    target.add_argument(
+        "--energy", type=float, help="Keep the fewest directions holding this fraction (e.g. 0.9)"
+    )
+    parser.add_argument(
+        "--eval-samples",
+        type=int,
+        default=8,
+        help="Held-out prompts to measure (0 skips loading the model)",
+    )
+    parser.add_argument("--max-length", type=int, default=512, help="Tokens per eval prompt")
+    parser.add_argument("--device", default="cpu", help="Device for the eval pass")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    adapter_dir = args.adapter or config["output"]["adapter_dir"]
+
+    # Heavy imports happen after argument parsing so --help is instant
+    from rank_reduction import REPORT_NAME, reduce_adapter
+
+    report = reduce_adapter(adapter_dir, args.output, rank=args.rank, energy=args.energy)
+    if args.eval_samples:
+        report["prompts"] = eval_loss_change(
+            config, adapter_dir, args.output, args.eval_samples, args.max_length, args.device
+        )
+
+    print(format_report(report))
+    report_file = Path(args.output) / REPORT_NAME
+    report_file.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved report to {report_file}")
+
+
+if __name__ == "__main__":
+    main()
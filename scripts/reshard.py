@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Reshard a safetensors checkpoint into evenly sized shards.
+Tensors are ordered by layer (layers.2 before layers.10) and split into
+shards of about --shard-size-gb, balanced so that no shard is much larger than
+the others; --ranks makes the shard count a multiple of the number of readers
+(tensor parallel ranks or loader threads) so each reads the same number of
+files. That only balances whole files per reader: tensors are never split by
+rank, so this is not a tensor-parallel per-rank layout. Tensor
+bytes are copied straight between files in fixed-size chunks, never decoded,
+so memory stays at one chunk however large the model. The index is rebuilt and
+config/tokenizer files are copied alongside. --benchmark times a cold load
+(page cache dropped) of the checkpoint before and after.
+Usage: python reshard.py --model ./avorion-merged --output ./avorion-resharded --shard-size-gb 2
+       python reshard.py --model ./avorion-merged --output ./avorion-resharded --ranks 4 --benchmark
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+
+INDEX_NAME = "model.safetensors.index.json"
+SINGLE_SHARD_NAME = "model.safetensors"
+# Bytes copied per read; the only tensor data held in memory at once
+CHUNK_BYTES = 64 * 2**20
+
+
+def read_header(path: Path) -> tuple[dict, int]:
+    """A safetensors file's JSON header and the offset where tensor data starts."""
+    with open(path, "rb") as f:
+        (length,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(length)), 8 + length
+
+
+def shard_files(model_dir: Path) -> list[Path]:
+    """Safetensors shards of a checkpoint, from its index if it has one."""
+    index = model_dir / INDEX_NAME
+    if index.exists():
+        return [
+            model_dir / name
+            for name in sorted(set(json.loads(index.read_text())["weight_map"].values()))
+        ]
+    if (model_dir / SINGLE_SHARD_NAME).exists():
+        return [model_dir / SINGLE_SHARD_NAME]
+    raise FileNotFoundError(f"No safetensors weights in {model_dir}")
+
+
+def natural_key(name: str) -> list:
+    """Sort key that orders numbered parts numerically, keeping each layer's tensors together."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def tensor_entries(model_dir: Path) -> tuple[list[dict], dict]:
+    """Every tensor in the checkpoint (name, source file, byte range, dtype, shape), in layer order,
+    and the metadata of the first shard."""
+    entries, metadata = [], None
+    for path in shard_files(model_dir):
+        header, data_start = read_header(path)
+        file_metadata = header.pop("__metadata__", None) or {}
+        metadata = file_metadata if metadata is None else metadata
+        for name, info in header.items():
+            start, end = info["data_offsets"]
+            entries.append(
+                {
+                    "name": name,
+                    "path": path,
+                    "offset": data_start + start,
+                    "nbytes": end - start,
+                    "dtype": info["dtype"],
+                    "shape": info["shape"],
+                }
+            )
+    return sorted(entries, key=lambda entry: natural_key(entry["name"])), metadata or {}
+
+
+def split_evenly(entries: list[dict], count: int) -> list[list[dict]]:
+    """Put each tensor in the slot of count equal slots its midpoint falls in; empty shards are dropped."""
+    total = sum(entry["nbytes"] for entry in entries)
+    target = total / count
+    shards = [[] for _ in range(count)]
+    offset = 0
+    for entry in entries:
+        index = min(count - 1, int((offset + entry["nbytes"] / 2) // target)) if target else 0
+        shards[index].append(entry)
+        offset += entry["nbytes"]
+    return [shard for shard in shards if shard]
+
+
+def plan_shards(entries: list[dict], shard_bytes: int, ranks: int = 1) -> list[list[dict]]:
+    """Split ordered tensors into about total / shard_bytes shards (a multiple of ranks) of even size.
+
+    A tensor goes to the shard its midpoint falls in, so shards differ by at most one tensor.
+    A single tensor larger than the target gets a shard of its own, which can leave a slot empty;
+    the split is then redone with fewer shards until the count is a multiple of ranks again
+    (or there are fewer shards than ranks, when the checkpoint has too few tensors).
+    """
+    total = sum(entry["nbytes"] for entry in entries)
+    count = max(1, math.ceil(total / shard_bytes))
+    count = min(math.ceil(count / ranks) * ranks, len(entries))
+    while True:
+        shards = split_evenly(entries, count)
+        if len(shards) % ranks == 0 or len(shards) < ranks:
+            return shards
+        count = len(shards) // ranks * ranks
+
+
+def shard_name(number: int, count: int) -> str:
+    if count == 1:
+        return SINGLE_SHARD_NAME
+    return f"model-{number:05d}-of-{count:05d}.safetensors"
+
+
+def write_shard(path: Path, entries: list[dict], metadata: dict, chunk_bytes: int = CHUNK_BYTES):
+    """Write entries as one safetensors file, copying their bytes chunk by chunk from the source shards."""
+    header = {"__metadata__": metadata} if metadata else {}
+    offset = 0
+    for entry in entries:
+        header[entry["name"]] = {
+            "dtype": entry["dtype"],
+            "shape": entry["shape"],
+            "data_offsets": [offset, offset + entry["nbytes"]],
+        }
+        offset += entry["nbytes"]
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    # Pad the header so tensor data starts 8-byte aligned, as safetensors itself does
+    encoded += b" " * (-len(encoded) % 8)
+
+    temporary = path.with_suffix(".safetensors.tmp")
+    sources = {}
+    with ExitStack() as stack, open(temporary, "wb") as out:
+        out.write(struct.pack("<Q", len(encoded)))
+        out.write(encoded)
+        for entry in entries:
+            if entry["path"] not in sources:
+                sources[entry["path"]] = stack.enter_context(open(entry["path"], "rb"))
+            source = sources[entry["path"]]
+            source.seek(entry["offset"])
+            remaining = entry["nbytes"]
+            while remaining:
+                chunk = source.read(min(chunk_bytes, remaining))
+                if not chunk:
+                    raise ValueError(f"{entry['path']} ends inside tensor {entry['name']}")
+                out.write(chunk)
+                remaining -= len(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temporary, path)
+
+
+def write_index(output_dir: Path, shards: list[list[dict]], names: list[str]):
+    weight_map = {
+        entry["name"]: name for shard, name in zip(shards, names, strict=True) for entry in shard
+    }
+    total_size = sum(entry["nbytes"] for shard in shards for entry in shard)
+    index = {"metadata": {"total_size": total_size}, "weight_map": dict(sorted(weight_map.items()))}
+    (output_dir / INDEX_NAME).write_text(json.dumps(index, indent=2) + "\n")
+
+
+def reshard(
+    model_dir, output_dir, shard_bytes: int, ranks: int = 1, chunk_bytes: int = CHUNK_BYTES
+) -> dict:
+    """Rewrite a checkpoint's weights as evenly sized shards in output_dir; returns a summary."""
+    start = time.perf_counter()
+    model_dir, output_dir = Path(model_dir), Path(output_dir)
+    if output_dir.resolve() == model_dir.resolve():
+        raise ValueError(
+            "Resharding reads the source shards while writing; choose a different --output"
+        )
+    input_files = shard_files(model_dir)
+    entries, metadata = tensor_entries(model_dir)
+    shards = plan_shards(entries, shard_bytes, ranks)
+    names = [shard_name(number, len(shards)) for number in range(1, len(shards) + 1)]
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Shards from an earlier layout would be picked up by loaders globbing *.safetensors
+    for stale in [*output_dir.glob("*.safetensors"), output_dir / INDEX_NAME]:
+        stale.unlink(missing_ok=True)
+    for number, (shard, name) in enumerate(zip(shards, names, strict=True), 1):
+        write_shard(output_dir / name, shard, metadata, chunk_bytes)
+        print(
+            f"[{number}/{len(shards)}] {name}: {len(shard)} tensors, {sum(e['nbytes'] for e in shard) / 2**20:.1f} MiB"
+        )
+    if len(shards) > 1:
+        write_index(output_dir, shards, names)
+    for path in model_dir.iterdir():
+        if path.is_file() and not path.name.endswith(".safetensors") and path.name != INDEX_NAME:
+            shutil.copy2(path, output_dir / path.name)
+
+    sizes = [os.path.getsize(output_dir / name) for name in names]
+    return {
+        "tensors": len(entries),
+        "input_shards": len(input_files),
+        "output_shards": len(shards),
+        "input_shard_bytes": [os.path.getsize(path) for path in input_files],
+        "output_shard_bytes": sizes,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def drop_page_cache(paths: list[Path]):
+    """Evict files from the page cache so the next read comes from disk (no root needed)."""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def cold_load_seconds(model_dir, threads: int = 8) -> float:
+    """Time loading every tensor of a checkpoint from cold cache, reading shards on threads in parallel."""
+    from safetensors import safe_open
+
+    def load(path: Path) -> int:
+        with safe_open(path, framework="pt") as shard:
+            return sum(shard.get_tensor(key).nelement() for key in shard.keys())  # noqa: SIM118
+
+    paths = shard_files(Path(model_dir))
+    drop_page_cache(paths)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(paths)))) as pool:
+        list(pool.map(load, paths))
+    return time.perf_counter() - start
+
+
+def format_sizes(sizes: list[int]) -> str:
+    return f"{len(sizes)} shards, {min(sizes) / 2**20:.1f}-{max(sizes) / 2**20:.1f} MiB (max/min {max(sizes) / min(sizes):.2f})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reshard a safetensors checkpoint into evenly sized shards"
+    )
+    parser.add_argument(
+        "--model", required=True, help="Checkpoint directory (e.g. the merged model)"
+    )
+    parser.add_argument("--output", required=True, help="Directory for the resharded checkpoint")
+    parser.add_argument("--shard-size-gb", type=float, default=2.0, help="Target shard size")
+    parser.add_argument(
+        "--ranks", type=int, default=1, help="Make the shard count a multiple of this (TP size)"
+    )
+    parser.add_argument(
+        "--benchmark", action="store_true", help="Time a cold load before and after"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Shards read in parallel by --benchmark"
+    )
+    args = parser.parse_args(argv)
+
+    before = cold_load_seconds(args.model, args.threads) if args.benchmark else None
+    summary = reshard(args.model, args.output, int(args.shard_size_gb * 2**30), args.ranks)
+    print(f"Resharded {summary['tensors']} tensors in {summary['seconds']:.1f}s")
+    print(f"  before: {format_sizes(summary['input_shard_bytes'])}")
+    print(f"  after:  {format_sizes(summary['output_shard_bytes'])}")
+    if args.benchmark:
+        after = cold_load_seconds(args.output, args.threads)
+        print(
+            f"Cold load with {args.threads} threads: {before:.2f}s before, {after:.2f}s after ({before / after:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Resume training without replaying the dataloader.
+The training order of each epoch is a permutation seeded by (seed, epoch), so it
+can be rebuilt from three numbers. Every checkpoint stores them in
+dataloader_state.json together with the position (examples consumed in the
+epoch); on resume the sampler starts from that position directly instead of
+the Trainer iterating past the batches it already trained on.
+Async checkpoints only carry optimizer state every output.optimizer_save_steps;
+resuming from one without it restores the learning-rate schedule, starts the
+optimizer moments fresh and warns, naming the newest checkpoint that has them.
+"""
+
+import json
+import math
+import random
+import warnings
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+from transformers import TrainerCallback
+
+DATALOADER_STATE_NAME = "dataloader_state.json"
+OPTIMIZER_NAME = "optimizer.pt"
+SCHEDULER_NAME = "scheduler.pt"
+
+
+class ResumableSampler(Sampler):
+    """Shuffled sampler whose order and position are fully described by its state dict."""
+
+    def __init__(self, num_examples: int, seed: int = 0):
+        self.num_examples = num_examples
+        self.seed = seed
+        self.epoch = 0
+        self.position = 0  # first index of the order to yield, used once
+
+    def order(self, epoch: int) -> list[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + epoch)
+        return torch.randperm(self.num_examples, generator=generator).tolist()
+
+    def set_epoch(self, epoch: int):
+        if epoch != self.epoch:
+            self.position = 0
+        self.epoch = epoch
+
+    def __iter__(self):
+        position, self.position = self.position, 0
+        yield from self.order(self.epoch)[position:]
+
+    def __len__(self):
+        # Always the full epoch: the Trainer derives steps per epoch from it
+        return self.num_examples
+
+    def state_dict(self) -> dict:
+        return {
+            "seed": self.seed,
+            "epoch": self.epoch,
+            "position": self.position,
+            "num_examples": self.num_examples,
+        }
+
+    def load_state_dict(self, state: dict):
+        if state["num_examples"] != self.num_examples or state["seed"] != self.seed:
+            raise ValueError(
+                f"Checkpoint was written for {state['num_examples']} examples with seed {state['seed']}, "
+                f"but this run has {self.num_examples} examples with seed {self.seed}"
+            )
+        self.epoch = state["epoch"]
+        self.position = state["position"]
+
+
+def find_sampler(dataloader):
+    """The ResumableSampler behind a (possibly accelerate-wrapped) dataloader, or None."""
+    candidates = [dataloader]
+    while candidates:
+        current = candidates.pop()
+        # Duck-typed: the module may be imported both as resume and scripts.resume
+        if hasattr(current, "load_state_dict") and hasattr(current, "position"):
+            return current
+        for attr in ("base_dataloader", "batch_sampler", "sampler"):
+            child = getattr(current, attr, None)
+            if child is not None and child is not current:
+                candidates.append(child)
+    return None
+
+
+def dataloader_state(args, state, train_dataloader) -> dict | None:
+    """Sampler state after state.global_step optimizer steps."""
+    sampler = find_sampler(train_dataloader)
+    if sampler is None:
+        return None
+    batches_per_epoch = len(train_dataloader)
+    updates_per_epoch = max(math.ceil(batches_per_epoch / args.gradient_accumulation_steps), 1)
+    batches = (state.global_step % updates_per_epoch) * args.gradient_accumulation_steps
+    return {
+        "seed": sampler.seed,
+        "epoch": state.global_step // updates_per_epoch,
+        # Every process takes one batch per step from the shared order
+        "position": min(
+            batches * args.per_device_train_batch_size * args.world_size, sampler.num_examples
+        ),
+        "num_examples": sampler.num_examples,
+    }
+
+
+def rng_state() -> dict:
+    """Python, numpy and torch RNG states, as the Trainer writes them to rng_state.pth."""
+    states = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "cpu": torch.random.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        states["cuda"] = torch.cuda.random.get_rng_state_all()
+    return states
+
+
+def rng_states(args) -> dict[str, dict]:
+    """Every process's RNG state by the file name Trainer._save_rng_state gives it; call on all ranks."""
+    if args.world_size <= 1:
+        return {"rng_state.pth": rng_state()}
+    states = [None] * args.world_size
+    torch.distributed.all_gather_object(states, rng_state())
+    return {f"rng_state_{index}.pth": state for index, state in enumerate(states)}
+
+
+def latest_full_checkpoint(output_dir):
+    """The newest checkpoint-<step> under output_dir that holds optimizer state, or None."""
+    checkpoints = [
+        path for path in Path(output_dir).glob("checkpoint-*") if (path / OPTIMIZER_NAME).is_file()
+    ]
+    return max(checkpoints, key=lambda path: int(path.name.split("-")[-1]), default=None)
+
+
+class DataloaderStateCallback(TrainerCallback):
+    """Write dataloader_state.json into every checkpoint the Trainer saves itself."""
+
+    def on_save(self, args, state, control, train_dataloader=None, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        data_state = dataloader_state(args, state, train_dataloader)
+        checkpoint = Path(args.output_dir) / f"checkpoint-{state.global_step}"
+        if data_state is not None and checkpoint.is_dir():
+            (checkpoint / DATALOADER_STATE_NAME).write_text(json.dumps(data_state, indent=2) + "\n")
+
+
+class ResumedEpochCallback(TrainerCallback):
+    """Report state.epoch against the full epoch while the resumed rest of it runs as a shorter one."""
+
+    def __init__(self, epoch: int, skipped: int, steps_in_epoch: int):
+        self.epoch = epoch
+        self.skipped = skipped
+        self.steps_in_epoch = steps_in_epoch
+
+    def on_step_end(self, args, state, control, **kwargs):
+        # The Trainer just set epoch + batches run / (steps_in_epoch - skipped)
+        done = round((state.epoch - self.epoch) * (self.steps_in_epoch - self.skipped))
+        state.epoch = self.epoch + (self.skipped + done) / self.steps_in_epoch
+
+
+class ResumableDataMixin:
+    """Trainer mixin that samples with ResumableSampler and resumes at the saved position in O(1)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Async checkpoints write trainer_state.json themselves, including the other callbacks' state
+        for callback in self.callback_handler.callbacks:
+            if hasattr(callback, "callback_handler"):
+                callback.callback_handler = self.callback_handler
+
+    def _get_train_sampler(self, *args, **kwargs):
+        dataset = args[0] if args else kwargs.get("train_dataset", self.train_dataset)
+        if dataset is None or not hasattr(dataset, "__len__"):
+            return super()._get_train_sampler(*args, **kwargs)
+        seed = self.args.data_seed if self.args.data_seed is not None else self.args.seed
+        return ResumableSampler(len(dataset), seed)
+
+    def _run_epoch(self, **kwargs):
+        skipped = kwargs["steps_trained_in_current_epoch"]
+        checkpoint = kwargs["resume_from_checkpoint"]
+        if kwargs["epoch"] != kwargs["epochs_trained"] or not checkpoint or not skipped:
+            return super()._run_epoch(**kwargs)
+
+        state_file = Path(checkpoint) / DATALOADER_STATE_NAME
+        sampler = find_sampler(kwargs["train_dataloader"])
+        if sampler is None or not state_file.is_file():
+            print(
+                f"No {DATALOADER_STATE_NAME} in {checkpoint}; replaying {skipped} batches to resume"
+            )
+            return super()._run_epoch(**kwargs)
+
+        sampler.load_state_dict(json.loads(state_file.read_text()))
+        print(
+            f"Resuming epoch {sampler.epoch} at example {sampler.position} of {sampler.num_examples}"
+        )
+        # The sampler already starts past the consumed batches: run the rest of the epoch as if it were a
+        # shorter one, so the Trainer neither skips batches nor misplaces the last accumulation step
+        gradient_accumulation = self.args.gradient_accumulation_steps
+        epoch_offset = ResumedEpochCallback(kwargs["epoch"], skipped, kwargs["steps_in_epoch"])
+        kwargs["steps_in_epoch"] -= skipped
+        kwargs["num_update_steps_per_epoch"] -= skipped // gradient_accumulation
+        kwargs["steps_trained_in_current_epoch"] = 0
+        # First, so every other callback and the logs see the corrected epoch
+        self.callback_handler.callbacks.insert(0, epoch_offset)
+        try:
+            return super()._run_epoch(**kwargs)
+        finally:
+            self.callback_handler.remove_callback(epoch_offset)
+
+    def _load_optimizer_and_scheduler(self, checkpoint):
+        if checkpoint is None or (Path(checkpoint) / OPTIMIZER_NAME).is_file():
+            return super()._load_optimizer_and_scheduler(checkpoint)
+
+        full = latest_full_checkpoint(Path(checkpoint).parent)
+        warnings.warn(
+            f"{checkpoint} has no {OPTIMIZER_NAME}: resuming with fresh optimizer moments, so the "
+            "first steps will not match an uninterrupted run. "
+            + (
+                f"{full} is the newest checkpoint with optimizer state."
+                if full
+                else "No checkpoint in that directory has optimizer state (see output.optimizer_save_steps)."
+            ),
+            stacklevel=2,
+        )
+        scheduler_file = Path(checkpoint) / SCHEDULER_NAME
+        if scheduler_file.is_file():
+            self.lr_scheduler.load_state_dict(torch.load(scheduler_file, weights_only=True))
+        else:
+            warnings.warn(
+                f"{checkpoint} has no {SCHEDULER_NAME}: the learning-rate schedule restarts",
+                stacklevel=2,
+            )
+
+
+def resumable_trainer(trainer_class):
+    """Return trainer_class extended with O(1) dataloader resume."""
+    if not callable(getattr(trainer_class, "_run_epoch", None)):
+        import transformers
+
+        raise RuntimeError(
+            f"{trainer_class.__name__} has no _run_epoch (transformers {transformers.__version__}); "
+            "resuming at the saved dataloader position needs transformers>=5.3"
+        )
+    return type(f"Resumable{trainer_class.__name__}", (ResumableDataMixin, trainer_class), {})
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Score every training example by its loss under the base model or a checkpoint.
+One batched no-grad pass over the tokenized training set; examples are sorted by
+length so batches carry little padding, and the loss is computed a chunk of
+tokens at a time. Writes per-example mean loss, token count and source file to
+scores.json, which training uses for pruning (see pruning.py).
+Usage: python score.py --config config/avorion.yaml
+       python score.py --config config/avorion.yaml --adapter adapters/avorion/checkpoint-200
+"""
+
+import argparse
+import os
+import sys
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+from pruning import scores_path, source_of, write_scores
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+def score_dataset(
+    model, dataset, pad_token_id: int, batch_size: int = 8, chunk_size: int = DEFAULT_CHUNK_SIZE
+):
+    """Mean next-token loss and token count of every tokenized example, in dataset order."""
+    import torch
+
+    from chunked_loss import IGNORE_INDEX, chunked_causal_lm_loss
+
+    lengths = [len(ids) for ids in dataset["input_ids"]]
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+    lm_head = model.get_output_embeddings()
+    device = next(model.parameters()).device
+    results = [None] * len(lengths)
+
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                indices = order[start : start + batch_size]
+                width = lengths[indices[0]]
+                input_ids = torch.full((len(indices), width), pad_token_id, dtype=torch.long)
+                attention_mask = torch.zeros_like(input_ids)
+                for row, index in enumerate(indices):
+                    input_ids[row, : lengths[index]] = torch.tensor(dataset[index]["input_ids"])
+                    attention_mask[row, : lengths[index]] = 1
+                labels = input_ids.masked_fill(attention_mask == 0, IGNORE_INDEX)
+
+                outputs = model(
+                    input_ids=input_ids.to(device),
+                    attention_mask=attention_mask.to(device),
+                    output_hidden_states=True,
+                    logits_to_keep=1,
+                    use_cache=False,
+                )
+                hidden = outputs.hidden_states[-1]
+                for row, index in enumerate(indices):
+                    loss = chunked_causal_lm_loss(
+                        hidden[row : row + 1], lm_head, labels[row : row + 1], chunk_size
+                    )
+                    results[index] = {"loss": loss.item(), "tokens": lengths[index]}
+    finally:
+        model.train(was_training)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score training examples by loss for pruning")
+    parser.add_argument("--config", required=True)
+    parser.add_argument(
+        "--adapter", help="Score with this adapter or checkpoint on top of the base model"
+    )
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument(
+        "--output",
+        help="Scores file (default: pruning.scores_file or scores.json next to the data)",
+    )
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    output = args.output or scores_path(config)
+
+    # Heavy imports happen after argument parsing so --help is instant
+    from peft import PeftModel
+
+    from preprocess import build_train_dataset
+    from train import load_base_model
+
+    model, tokenizer = load_base_model(config)
+    if args.adapter:
+        print(f"Loading adapter: {args.adapter}")
+        model = PeftModel.from_pretrained(model, args.adapter)
+
+    raw_dataset, dataset = build_train_dataset(config, tokenizer)
+    chunk_size = config["training"].get("loss_chunk_size") or DEFAULT_CHUNK_SIZE
+    scores = score_dataset(model, dataset, tokenizer.pad_token_id, args.batch_size, chunk_size)
+
+    source_key = config.get("pruning", {}).get("source_key", "metadata.file_path")
+    for score, example in zip(scores, raw_dataset, strict=True):
+        score["source"] = source_of(example, source_key)
+    write_scores(output, config, args.adapter or config["model"]["name"], scores)
+
+    losses = sorted(score["loss"] for score in scores)
+    print(
+        f"Scored {len(scores)} examples: loss min {losses[0]:.3f}, "
+        f"median {losses[len(losses) // 2]:.3f}, max {losses[-1]:.3f}"
+    )
+    print(f"Saved scores to {output}")
+
+
+if __name__ == "__main__":
+    main()
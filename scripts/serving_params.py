@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+vLLM serving parameters derived from the model, the data and the device.
+Reads the model's config.json for its context limit and KV-cache bytes per
+token, measures the token lengths of our examples, and sizes max_model_len,
+max_num_seqs, max_num_batched_tokens and tensor_parallel_size so that the
+weights, activations and the KV cache fit in gpu_memory_utilization of the
+device. Every choice is explained in a reasoning file written next to the
+vLLM config.
+"""
+
+import json
+import math
+import os
+import sys
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_serving import percentile
+from estimate import FRAMEWORK_OVERHEAD_BYTES, GIB, HARDWARE, ModelShape
+from smoke_client import format_prompt
+
+# Rough characters per token for code and English when no tokenizer is available
+CHARS_PER_TOKEN = 3.5
+# vLLM's default (and our upper bound) for concurrently scheduled sequences
+MAX_NUM_SEQS = 256
+# Weight bytes per linear parameter of quantized checkpoints (int4 includes group scales)
+QUANTIZED_BYTES_PER_PARAM = {"fp8": 1.0, "gptq": 0.53, "awq": 0.53}
+# Chunked-prefill token budget bounds: small budgets slow prefill, large ones stall decoding
+MIN_BATCHED_TOKENS = 2048
+MAX_BATCHED_TOKENS = 16384
+
+
+def round_up(value: float, multiple: int) -> int:
+    return int(math.ceil(value / multiple) * multiple)
+
+
+def context_limit(model_config: dict) -> int:
+    """The longest context the model supports, including static RoPE scaling (YaRN etc.)."""
+    config = model_config.get("text_config", model_config)
+    limit = config.get("max_position_embeddings") or 0
+    rope = config.get("rope_scaling") or {}
+    if rope.get("factor") and rope.get("original_max_position_embeddings"):
+        limit = max(limit, int(rope["original_max_position_embeddings"] * rope["factor"]))
+    return limit
+
+
+def attention_layers(model_config: dict) -> int:
+    """Layers that keep a per-token KV cache (hybrid models such as Qwen3-Next have linear-attention layers)."""
+    config = model_config.get("text_config", model_config)
+    layer_types = config.get("layer_types")
+    if layer_types:
+        return sum(kind != "linear_attention" for kind in layer_types)
+    return config["num_hidden_layers"]
+
+
+def kv_bytes_per_token(model_config: dict, kv_cache_dtype: str = "auto") -> int:
+    """KV-cache bytes one token occupies: K and V for every attention layer's KV heads."""
+    shape = ModelShape.from_config(model_config)
+    element_bytes = 1 if kv_cache_dtype.startswith("fp8") else 2
+    return 2 * attention_layers(model_config) * shape.num_kv_heads * shape.head_dim * element_bytes
+
+
+def weight_bytes(model_config: dict, model_dir=None, quantization=None) -> int:
+    """Bytes of weights to load: the safetensors on disk when available, else counted from the config."""
+    if model_dir is not None and any(Path(model_dir).glob("*.safetensors")):
+        return sum(path.stat().st_size for path in Path(model_dir).glob("*.safetensors"))
+    shape = ModelShape.from_config(model_config)
+    groups = shape.linear_groups()
+    linear = sum(group.params for group in groups if group.name != "router")
+    other = shape.embedding_params + sum(group.params for group in groups if group.name == "router")
+    return int(linear * QUANTIZED_BYTES_PER_PARAM.get(quantization, 2) + other * 2)
+
+
+def activation_bytes(model_config: dict, batched_tokens: int, max_num_seqs: int) -> int:
+    """Peak activation memory of one forward step over batched_tokens, plus fixed overhead."""
+    shape = ModelShape.from_config(model_config)
+    if shape.num_moe_layers:
+        mlp = (
+            shape.experts_per_token * shape.moe_intermediate_size
+            + shape.shared_expert_intermediate_size
+        )
+    else:
+        mlp = shape.intermediate_size
+    attention = (shape.num_heads + 2 * shape.num_kv_heads) * shape.head_dim
+    # Layers run one at a time, so only one layer's bf16 intermediates are live
+    per_token = 2 * (4 * shape.hidden_size + attention + 2 * mlp)
+    # fp32 logits of the one sampled position per sequence
+    logits = max_num_seqs * shape.vocab_size * 4
+    return int(batched_tokens * per_token + logits + FRAMEWORK_OVERHEAD_BYTES)
+
+
+def read_examples(configs: list[dict]) -> list[tuple[str, str]]:
+    """(prompt, full text) of every train and eval example the configs name that exist."""
+    texts = []
+    for config in configs:
+        template = config["prompt_template"]
+        for key in ("train_file", "eval_file"):
+            data_file = config["data"].get(key)
+            if not data_file or not Path(data_file).exists():
+                continue
+            with open(data_file) as f:
+                for line in f:
+                    if line.strip():
+                        example = json.loads(line)
+                        texts.append((format_prompt(template, example), template.format(**example)))
+    return texts
+
+
+def example_lengths(configs: list[dict], tokenizer=None) -> dict:
+    """Prompt and total (prompt plus response) token lengths of the examples."""
+    texts = read_examples(configs)
+    if not texts:
+        return {"prompt": [], "total": [], "counted_with": None}
+    prompts, totals = zip(*texts, strict=True)
+    if tokenizer is None:
+        count = [
+            [math.ceil(len(text) / CHARS_PER_TOKEN) for text in batch]
+            for batch in (prompts, totals)
+        ]
+        counted_with = f"~{CHARS_PER_TOKEN} characters per token (no tokenizer)"
+    else:
+        count = [
+            [len(ids) for ids in tokenizer(list(batch), add_special_tokens=False)["input_ids"]]
+            for batch in (prompts, totals)
+        ]
+        counted_with = "the model's tokenizer"
+    return {"prompt": count[0], "total": count[1], "counted_with": counted_with}
+
+
+def length_stats(lengths: list[int]) -> dict:
+    return {
+        "mean": sum(lengths) / len(lengths),
+        "p50": percentile(lengths, 50),
+        "p95": percentile(lengths, 95),
+        "p99": percentile(lengths, 99),
+        "max": max(lengths),
+    }
+
+
+def recommend(
+    model_config: dict,
+    weights: int,
+    lengths: dict,
+    hardware: str = "gb10",
+    gpus: int = 1,
+    gpu_memory_utilization: float = 0.9,
+    kv_cache_dtype: str = "auto",
+    headroom: float = 1.25,
+    min_context: int = 0,
+) -> dict:
+    """Serving parameters for the model on the device, with the reasoning behind each one."""
+    shape = ModelShape.from_config(model_config)
+    limit = context_limit(model_config)
+    kv_per_token = kv_bytes_per_token(model_config, kv_cache_dtype)
+    device_gib = HARDWARE[hardware][0]
+    reasoning = [
+        f"Device: {hardware}, {device_gib} GiB each, {gpus} available; vLLM may use "
+        f"gpu_memory_utilization={gpu_memory_utilization} of it.",
+        f"Weights: {weights / GIB:.2f} GiB. KV cache: {kv_per_token / 2**10:.1f} KiB per token "
+        f"(K and V x {attention_layers(model_config)} attention layers x {shape.num_kv_heads} KV heads "
+        f"x {shape.head_dim} dims, kv_cache_dtype={kv_cache_dtype}).",
+    ]
+
+    if lengths["total"]:
+        total, prompt = length_stats(lengths["total"]), length_stats(lengths["prompt"])
+        reasoning.append(
+            f"Examples ({len(lengths['total'])}, counted with {lengths['counted_with']}): prompt+response tokens "
+            f"p50 {total['p50']:.0f}, p95 {total['p95']:.0f}, p99 {total['p99']:.0f}, max {total['max']}; "
+            f"prompt tokens p95 {prompt['p95']:.0f}."
+        )
+        wanted = round_up(total["p99"] * headroom, 1024)
+        why = f"p99 length x {headroom} headroom, rounded up to 1024"
+        if min_context > wanted:
+            wanted, why = (
+                min_context,
+                "the training max_seq_length (the longest context the adapter has seen)",
+            )
+        mean_total, p95_prompt = max(total["mean"], 1), prompt["p95"]
+    else:
+        wanted, why = (
+            max(min_context, 1024),
+            "training max_seq_length (no examples found to measure)",
+        )
+        mean_total, p95_prompt = wanted / 2, wanted / 2
+        reasoning.append(
+            "No training or eval examples found; lengths assumed from training max_seq_length."
+        )
+
+    max_model_len = min(wanted, limit) if limit else wanted
+    reasoning.append(
+        f"max_model_len {max_model_len}: {why}"
+        + (
+            f", capped at the model's context limit {limit}."
+            if limit and wanted > limit
+            else f" (model limit {limit})."
+        )
+    )
+
+    batched = min(max(MIN_BATCHED_TOKENS, round_up(p95_prompt, 512)), MAX_BATCHED_TOKENS)
+
+    budget = tensor_parallel_size = None
+    for split in (1, 2, 4, 8):
+        if split > gpus or shape.num_heads % split:
+            continue
+        usable = device_gib * GIB * gpu_memory_utilization * split
+        # Each rank holds its share of the weights and runs the full step's activations
+        budget = usable - weights - activation_bytes(model_config, batched, MAX_NUM_SEQS) * split
+        tensor_parallel_size = split
+        if budget >= max_model_len * kv_per_token:
+            break
+    if budget is None or budget < min(max_model_len, 1024) * kv_per_token:
+        raise ValueError(
+            f"{weights / GIB:.1f} GiB of weights leave no room for a KV cache on {gpus} x {hardware} "
+            f"at gpu_memory_utilization={gpu_memory_utilization}; quantize the model or add GPUs"
+        )
+    kv_tokens = int(budget // kv_per_token)
+    reasoning.append(
+        f"tensor_parallel_size {tensor_parallel_size}: the smallest split whose memory holds the weights, "
+        f"activations for {batched} batched tokens and at least one max_model_len sequence; "
+        f"that leaves {budget / GIB:.2f} GiB for {kv_tokens} KV-cache tokens."
+    )
+    if kv_tokens < max_model_len:
+        max_model_len = kv_tokens // 1024 * 1024
+        reasoning.append(
+            f"max_model_len lowered to {max_model_len} so that one full sequence fits in the KV cache."
+        )
+
+    max_num_seqs = min(MAX_NUM_SEQS, max(1, int(kv_tokens // mean_total)))
+    if max_num_seqs >= 8:
+        max_num_seqs -= max_num_seqs % 8
+    reasoning.append(
+        f"max_num_seqs {max_num_seqs}: KV-cache tokens / mean example length ({mean_total:.0f}), "
+        f"so that many average requests run without preemption (capped at {MAX_NUM_SEQS})."
+    )
+    batched = max(batched, max_num_seqs)
+    reasoning.append(
+        f"max_num_batched_tokens {batched}: the p95 prompt ({p95_prompt:.0f} tokens) prefills in one step, "
+        f"kept within [{MIN_BATCHED_TOKENS}, {MAX_BATCHED_TOKENS}] so long prefills are chunked "
+        "instead of stalling decoding streams."
+    )
+
+    return {
+        "params": {
+            "max_model_len": max_model_len,
+            "max_num_seqs": max_num_seqs,
+            "max_num_batched_tokens": batched,
+            "gpu_memory_utilization": gpu_memory_utilization,
+            "tensor_parallel_size": tensor_parallel_size,
+        },
+        "kv_bytes_per_token": kv_per_token,
+        "kv_cache_tokens": kv_tokens,
+        "weight_bytes": weights,
+        "reasoning": reasoning,
+    }
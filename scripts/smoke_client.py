@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Smoke test a multi-LoRA vLLM server.
+Checks that every domain's adapter is listed by /v1/models, then sends each
+one a short completion built from the domain's first training example with the
+domain name as the model, so the request is routed to that adapter.
+Exits non-zero if any domain fails.
+Usage: python smoke_client.py --config config/avorion.yaml config/gdscript.yaml
+       python smoke_client.py --config config/avorion.yaml --url http://gpu-box:8000/v1 --max-tokens 64
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+DEFAULT_URL = "http://localhost:8000/v1"
+
+
+def request_json(url: str, payload=None, timeout: float = 60) -> dict:
+    """GET url, or POST payload to it as JSON, and decode the JSON response."""
+    data = None if payload is None else json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def format_prompt(template: str, example: dict) -> str:
+    """The prompt template filled with an example, up to where the response starts."""
+    return template.format(**{**example, "output": ""}).rstrip() + "\n"
+
+
+def domain_prompt(config: dict) -> str:
+    """The prompt for the domain's first training example."""
+    with open(config["data"]["train_file"]) as f:
+        example = json.loads(next(line for line in f if line.strip()))
+    return format_prompt(config["prompt_template"], example)
+
+
+def smoke_test(
+    url: str, configs: list[dict], max_tokens: int = 32, timeout: float = 60
+) -> list[dict]:
+    """Send one completion per domain adapter; returns one result per domain."""
+    served = {model["id"] for model in request_json(f"{url}/models", timeout=timeout)["data"]}
+    results = []
+    for config in configs:
+        domain = config["domain"]
+        result = {"domain": domain, "served": domain in served}
+        start = time.perf_counter()
+        try:
+            response = request_json(
+                f"{url}/completions",
+                {
+                    "model": domain,
+                    "prompt": domain_prompt(config),
+                    "max_tokens": max_tokens,
+                    "temperature": 0,
+                },
+                timeout,
+            )
+            result["text"] = response["choices"][0]["text"]
+            result["model"] = response.get("model")
+        except (urllib.error.URLError, KeyError, IndexError) as error:
+            result["error"] = str(error)
+        result["seconds"] = time.perf_counter() - start
+        result["ok"] = (
+            result["served"] and result.get("model") == domain and bool(result.get("text"))
+        )
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Send one request per domain adapter to a vLLM server"
+    )
+    parser.add_argument(
+        "--config", required=True, nargs="+", help="Domain configs whose adapters are served"
+    )
+    parser.add_argument("--url", default=DEFAULT_URL, help="OpenAI-compatible base URL")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    results = smoke_test(
+        args.url, [load_config(path) for path in args.config], args.max_tokens, args.timeout
+    )
+    for result in results:
+        status = "OK  " if result["ok"] else "FAIL"
+        detail = result.get("error") or repr(result["text"][:60])
+        listed = "" if result["served"] else " (not listed by /models)"
+        print(f"[{status}] {result['domain']}: {result['seconds']:.2f}s {detail}{listed}")
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
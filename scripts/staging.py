@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Zero-copy staging of a model directory.
+Each file is linked rather than copied, trying a hardlink, then a reflink
+(copy-on-write clone, where the filesystem supports it), then a symlink, and
+copying only as a last resort. Files already staged are skipped: a link to the
+same inode is recognised directly, anything else by size and then SHA-256.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+STRATEGIES = ("hardlink", "reflink", "symlink", "copy")
+
+# Linux ioctl that clones a file's extents (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+
+def file_hash(path, chunk_size: int = 16 * 2**20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink(source: Path, target: Path):
+    """Clone source into target without copying data; raises OSError where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, "reflinks need fcntl") from None
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            target.unlink()
+            raise
+
+
+def stage_file(source: Path, target: Path, strategies=STRATEGIES) -> str:
+    """Place source at target with the first strategy that works; returns its name."""
+    for strategy in strategies:
+        try:
+            if strategy == "hardlink":
+                os.link(source, target)
+            elif strategy == "reflink":
+                reflink(source, target)
+            elif strategy == "symlink":
+                os.symlink(source.resolve(), target)
+            else:
+                shutil.copy2(source, target)
+            return strategy
+        except OSError:
+            if strategy == strategies[-1]:
+                raise
+    raise ValueError("No staging strategy given")
+
+
+def is_staged(source: Path, target: Path) -> bool:
+    """True if target already holds the same content as source."""
+    if not target.exists():
+        return False
+    if os.path.samefile(source, target):
+        return True
+    return target.stat().st_size == source.stat().st_size and file_hash(target) == file_hash(source)
+
+
+def stage_directory(
+    source_dir, target_dir, strategies=STRATEGIES, keep=(), recursive: bool = True
+) -> dict:
+    """Mirror source_dir into target_dir without copying data where possible.
+
+    Files in target_dir that are not in source_dir are removed, except names in keep.
+    With recursive=False only the top-level files are staged (e.g. an adapter without its checkpoints).
+    Returns how many files each strategy staged, how many were unchanged and the bytes copied.
+    """
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    counts = dict.fromkeys(strategies, 0)
+    counts.update(unchanged=0, bytes_copied=0)
+
+    pattern = "**/*" if recursive else "*"
+    wanted = set()
+    for source in sorted(path for path in source_dir.glob(pattern) if path.is_file()):
+        relative = source.relative_to(source_dir)
+        if relative.as_posix() in keep:
+            continue
+        wanted.add(relative)
+        target = target_dir / relative
+        if is_staged(source, target):
+            counts["unchanged"] += 1
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists() or target.is_symlink():
+            target.unlink()
+        strategy = stage_file(source, target, strategies)
+        counts[strategy] += 1
+        if strategy == "copy":
+            counts["bytes_copied"] += source.stat().st_size
+
+    for target in sorted(target_dir.glob(pattern), reverse=True):
+        relative = target.relative_to(target_dir)
+        if (
+            (target.is_file() or target.is_symlink())
+            and relative not in wanted
+            and relative.as_posix() not in keep
+        ):
+            target.unlink()
+    return counts
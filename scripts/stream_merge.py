@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Streaming LoRA merge over safetensors shards.
+Reads the base checkpoint one shard at a time, adds (B @ A) * scaling to every
+weight the adapter targets and writes the shard back out, so peak memory is one
+shard plus the adapter rather than the whole model. The arithmetic follows
+PEFT's merge_and_unload (fp32 delta added in place to the weight in the output
+dtype), so the merged weights are bit-identical to it. LoRA on fused MoE experts
+(PEFT's target_parameters) is split per expert onto the checkpoint's
+experts.N.gate_proj/up_proj/down_proj weights.
+Shards are independent: with workers > 1 they are merged on a process pool,
+starting a shard only while the estimated memory of the shards in flight stays
+within the memory budget.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lora_placement import FUSED_PROJECTIONS
+
+DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+# Bytes per element of non-float safetensors dtypes (kept as they are)
+DTYPE_SIZES = {
+    "I64": 8,
+    "I32": 4,
+    "I16": 2,
+    "I8": 1,
+    "U8": 1,
+    "BOOL": 1,
+    "F8_E4M3": 1,
+    "F8_E5M2": 1,
+}
+
+INDEX_NAME = "model.safetensors.index.json"
+SINGLE_SHARD_NAME = "model.safetensors"
+ADAPTER_PREFIX = "base_model.model."
+LORA_KEY = re.compile(r"^(?P<module>.+)\.lora_(?P<part>[AB])\.weight$")
+
+
+@dataclass
+class LoraDelta:
+    """The low-rank update of one base weight, or of a stack of fused expert weights."""
+
+    lora_a: torch.Tensor
+    lora_b: torch.Tensor
+    scaling: float
+    fan_in_fan_out: bool
+    module: str = ""  # the adapter module holding lora_A and lora_B
+    # fused stacks: lora_A is expert-major (E * r, in), lora_B expert-minor (out, r * E)
+    experts: int = 1
+    fused: bool = False  # a fused stack or one expert's slice of it (PEFT's ParamWrapper)
+
+    def expert_deltas(self) -> list["LoraDelta"]:
+        """The per-expert updates of a fused stack (the delta itself for a plain module)."""
+        return [
+            replace(self, lora_a=lora_a, lora_b=lora_b, experts=1)
+            for lora_a, lora_b in expert_factors(self.lora_a, self.lora_b, self.experts)
+        ]
+
+    def delta(self) -> torch.Tensor:
+        if self.experts > 1:
+            return torch.stack([expert.delta() for expert in self.expert_deltas()])
+        # PEFT upcasts (b)float16 adapters to fp32 on load and merges in the adapter dtype
+        lora_a, lora_b = self.lora_a, self.lora_b
+        if lora_a.dtype in (torch.float16, torch.bfloat16):
+            lora_a, lora_b = lora_a.float(), lora_b.float()
+        delta = lora_b @ lora_a
+        if self.fan_in_fan_out:
+            delta = delta.T
+        return delta * self.scaling
+
+
+def expert_factors(
+    lora_a: torch.Tensor, lora_b: torch.Tensor, experts: int
+) -> list[tuple[torch.Tensor, torch.Tensor]]:
+    """Split the factors of a fused expert stack into one (A, B) pair per expert."""
+    lora_a = lora_a.reshape(experts, -1, lora_a.shape[-1])
+    lora_b = lora_b.reshape(lora_b.shape[0], -1, experts)
+    return [(lora_a[expert], lora_b[:, :, expert]) for expert in range(experts)]
+
+
+def fused_factors(
+    factors: list[tuple[torch.Tensor, torch.Tensor]],
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Stack per-expert (A, B) pairs of equal rank back into fused factors (the inverse of expert_factors)."""
+    lora_a = torch.cat([lora_a for lora_a, _ in factors])
+    lora_b = torch.stack([lora_b for _, lora_b in factors], dim=2).flatten(1)
+    return lora_a, lora_b
+
+
+def resolve_model_dir(name_or_path: str) -> Path:
+    """Local directory of a model, downloading the hub snapshot (safetensors only) if needed."""
+    if os.path.isdir(name_or_path):
+        return Path(name_or_path)
+    from huggingface_hub import snapshot_download
+
+    return Path(
+        snapshot_download(
+            name_or_path, ignore_patterns=["*.bin", "*.pt", "*.pth", "*.gguf", "original/*"]
+        )
+    )
+
+
+def pattern_value(patterns: dict, module: str, default):
+    """PEFT rank_pattern/alpha_pattern lookup: a key matches a module name suffix."""
+    for pattern, value in patterns.items():
+        if re.match(rf"(.*\.)?{pattern}$", module):
+            return value
+    return default
+
+
+def adapter_targets(config: dict, modules) -> dict[str, str]:
+    """Map adapter modules to the base weight PEFT keys them by (rank_pattern, alpha_pattern).
+
+    A plain module adapts its own weight. Fused experts (target_parameters) get one nested
+    ParamWrapper per parameter, wrapped in the order the experts module registers them, so the
+    first (gate_up_proj) is the innermost: experts.base_layer.lora_A next to down_proj's experts.lora_A.
+    """
+    targets = {module: module for module in modules}
+    stacks = {}
+    for module in modules:
+        stack = module.replace(".base_layer", "")
+        if stack.rsplit(".", 1)[-1] == "experts":
+            stacks.setdefault(stack, []).append(module)
+    target_parameters = config.get("target_parameters") or []
+    for stack, levels in stacks.items():
+        parameters = [
+            name
+            for name in FUSED_PROJECTIONS
+            if any(
+                f"{stack}.{name}" == t or f"{stack}.{name}".endswith(f".{t}")
+                for t in target_parameters
+            )
+        ]
+        if len(parameters) != len(levels):
+            raise ValueError(
+                f"Cannot tell which fused expert weights the {len(levels)} LoRA pairs of {stack} adapt "
+                f"(target_parameters: {target_parameters}); use --in-memory"
+            )
+        for module in levels:
+            targets[module] = (
+                f"{stack}.{parameters[len(parameters) - 1 - module.count('.base_layer')]}"
+            )
+    return targets
+
+
+def lora_scaling(config: dict, target: str) -> tuple[int, float]:
+    """PEFT's rank and scaling of one target, after rank_pattern, alpha_pattern and rsLoRA."""
+    rank = pattern_value(config.get("rank_pattern") or {}, target, config["r"])
+    alpha = pattern_value(config.get("alpha_pattern") or {}, target, config["lora_alpha"])
+    return rank, alpha / math.sqrt(rank) if config.get("use_rslora") else alpha / rank
+
+
+def load_adapter(adapter_dir, base_shapes=None) -> dict[str, LoraDelta]:
+    """Map base weight names to their LoRA update, refusing adapters that are not plain LoRA.
+
+    Fused expert updates are keyed by their stacked parameter (experts.gate_up_proj) unless
+    base_shapes (checkpoint name -> shape) is given, which splits them into the checkpoint's
+    per-expert weights (see split_fused_experts).
+    """
+    adapter_dir = Path(adapter_dir)
+    config = json.loads((adapter_dir / "adapter_config.json").read_text())
+    if config.get("use_dora"):
+        raise ValueError(
+            "Streaming merge supports plain LoRA only; this adapter uses DoRA (use --in-memory)"
+        )
+    tensors = load_file(adapter_dir / "adapter_model.safetensors")
+
+    pairs = {}
+    for key, tensor in tensors.items():
+        match = LORA_KEY.match(key.removeprefix(ADAPTER_PREFIX))
+        if match is None:
+            raise ValueError(
+                f"Streaming merge cannot apply adapter tensor {key} (modules_to_save, bias or embedding "
+                "adapters); use --in-memory"
+            )
+        pairs.setdefault(match["module"], {})[match["part"]] = tensor
+
+    deltas = {}
+    for module, target in adapter_targets(config, pairs).items():
+        pair = pairs[module]
+        rank, scaling = lora_scaling(config, target)
+        if target == module:
+            deltas[f"{module}.weight"] = LoraDelta(
+                pair["A"], pair["B"], scaling, config.get("fan_in_fan_out", False), module
+            )
+        else:
+            deltas[target] = LoraDelta(
+                pair["A"],
+                pair["B"],
+                scaling,
+                False,
+                module,
+                experts=pair["A"].shape[0] // rank,
+                fused=True,
+            )
+    return deltas if base_shapes is None else split_fused_experts(deltas, base_shapes)
+
+
+def split_fused_experts(
+    deltas: dict[str, LoraDelta], base_shapes: dict[str, tuple]
+) -> dict[str, LoraDelta]:
+    """Key fused expert updates by the checkpoint weights they merge into.
+
+    transformers stacks per-expert checkpoint weights (experts.N.gate_proj and up_proj, in that
+    order, into gate_up_proj[N]) on load and splits them again on save, so each expert's update
+    is sliced by rows into its projections. Checkpoints that store the stacked tensor keep it whole.
+    """
+    split = {}
+    for key, delta in deltas.items():
+        if not delta.fused or key in base_shapes:
+            if delta.fused and base_shapes[key] != (
+                delta.experts,
+                delta.lora_b.shape[0],
+                delta.lora_a.shape[1],
+            ):
+                raise ValueError(
+                    f"{key} is stored as {base_shapes[key]} in the base checkpoint; use --in-memory"
+                )
+            split[key] = delta
+            continue
+        stack, parameter = key.rsplit(".", 1)
+        out_features, in_features = delta.lora_b.shape[0], delta.lora_a.shape[1]
+        for expert, expert_delta in enumerate(delta.expert_deltas()):
+            row = 0
+            for projection in FUSED_PROJECTIONS[parameter]:
+                name = f"{stack}.{expert}.{projection}.weight"
+                shape = base_shapes.get(name)
+                if shape is None or shape[1] != in_features or row + shape[0] > out_features:
+                    raise ValueError(
+                        f"Cannot merge {key} ({out_features} x {in_features} per expert): the base checkpoint "
+                        f"has {name} {'missing' if shape is None else tuple(shape)}; use --in-memory"
+                    )
+                split[name] = replace(
+                    expert_delta, lora_b=expert_delta.lora_b[row : row + shape[0]]
+                )
+                row += shape[0]
+            if row != out_features:
+                raise ValueError(
+                    f"{key} has {out_features} outputs per expert, {stack}.{expert} only {row}"
+                )
+    return split
+
+
+def checkpoint_shapes(model_dir: Path, names: list[str]) -> dict[str, tuple]:
+    """Every tensor's shape in a checkpoint, from the shard headers."""
+    shapes = {}
+    for name in names:
+        with safe_open(model_dir / name, framework="pt") as shard:
+            for key in shard.keys():  # noqa: SIM118 - safe_open handles are not iterable
+                shapes[key] = tuple(shard.get_slice(key).get_shape())
+    return shapes
+
+
+def shard_names(model_dir: Path) -> list[str]:
+    """Safetensors shard file names of a checkpoint, in index order."""
+    index = model_dir / INDEX_NAME
+    if index.exists():
+        return sorted(set(json.loads(index.read_text())["weight_map"].values()))
+    if (model_dir / SINGLE_SHARD_NAME).exists():
+        return [SINGLE_SHARD_NAME]
+    raise FileNotFoundError(f"No safetensors weights in {model_dir}")
+
+
+def merge_shard(
+    source: Path, target: Path, deltas: dict[str, LoraDelta], dtype: torch.dtype
+) -> dict:
+    """Merge the adapter into the weights of one shard and write it to target."""
+    merged = []
+    tensors = {}
+    with safe_open(source, framework="pt") as shard:
+        metadata = shard.metadata() or {}
+        for key in shard.keys():  # noqa: SIM118 - safe_open handles are not iterable
+            tensor = shard.get_tensor(key)
+            if tensor.is_floating_point():
+                tensor = tensor.to(dtype)
+            if key in deltas:
+                delta = deltas[key].delta()
+                # PEFT's ParamWrapper rounds the update to the weight dtype before adding it
+                tensor += delta.to(tensor.dtype) if deltas[key].fused else delta
+                merged.append(key)
+            tensors[key] = tensor
+    save_file(tensors, target, metadata={**metadata, "format": "pt"})
+    return {
+        "shard": source.name,
+        "merged": merged,
+        "tensors": {
+            key: tensor.nelement() * tensor.element_size() for key, tensor in tensors.items()
+        },
+    }
+
+
+def shard_peak_bytes(source: Path, dtype: torch.dtype, adapter_bytes: int) -> int:
+    """Estimated peak memory of merging one shard: the larger of input and output, plus the adapter."""
+    output_bytes = 0
+    with safe_open(source, framework="pt") as shard:
+        for key in shard.keys():  # noqa: SIM118 - safe_open handles are not iterable
+            tensor = shard.get_slice(key)
+            numel = math.prod(tensor.get_shape())
+            floating = tensor.get_dtype() in ("F16", "BF16", "F32", "F64")
+            output_bytes += numel * (
+                dtype.itemsize if floating else DTYPE_SIZES.get(tensor.get_dtype(), 4)
+            )
+    return max(output_bytes, os.path.getsize(source)) + adapter_bytes
+
+
+_worker_deltas = None
+
+
+def _init_worker(adapter_dir, threads: int, base_shapes: dict[str, tuple]):
+    global _worker_deltas
+    torch.set_num_threads(threads)
+    _worker_deltas = load_adapter(adapter_dir, base_shapes)
+
+
+def _merge_shard_in_worker(source: Path, target: Path, dtype: torch.dtype) -> dict:
+    return merge_shard(source, target, _worker_deltas, dtype)
+
+
+def merge_shards_parallel(
+    jobs: list[tuple], adapter_dir, workers: int, memory_budget=None, base_shapes=None
+) -> tuple[list[dict], int]:
+    """Merge (source, target, dtype, peak_bytes) jobs on a process pool within memory_budget bytes.
+
+    base_shapes are the checkpoint's tensor shapes, which the workers need to split fused experts.
+
+    Returns the results in job order and the largest estimated memory in flight at once.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    pending = list(jobs)
+    in_flight = {}
+    results = {}
+    max_in_flight = 0
+    # Spawned workers start clean instead of inheriting the parent's torch thread pools
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(adapter_dir, threads, base_shapes),
+    ) as pool:
+        while pending or in_flight:
+            # Always run at least one shard, even if it alone exceeds the budget
+            while (
+                pending
+                and len(in_flight) < workers
+                and (
+                    not in_flight
+                    or memory_budget is None
+                    or sum(in_flight.values()) + pending[0][3] <= memory_budget
+                )
+            ):
+                source, target, dtype, peak = pending.pop(0)
+                in_flight[pool.submit(_merge_shard_in_worker, source, target, dtype)] = peak
+            max_in_flight = max(max_in_flight, sum(in_flight.values()))
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                result = future.result()
+                results[result["shard"]] = result
+                print(
+                    f"[{len(results)}/{len(jobs)}] {result['shard']}: merged {len(result['merged'])} weights"
+                )
+    return [results[source.name] for source, *_ in jobs], max_in_flight
+
+
+def copy_model_files(model_dir: Path, output_dir: Path, dtype_name: str):
+    """Copy config, tokenizer and other non-weight files, recording the merged dtype."""
+    for path in model_dir.iterdir():
+        if path.is_file() and not path.name.endswith(".safetensors") and path.name != INDEX_NAME:
+            shutil.copy2(path, output_dir / path.name)
+    config_file = output_dir / "config.json"
+    if config_file.exists():
+        config = json.loads(config_file.read_text())
+        for key in [key for key in ("torch_dtype", "dtype") if key in config] or ["torch_dtype"]:
+            config[key] = dtype_name
+        config_file.write_text(json.dumps(config, indent=2) + "\n")
+
+
+def write_index(output_dir: Path, results: list[dict]):
+    """Write model.safetensors.index.json for the merged shards."""
+    weight_map = {key: result["shard"] for result in results for key in result["tensors"]}
+    total_size = sum(size for result in results for size in result["tensors"].values())
+    index = {"metadata": {"total_size": total_size}, "weight_map": dict(sorted(weight_map.items()))}
+    (output_dir / INDEX_NAME).write_text(json.dumps(index, indent=2) + "\n")
+
+
+def check_all_merged(deltas: dict[str, LoraDelta], results: list[dict]):
+    merged = {key for result in results for key in result["merged"]}
+    missing = sorted(set(deltas) - merged)
+    if missing:
+        raise ValueError(
+            f"{len(missing)} adapter targets are not in the base checkpoint, e.g. {missing[0]}"
+        )
+
+
+def stream_merge(
+    base: str, adapter_dir, output_dir, dtype: str = "float16", workers: int = 1, memory_budget=None
+) -> dict:
+    """Merge an adapter into a base checkpoint shard by shard; returns a summary.
+
+    memory_budget (bytes) limits how many shards are merged at once when workers > 1.
+    """
+    start = time.perf_counter()
+    model_dir = resolve_model_dir(base)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    names = shard_names(model_dir)
+    base_shapes = checkpoint_shapes(model_dir, names)
+    deltas = load_adapter(adapter_dir, base_shapes)
+    adapter_bytes = os.path.getsize(Path(adapter_dir) / "adapter_model.safetensors")
+    workers = max(1, min(workers, len(names)))
+
+    max_in_flight = None
+    if workers == 1:
+        results = []
+        for number, name in enumerate(names, 1):
+            results.append(merge_shard(model_dir / name, output_dir / name, deltas, DTYPES[dtype]))
+            print(f"[{number}/{len(names)}] {name}: merged {len(results[-1]['merged'])} weights")
+    else:
+        jobs = [
+            (
+                model_dir / name,
+                output_dir / name,
+                DTYPES[dtype],
+                shard_peak_bytes(model_dir / name, DTYPES[dtype], adapter_bytes),
+            )
+            for name in names
+        ]
+        results, max_in_flight = merge_shards_parallel(
+            jobs, adapter_dir, workers, memory_budget, base_shapes
+        )
+
+    check_all_merged(deltas, results)
+    if len(names) > 1 or (model_dir / INDEX_NAME).exists():
+        write_index(output_dir, results)
+    copy_model_files(model_dir, output_dir, dtype)
+    input_bytes = sum(os.path.getsize(model_dir / name) for name in names)
+    return {
+        "shards": len(names),
+        "merged": len(deltas),
+        "workers": workers,
+        "input_bytes": input_bytes,
+        "largest_shard_bytes": max(os.path.getsize(model_dir / name) for name in names),
+        "adapter_bytes": adapter_bytes,
+        "max_in_flight_bytes": max_in_flight,
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Throughput and memory telemetry for training runs.
+Records per-step phase timings, token counts and peak memory to a JSONL file
+and appends a run summary when training ends.
+"""
+
+import json
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import torch
+from transformers import TrainerCallback
+
+
+def peak_memory() -> dict:
+    """Return peak allocated/reserved memory in MB (CUDA, or process RSS on CPU)."""
+    if torch.cuda.is_available():
+        return {
+            "device": "cuda",
+            "peak_allocated_mb": torch.cuda.max_memory_allocated() / 2**20,
+            "peak_reserved_mb": torch.cuda.max_memory_reserved() / 2**20,
+        }
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+    return {"device": "cpu", "peak_allocated_mb": rss_mb, "peak_reserved_mb": rss_mb}
+
+
+def summarize_steps(records: list[dict]) -> dict:
+    """Aggregate per-step telemetry records into a run summary."""
+    if not records:
+        return {"event": "summary", "steps": 0}
+
+    step_times = [r["step_s"] for r in records]
+    total_time = sum(step_times)
+    tokens = sum(r["tokens"] for r in records)
+    padded = sum(r["padded_tokens"] for r in records)
+    quantiles = statistics.quantiles(step_times, n=20) if len(step_times) > 1 else step_times * 19
+    return {
+        "event": "summary",
+        "steps": len(records),
+        "total_s": total_time,
+        "tokens": tokens,
+        "tokens_per_s": tokens / total_time if total_time else 0.0,
+        "step_s_p50": statistics.median(step_times),
+        "step_s_p95": quantiles[18],
+        "data_fraction": sum(r["data_s"] for r in records) / total_time if total_time else 0.0,
+        "optimizer_fraction": (
+            sum(r["optimizer_s"] for r in records) / total_time if total_time else 0.0
+        ),
+        "padding_fraction": 1 - tokens / padded if padded else 0.0,
+        "device": records[-1]["device"],
+        "peak_allocated_mb": max(r["peak_allocated_mb"] for r in records),
+        "peak_reserved_mb": max(r["peak_reserved_mb"] for r in records),
+    }
+
+
+class TelemetryCallback(TrainerCallback):
+    """Trainer callback that writes per-step throughput and memory telemetry.
+
+    Each optimizer step is split into three phases:
+    - data: from the end of the previous step (after any logging, eval or save)
+      until the step begins, which is where the Trainer fetches batches
+    - fwd_bwd: forward and backward passes for every micro-batch
+    - optimizer: the optimizer step itself
+    Token counts come from a forward pre-hook on the model, so they are correct
+    regardless of how many dataloader workers run the collator.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = Path(output_path)
+        self.records = []
+        self._active = False  # rank 0 between train begin and end
+        self._hook = None
+        self._mark = None
+        self._times = {}
+        self._tokens = 0
+        self._padded_tokens = 0
+
+    def _now(self) -> float:
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _count_tokens(self, module, args, kwargs):
+        if not module.training:
+            return
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if input_ids is None:
+            return
+        mask = kwargs.get("attention_mask")
+        self._padded_tokens += input_ids.numel()
+        self._tokens += int(mask.sum()) if mask is not None else input_ids.numel()
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.output_path.write_text("")
+        self._active = True
+        if model is not None:
+            self._hook = model.register_forward_pre_hook(self._count_tokens, with_kwargs=True)
+        self._mark = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if not self._active:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._times = {"begin": self._now()}
+        self._tokens = 0
+        self._padded_tokens = 0
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        if self._active:
+            self._times["pre_optimizer"] = self._now()
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        if self._active:
+            self._times["optimizer"] = self._now()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if not self._active or "begin" not in self._times:
+            return
+        end = self._now()
+        begin = self._times["begin"]
+        pre_optimizer = self._times.get("pre_optimizer", end)
+        optimizer = self._times.get("optimizer", pre_optimizer)
+        data_s = begin - self._mark
+        step_s = data_s + (end - begin)
+
+        record = {
+            "event": "step",
+            "step": state.global_step,
+            "epoch": state.epoch,
+            "data_s": data_s,
+            "fwd_bwd_s": pre_optimizer - begin,
+            "optimizer_s": optimizer - pre_optimizer,
+            "step_s": step_s,
+            "tokens": self._tokens,
+            "padded_tokens": self._padded_tokens,
+            "padding_fraction": (
+                1 - self._tokens / self._padded_tokens if self._padded_tokens else 0.0
+            ),
+            "tokens_per_s": self._tokens / step_s if step_s else 0.0,
+            **peak_memory(),
+        }
+        self.records.append(record)
+        self._write(record)
+        self._mark = self._now()
+
+    def _write(self, record: dict):
+        # Appended line by line, so the file is readable while training runs
+        with open(self.output_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _reset_mark(self):
+        # Logging, evaluation and saving happen after on_step_end; keep them out
+        # of the next step's data time.
+        if self._active:
+            self._mark = self._now()
+
+    def on_log(self, args, state, control, **kwargs):
+        self._reset_mark()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._reset_mark()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._reset_mark()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if not self._active:
+            return
+        summary = summarize_steps(self.records)
+        self._write(summary)
+        self._active = False
+        if self._hook is not None:
+            self._hook.remove()
+            self._hook = None
+        if summary["steps"]:
+            print(
+                f"Telemetry: {summary['tokens_per_s']:.0f} tokens/s, "
+                f"p50 step {summary['step_s_p50']:.3f}s, "
+                f"data {summary['data_fraction']:.1%}, "
+                f"padding {summary['padding_fraction']:.1%}, "
+                f"peak {summary['peak_allocated_mb']:.0f} MB ({summary['device']}) "
+                f"-> {self.output_path}"
+            )
+
+
+def telemetry_callbacks(config: dict) -> list:
+    """Return the telemetry callback unless it is disabled in the config."""
+    if not config["output"].get("telemetry", True):
+        return []
+    return [TelemetryCallback(Path(config["output"]["adapter_dir"]) / "telemetry.jsonl")]
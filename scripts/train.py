@@ -3,124 +3,255 @@
 Train a LoRA adapter for a specific domain.
 Usage: python train.py --config config/avorion.yaml
        python train.py --config config/gdscript.yaml
+       python train.py --config config/avorion.yaml config/gdscript.yaml
 """
 
 import argparse
-import torch
-import yaml
-from datasets import load_dataset
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-    TrainingArguments,
-)
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
-from trl import SFTTrainer
-
-
-def load_config(config_path: str, base_path: str = "config/base.yaml") -> dict:
-    """Load and merge base + domain configs."""
-    with open(base_path) as f:
-        config = yaml.safe_load(f)
-    with open(config_path) as f:
-        domain_config = yaml.safe_load(f)
-
-    # Deep merge
-    for key, value in domain_config.items():
-        if isinstance(value, dict) and key in config:
-            config[key].update(value)
-        else:
-            config[key] = value
-    return config
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--config", required=True, help="Path to domain config")
-    parser.add_argument("--resume", type=str, help="Resume from checkpoint")
-    args = parser.parse_args()
+import gc
+import os
+import sys
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+from distributed import distributed_mode, log
+from estimate import HARDWARE, estimate_training, format_estimate, load_model_config
+
+# torch, transformers, peft, trl and datasets are imported inside the functions
+# that need them, so --help, --estimate and config checks start instantly.
+
+
+# Settings applied to the base model when it is loaded and prepared, so configs
+# trained on one load must agree on them; None compares every key of the section
+SHARED_SETTINGS = {
+    "model": ("name", "load_in_4bit"),
+    "training": ("attn_implementation", "gradient_checkpointing", "checkpoint_every"),
+    "distributed": None,
+}
+
+
+def check_shared_base(configs: list[dict]):
+    """Ensure every config trains against the same base model settings."""
+    first = configs[0]
+    for config in configs[1:]:
+        for section, keys in SHARED_SETTINGS.items():
+            ours, theirs = first.get(section) or {}, config.get(section) or {}
+            for key in keys or sorted(set(ours) | set(theirs)):
+                if theirs.get(key) != ours.get(key):
+                    raise ValueError(
+                        f"{config['domain']} uses {section}.{key}={theirs.get(key)!r}, "
+                        f"but {first['domain']} uses {ours.get(key)!r}; configs trained "
+                        "together must share one base model"
+                    )
 
-    config = load_config(args.config)
-    print(f"Training LoRA for: {config['domain']}")
-    print(f"Base model: {config['model']['name']}")
+
+def load_base_model(config: dict):
+    """Load, quantize and prepare the base model and its tokenizer."""
+    import torch
+    from peft import prepare_model_for_kbit_training
+    from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+
+    from distributed import model_placement, prepare_model_loading
+    from long_context import apply_gradient_checkpointing, resolve_attn_implementation
 
     # Quantization
+    quantization = {}
+    if distributed_mode(config) == "fsdp":
+        # FSDP flattens each wrapped unit into one buffer, so packed weights need a float dtype
+        quantization["bnb_4bit_quant_storage"] = torch.bfloat16
     bnb_config = BitsAndBytesConfig(
         load_in_4bit=config["model"]["load_in_4bit"],
         bnb_4bit_quant_type="nf4",
         bnb_4bit_compute_dtype=torch.bfloat16,
         bnb_4bit_use_double_quant=True,
+        **quantization,
     )
 
     # Load model
-    print("Loading model...")
+    log("Loading model...")
+    prepare_model_loading(config)
     model = AutoModelForCausalLM.from_pretrained(
         config["model"]["name"],
         quantization_config=bnb_config,
-        device_map="auto",
         trust_remote_code=True,
+        attn_implementation=resolve_attn_implementation(
+            config["training"].get("attn_implementation", "sdpa")
+        ),
+        **model_placement(config),
     )
-    model = prepare_model_for_kbit_training(model)
+    model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=False)
+    mode = apply_gradient_checkpointing(model, config)
+    log(f"Gradient checkpointing: {mode}")
 
     tokenizer = AutoTokenizer.from_pretrained(config["model"]["name"])
     tokenizer.pad_token = tokenizer.eos_token
+    return model, tokenizer
+
+
+def train_adapter(model, tokenizer, config: dict, args):
+    """Train and save one domain adapter on a loaded base model.
+
+    Returns the base model with the adapter removed again, so the next
+    config can attach its own adapter without reloading the weights.
+    """
+    import torch
+    from peft import LoraConfig, get_peft_model
+    from trl import SFTConfig, SFTTrainer
+
+    from async_checkpoint import checkpoint_callbacks
+    from autotune import autotune_batch_size
+    from chunked_loss import chunked_loss_trainer
+    from distributed import distributed_arguments, is_main_process, main_process_first, save_adapter
+    from evaluation import build_eval_dataset, early_stopping_callbacks, evaluation_arguments
+    from lora_placement import resolve_placement, restrict_fused_experts
+    from preprocess import build_train_dataset, format_batch
+    from pruning import pruned_indices, pruning_enabled
+    from resume import DataloaderStateCallback, resumable_trainer
+    from telemetry import telemetry_callbacks
+
+    log(f"Training LoRA for: {config['domain']}")
+
+    # Dataset, formatted and tokenized in batches across data.num_proc processes
+    with main_process_first():
+        raw_dataset, dataset = build_train_dataset(config, tokenizer)
+        eval_dataset = build_eval_dataset(config, tokenizer)
+    if pruning_enabled(config):
+        kept = pruned_indices(config)
+        raw_dataset, dataset = raw_dataset.select(kept), dataset.select(kept)
+    has_eval = eval_dataset is not None
+    log(f"Training on {len(dataset)} examples")
 
-    # LoRA
+    # LoRA, placed on the modules selected by lora.placement (MoE models)
+    routing_examples = None
+    if config["lora"].get("placement") == "top_k_experts":
+        routing_examples = dataset.select(
+            range(min(config["lora"].get("routing_samples", 256), len(dataset)))
+        )
+    placement = resolve_placement(model, config, routing_examples)
+    dropout = config["lora"]["dropout"]
+    if placement.fused_experts and dropout:
+        log(f"lora.dropout={dropout} ignored: PEFT cannot apply dropout to fused expert weights")
+        dropout = 0.0
     lora_config = LoraConfig(
         r=config["lora"]["r"],
         lora_alpha=config["lora"]["alpha"],
-        target_modules=config["lora"]["target_modules"],
-        lora_dropout=config["lora"]["dropout"],
+        target_modules=placement.target_modules,
+        target_parameters=placement.target_parameters or None,
+        lora_dropout=dropout,
         bias="none",
         task_type="CAUSAL_LM",
     )
 
     model = get_peft_model(model, lora_config)
-    model.print_trainable_parameters()
+    restrict_fused_experts(model, placement.experts)
+    if is_main_process():
+        model.print_trainable_parameters()
 
-    # Dataset
-    dataset = load_dataset(
-        "json", data_files=config["data"]["train_file"], split="train"
-    )
-    print(f"Training on {len(dataset)} examples")
-
-    prompt_template = config["prompt_template"]
-
-    def format_prompt(example):
-        return prompt_template.format(**example)
+    if args.auto_batch or config["training"].get("auto_batch_size", False):
+        texts = format_batch(raw_dataset.to_dict(), config["prompt_template"])
+        batch_size, grad_accum = autotune_batch_size(model, tokenizer, texts, config)
+        config["training"]["batch_size"] = batch_size
+        config["training"]["gradient_accumulation"] = grad_accum
 
     # Training
-    training_args = TrainingArguments(
+    packing = config["training"].get("packing", False)
+    training_args = SFTConfig(
         output_dir=config["output"]["adapter_dir"],
         num_train_epochs=config["training"]["num_epochs"],
         per_device_train_batch_size=config["training"]["batch_size"],
         gradient_accumulation_steps=config["training"]["gradient_accumulation"],
-        learning_rate=config["training"]["learning_rate"],
-        warmup_ratio=config["training"]["warmup_ratio"],
+        learning_rate=float(config["training"]["learning_rate"]),  # YAML reads 2e-4 as a string
+        # A float below 1 is a fraction of the total steps (transformers 5 dropped warmup_ratio)
+        warmup_steps=config["training"]["warmup_ratio"],
         logging_steps=config["output"]["logging_steps"],
         save_steps=config["output"]["save_steps"],
         save_total_limit=3,
         bf16=config["training"]["bf16"],
-        optim="paged_adamw_8bit",
+        optim=config["training"].get("optim", "paged_adamw_8bit"),
         report_to="none",
+        # Already applied to the model by load_base_model (training.gradient_checkpointing)
+        gradient_checkpointing=False,
+        max_length=config["training"]["max_seq_length"],
+        packing=packing,
+        # The datasets arrive tokenized and truncated; SFTTrainer only prepares them to pack
+        dataset_kwargs={"skip_prepare_dataset": not packing},
+        **evaluation_arguments(config, has_eval),
+        **distributed_arguments(config),
     )
 
-    trainer = SFTTrainer(
+    trainer_class = resumable_trainer(chunked_loss_trainer(SFTTrainer, config))
+    trainer = trainer_class(
         model=model,
         args=training_args,
         train_dataset=dataset,
-        formatting_func=format_prompt,
-        max_seq_length=config["training"]["max_seq_length"],
-        tokenizer=tokenizer,
+        eval_dataset=eval_dataset,
+        processing_class=tokenizer,
+        callbacks=(
+            early_stopping_callbacks(config, has_eval)
+            + telemetry_callbacks(config)
+            + checkpoint_callbacks(config)
+            + [DataloaderStateCallback()]
+        ),
     )
 
-    print("Starting training...")
+    log("Starting training...")
     trainer.train(resume_from_checkpoint=args.resume)
 
-    model.save_pretrained(config["output"]["adapter_dir"])
-    tokenizer.save_pretrained(config["output"]["adapter_dir"])
-    print(f"Saved adapter to {config['output']['adapter_dir']}")
+    save_adapter(trainer, tokenizer, config["output"]["adapter_dir"])
+    log(f"Saved adapter to {config['output']['adapter_dir']}")
+
+    # Drop the trainer (and its optimizer state) before the next adapter
+    del trainer
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return model.unload()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config",
+        required=True,
+        nargs="+",
+        help="Path to domain config; pass several to train them against one loaded base model",
+    )
+    parser.add_argument("--resume", type=str, help="Resume from checkpoint")
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Estimate memory and step time from config.json without loading weights",
+    )
+    parser.add_argument(
+        "--auto-batch",
+        action="store_true",
+        help="Probe the largest per-device batch that fits and adjust gradient accumulation",
+    )
+    parser.add_argument(
+        "--hardware", default="h100", choices=sorted(HARDWARE), help="Device to estimate for"
+    )
+    args = parser.parse_args(argv)
+
+    if args.resume and len(args.config) > 1:
+        parser.error("--resume can only be used with a single --config")
+
+    configs = [load_config(path) for path in args.config]
+    check_shared_base(configs)
+    if len(configs) > 1 and distributed_mode(configs[0]) == "fsdp":
+        parser.error("FSDP runs train one --config at a time")
+    log(f"Base model: {configs[0]['model']['name']}")
+
+    if args.estimate:
+        model_config = load_model_config(configs[0]["model"]["name"])
+        for config in configs:
+            print(f"\n== {config['domain']} ==")
+            print(format_estimate(estimate_training(config, model_config, args.hardware)))
+        return
+
+    model, tokenizer = load_base_model(configs[0])
+    for config in configs:
+        model = train_adapter(model, tokenizer, config, args)
 
 
 if __name__ == "__main__":
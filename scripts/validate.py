@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Validate training configs (and optionally their datasets) without loading any models.
+Usage: python validate.py --config config/avorion.yaml config/gdscript.yaml --data
+"""
+
+import argparse
+import os
+import string
+import sys
+from pathlib import Path
+
+# Add scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_loader import load_config
+
+REQUIRED_KEYS = {
+    "model": ["name", "load_in_4bit"],
+    "lora": ["r", "alpha", "dropout", "target_modules"],
+    "training": [
+        "num_epochs",
+        "batch_size",
+        "gradient_accumulation",
+        "learning_rate",
+        "warmup_ratio",
+        "max_seq_length",
+    ],
+    "data": ["train_file"],
+    "output": ["adapter_dir", "save_steps", "logging_steps"],
+}
+
+# Fields every generated training example carries
+EXAMPLE_FIELDS = {"instruction", "output", "domain", "metadata"}
+
+
+def validate_config(config: dict) -> list[str]:
+    """Return a list of problems with a merged config (empty if it is valid)."""
+    errors = []
+    if "domain" not in config:
+        errors.append("missing 'domain'")
+
+    for section, keys in REQUIRED_KEYS.items():
+        if not isinstance(config.get(section), dict):
+            errors.append(f"missing section '{section}'")
+            continue
+        errors += [f"missing '{section}.{key}'" for key in keys if key not in config[section]]
+
+    template = config.get("prompt_template")
+    if not isinstance(template, str):
+        errors.append("missing 'prompt_template'")
+    else:
+        fields = {name for _, name, _, _ in string.Formatter().parse(template) if name}
+        unknown = fields - EXAMPLE_FIELDS
+        if unknown:
+            errors.append(f"prompt_template uses unknown fields: {sorted(unknown)}")
+
+    training = config.get("training", {})
+    for key in ("num_epochs", "batch_size", "gradient_accumulation", "max_seq_length"):
+        value = training.get(key)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            errors.append(f"training.{key} must be a positive integer, got {value!r}")
+
+    eval_steps = config.get("evaluation", {}).get("eval_steps")
+    save_steps = config.get("output", {}).get("save_steps")
+    if eval_steps and save_steps and save_steps % eval_steps:
+        errors.append(
+            f"output.save_steps ({save_steps}) must be a multiple of "
+            f"evaluation.eval_steps ({eval_steps})"
+        )
+    optimizer_save_steps = config.get("output", {}).get("optimizer_save_steps")
+    if optimizer_save_steps and save_steps and optimizer_save_steps % save_steps:
+        errors.append(
+            f"output.optimizer_save_steps ({optimizer_save_steps}) must be a multiple of "
+            f"output.save_steps ({save_steps})"
+        )
+    drop_easiest = config.get("pruning", {}).get("drop_easiest") or 0.0
+    if not 0.0 <= drop_easiest < 1.0:
+        errors.append(f"pruning.drop_easiest must be in [0, 1), got {drop_easiest!r}")
+    quantization_format = config.get("quantization", {}).get("format")
+    if quantization_format not in (None, "int8", "int4", "fp8"):
+        errors.append(f"quantization.format must be int8, int4 or fp8, got {quantization_format!r}")
+    serving = config.get("serving", {})
+    if not 0.0 < serving.get("gpu_memory_utilization", 0.9) <= 1.0:
+        errors.append(
+            f"serving.gpu_memory_utilization must be in (0, 1], got {serving['gpu_memory_utilization']!r}"
+        )
+    if serving.get("kv_cache_dtype", "auto") not in ("auto", "fp8", "fp8_e4m3", "fp8_e5m2"):
+        errors.append(
+            f"serving.kv_cache_dtype must be auto or fp8, got {serving['kv_cache_dtype']!r}"
+        )
+    return errors
+
+
+def validate_data(config: dict) -> bool:
+    """Validate the train (and eval, if present) datasets named by a config."""
+    from generate_dataset import validate_dataset
+
+    ok = validate_dataset(Path(config["data"]["train_file"]), config["domain"])
+    eval_file = config["data"].get("eval_file")
+    if eval_file and Path(eval_file).exists():
+        ok = validate_dataset(Path(eval_file), config["domain"]) and ok
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate training configs and datasets")
+    parser.add_argument("--config", required=True, nargs="+", help="Path to domain config")
+    parser.add_argument("--data", action="store_true", help="Also validate the datasets")
+    args = parser.parse_args(argv)
+
+    ok = True
+    for path in args.config:
+        errors = validate_config(load_config(path))
+        for error in errors:
+            print(f"{path}: {error}")
+        if not errors:
+            print(f"{path}: OK")
+        ok = ok and not errors
+        if args.data and not errors:
+            ok = validate_data(load_config(path)) and ok
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
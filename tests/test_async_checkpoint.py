@@ -0,0 +1,219 @@
+"""
+Asynchronous checkpointing tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, pad_collator, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "safetensors")
+
+from scripts.async_checkpoint import AsyncCheckpointCallback, checkpoint_callbacks
+from scripts.resume import resumable_trainer
+
+
+def make_trainer(output_dir, optimizer_save_steps=4, max_steps=8, callbacks=(), **overrides):
+    """Tiny LoRA model and Trainer saving every two steps through the async callback"""
+    peft = require_real_module("peft")
+    transformers = require_real_module("transformers")
+
+    model = peft.get_peft_model(
+        build_tiny_causal_lm(),
+        peft.LoraConfig(
+            r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"
+        ),
+    )
+    settings = {
+        "output_dir": str(output_dir),
+        "per_device_train_batch_size": 2,
+        "max_steps": max_steps,
+        "learning_rate": 1e-2,
+        "save_steps": 2,
+        "save_total_limit": 2,
+        "report_to": "none",
+        "use_cpu": True,
+    }
+    settings.update(overrides)
+    callback = AsyncCheckpointCallback(optimizer_save_steps)
+    trainer = resumable_trainer(transformers.Trainer)(
+        model=model,
+        args=transformers.TrainingArguments(**settings),
+        train_dataset=random_token_examples(32),
+        eval_dataset=random_token_examples(4, seed=1),
+        data_collator=pad_collator,
+        callbacks=[callback, *callbacks],
+    )
+    return trainer, callback
+
+
+def test_checkpoints_are_adapter_only_and_rotated(tmp_path):
+    """Test that checkpoints hold the adapter, optimizer state only on its cadence, and rotate"""
+    trainer, callback = make_trainer(tmp_path)
+    trainer.train()
+
+    checkpoints = sorted(path.name for path in tmp_path.iterdir())
+    # Last two, plus checkpoint-8 which also carries the newest optimizer state
+    assert checkpoints == ["checkpoint-6", "checkpoint-8"]
+    for name in checkpoints:
+        files = {path.name for path in (tmp_path / name).iterdir()}
+        assert {"adapter_model.safetensors", "adapter_config.json", "trainer_state.json"} <= files
+        assert "model.safetensors" not in files
+    assert (tmp_path / "checkpoint-8" / "optimizer.pt").exists()
+    assert not (tmp_path / "checkpoint-6" / "optimizer.pt").exists()
+    assert (tmp_path / "checkpoint-6" / "scheduler.pt").exists()
+    assert callback.thread is None
+
+
+def test_snapshot_matches_weights_at_save_step(tmp_path):
+    """Test that the written adapter is the host copy taken at the save step"""
+    safetensors = require_real_module("safetensors.torch")
+    peft = require_real_module("peft")
+    torch = require_real_module("torch")
+
+    trainer, _ = make_trainer(tmp_path, max_steps=4)
+    trainer.train()
+
+    saved = safetensors.load_file(tmp_path / "checkpoint-4" / "adapter_model.safetensors")
+    current = peft.get_peft_model_state_dict(trainer.model)
+    assert saved.keys() == current.keys()
+    for name, tensor in current.items():
+        assert torch.equal(saved[name], tensor.detach().cpu())
+
+
+def test_resume_from_async_checkpoint(tmp_path):
+    """Test that the Trainer resumes from a checkpoint written in the background"""
+    trainer, _ = make_trainer(tmp_path, max_steps=4)
+    trainer.train()
+
+    resumed, _ = make_trainer(tmp_path, max_steps=6)
+    resumed.train(resume_from_checkpoint=str(tmp_path / "checkpoint-4"))
+
+    assert resumed.state.global_step == 6
+
+
+def test_resumed_run_rotates_and_keeps_best_of_earlier_checkpoints(tmp_path):
+    """Test that checkpoints from before a resume still count toward save_total_limit and the best one"""
+    evaluation = {
+        "eval_strategy": "steps",
+        "eval_steps": 2,
+        "metric_for_best_model": "eval_loss",
+        "greater_is_better": False,
+    }
+    trainer, _ = make_trainer(tmp_path, max_steps=4, **evaluation)
+    trainer.train()
+
+    resumed, callback = make_trainer(tmp_path, **evaluation)
+    resumed.train(resume_from_checkpoint=str(tmp_path / "checkpoint-4"))
+
+    best = resumed.state.best_model_checkpoint
+    assert best is not None and best.endswith(f"checkpoint-{resumed.state.best_global_step}")
+    kept = {"checkpoint-6", "checkpoint-8", best.split("/")[-1]}
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(kept)
+    assert [path.name for path in callback.saved] == sorted(
+        kept, key=lambda name: int(name.split("-")[1])
+    )
+
+
+def test_checkpoint_state_includes_the_step_evaluation_and_callbacks(tmp_path):
+    """Test that trainer_state.json is taken after the step's evaluation and early stopping resumes its count"""
+    transformers = require_real_module("transformers")
+
+    def train(max_steps, resume=None):
+        # The threshold is never met, so every evaluation but the first counts toward patience
+        early_stopping = transformers.EarlyStoppingCallback(
+            early_stopping_patience=100, early_stopping_threshold=1e9
+        )
+        trainer, _ = make_trainer(
+            tmp_path,
+            max_steps=max_steps,
+            eval_strategy="steps",
+            eval_steps=2,
+            metric_for_best_model="eval_loss",
+            greater_is_better=False,
+            restore_callback_states_from_checkpoint=True,
+            callbacks=[early_stopping],
+        )
+        trainer.train(resume_from_checkpoint=resume)
+        return next(
+            c for c in trainer.callback_handler.callbacks if isinstance(c, type(early_stopping))
+        )
+
+    train(max_steps=4)
+    state = json.loads((tmp_path / "checkpoint-4" / "trainer_state.json").read_text())
+    assert [entry["step"] for entry in state["log_history"] if "eval_loss" in entry] == [2, 4]
+    stored = state["stateful_callbacks"]["EarlyStoppingCallback"]["attributes"]
+    assert stored["early_stopping_patience_counter"] == 1
+    assert "TrainerControl" in state["stateful_callbacks"]
+
+    resumed = train(max_steps=8, resume=str(tmp_path / "checkpoint-4"))
+    assert resumed.early_stopping_patience_counter == 3
+
+
+def test_resume_from_adapter_only_checkpoint_keeps_the_schedule(tmp_path):
+    """Test that resuming without optimizer state warns, names the full checkpoint and keeps the LR schedule"""
+    reference, _ = make_trainer(tmp_path / "reference", logging_steps=1)
+    reference.train()
+
+    transformers = require_real_module("transformers")
+
+    class Interrupt(transformers.TrainerCallback):
+        def on_step_end(self, args, state, control, **kwargs):
+            control.should_training_stop = state.global_step == 6
+
+    # Same schedule as the reference, stopped after step 6 as if the job were killed
+    trainer, _ = make_trainer(tmp_path / "run", logging_steps=1, callbacks=[Interrupt()])
+    trainer.train()
+    assert not (tmp_path / "run" / "checkpoint-6" / "optimizer.pt").exists()
+
+    resumed, _ = make_trainer(tmp_path / "run", logging_steps=1)
+    with pytest.warns(
+        UserWarning, match="checkpoint-4 is the newest checkpoint with optimizer state"
+    ):
+        resumed.train(resume_from_checkpoint=str(tmp_path / "run" / "checkpoint-6"))
+
+    def learning_rates(trainer):
+        return {
+            entry["step"]: entry["learning_rate"]
+            for entry in trainer.state.log_history
+            if "loss" in entry
+        }
+
+    expected = learning_rates(reference)
+    resumed_rates = learning_rates(resumed)
+    assert [resumed_rates[step] for step in (7, 8)] == [expected[7], expected[8]]
+
+
+def test_best_checkpoint_is_kept_and_reloaded(tmp_path):
+    """Test that load_best_model_at_end works with background-written checkpoints"""
+    trainer, callback = make_trainer(
+        tmp_path,
+        optimizer_save_steps=0,
+        eval_strategy="steps",
+        eval_steps=2,
+        load_best_model_at_end=True,
+        metric_for_best_model="eval_loss",
+        greater_is_better=False,
+    )
+    trainer.train()
+
+    best = trainer.state.best_model_checkpoint
+    assert best is not None
+    assert best.endswith(f"checkpoint-{trainer.state.best_global_step}")
+    assert (tmp_path / best.split("/")[-1]).exists()
+
+
+def test_checkpoint_callbacks_follow_config():
+    """Test that async checkpointing can be disabled and validates its cadence"""
+    config = {"output": {"save_steps": 100, "async_checkpoint": False}}
+    assert checkpoint_callbacks(config) == []
+
+    config["output"].update(async_checkpoint=True, optimizer_save_steps=250)
+    with pytest.raises(ValueError, match="optimizer_save_steps"):
+        checkpoint_callbacks(config)
+
+    config["output"]["optimizer_save_steps"] = 500
+    assert checkpoint_callbacks(config)[0].optimizer_save_steps == 500
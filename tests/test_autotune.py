@@ -0,0 +1,142 @@
+"""
+Batch size auto-tuning tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch")
+
+from scripts import autotune
+from scripts.autotune import (
+    autotune_batch_size,
+    cache_key,
+    find_max_batch_size,
+    save_cache,
+    split_effective_batch,
+)
+
+
+class ThresholdProbe:
+    """Fake probe that fits every batch up to a threshold and records calls"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.calls = []
+
+    def __call__(self, batch_size):
+        self.calls.append(batch_size)
+        return batch_size <= self.threshold
+
+
+@pytest.mark.parametrize("threshold", [1, 2, 5, 13, 64])
+def test_find_max_batch_size_finds_threshold(threshold):
+    """Test that the search lands exactly on the largest batch that fits"""
+    probe = ThresholdProbe(threshold)
+    assert find_max_batch_size(probe, start=2, limit=64) == threshold
+    assert len(probe.calls) <= 12
+
+
+def test_find_max_batch_size_backs_off_when_start_fails():
+    """Test that an oversized starting batch is halved until it fits"""
+    probe = ThresholdProbe(3)
+    assert find_max_batch_size(probe, start=16, limit=64) == 3
+    assert probe.calls[0] == 16
+
+
+def test_find_max_batch_size_raises_when_nothing_fits():
+    """Test that a model that cannot fit a single sequence is reported"""
+    with pytest.raises(RuntimeError, match="Batch size 1"):
+        find_max_batch_size(ThresholdProbe(0), start=4)
+
+
+@pytest.mark.parametrize(
+    "effective, max_batch, expected",
+    [(8, 3, (2, 4)), (8, 6, (4, 2)), (8, 64, (8, 1)), (12, 5, (4, 3)), (7, 4, (1, 7))],
+)
+def test_split_effective_batch_preserves_effective_size(effective, max_batch, expected):
+    """Test that per-device batch times accumulation equals the configured batch"""
+    batch_size, accumulation = split_effective_batch(effective, max_batch)
+    assert (batch_size, accumulation) == expected
+    assert batch_size * accumulation == effective
+
+
+def test_autotune_uses_cache_without_probing(tmp_path, base_config, monkeypatch):
+    """Test that a cached result for this model, hardware and length skips probing"""
+    monkeypatch.setattr(autotune, "hardware_fingerprint", lambda: "NVIDIA H100 x1 80GiB")
+    monkeypatch.setattr(autotune, "make_probe", pytest.fail)
+    cache_path = tmp_path / "autotune.json"
+    key = cache_key(base_config["model"]["name"], "NVIDIA H100 x1 80GiB", 2048)
+    cache_path.write_text(json.dumps({key: {"max_batch_size": 4}}))
+
+    result = autotune_batch_size(None, None, [], base_config, cache_path=cache_path)
+    assert result == (4, 2)
+
+
+def test_autotune_probes_and_caches(tmp_path, base_config, monkeypatch):
+    """Test that a fresh probe result is cached for later runs"""
+    monkeypatch.setattr(autotune, "hardware_fingerprint", lambda: "NVIDIA H100 x1 80GiB")
+    monkeypatch.setattr(autotune, "longest_examples", lambda *args: [[1, 2, 3]])
+    monkeypatch.setattr(autotune, "make_probe", lambda *args: ThresholdProbe(8))
+    cache_path = tmp_path / "autotune.json"
+    tokenizer = type("Tokenizer", (), {"pad_token_id": 0})()
+
+    result = autotune_batch_size(None, tokenizer, ["text"], base_config, cache_path=cache_path)
+
+    assert result == (8, 1)
+    cached = json.loads(cache_path.read_text())
+    assert list(cached.values()) == [{"max_batch_size": 8}]
+
+
+def test_ranks_agree_on_the_smallest_batch(tmp_path, base_config, monkeypatch):
+    """Test that a DDP rank with less room lowers the batch size used and cached on every rank"""
+    monkeypatch.setattr(autotune, "hardware_fingerprint", lambda: "NVIDIA H100 x1 80GiB")
+    monkeypatch.setattr(autotune, "longest_examples", lambda *args: [[1, 2, 3]])
+    monkeypatch.setattr(autotune, "make_probe", lambda *args: ThresholdProbe(8))
+    monkeypatch.setattr(autotune, "min_across_ranks", lambda value: min(value, 3))
+    cache_path = tmp_path / "autotune.json"
+    tokenizer = type("Tokenizer", (), {"pad_token_id": 0})()
+
+    result = autotune_batch_size(None, tokenizer, ["text"], base_config, cache_path=cache_path)
+
+    assert result == (2, 4)
+    assert list(json.loads(cache_path.read_text()).values()) == [{"max_batch_size": 3}]
+
+
+def test_only_rank_zero_writes_the_cache(tmp_path, monkeypatch):
+    """Test that other DDP ranks leave the cache alone and rank 0 leaves no temporary file"""
+    cache_path = tmp_path / "autotune.json"
+    monkeypatch.setenv("RANK", "1")
+    save_cache(cache_path, {"key": {"max_batch_size": 8}})
+    assert not cache_path.exists()
+
+    monkeypatch.setenv("RANK", "0")
+    save_cache(cache_path, {"key": {"max_batch_size": 8}})
+    assert json.loads(cache_path.read_text()) == {"key": {"max_batch_size": 8}}
+    assert [path.name for path in tmp_path.iterdir()] == ["autotune.json"]
+
+
+def test_probe_runs_backward_and_reports_oom():
+    """Test that the probe trains a real step and treats OOM as not fitting"""
+    torch = require_real_module("torch")
+    model = build_tiny_causal_lm()
+    examples = [example["input_ids"] for example in random_token_examples(4, 16, 16)]
+    fits = autotune.make_probe(model, examples)
+
+    assert fits(3) is True
+    assert all(p.grad is None for p in model.parameters())
+
+    original_forward = model.forward
+
+    def limited_forward(input_ids=None, **kwargs):
+        if input_ids.shape[0] > 2:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory")
+        return original_forward(input_ids=input_ids, **kwargs)
+
+    model.forward = limited_forward
+    assert find_max_batch_size(fits, start=1, limit=8) == 2
@@ -0,0 +1,115 @@
+"""
+Serving benchmark tests for LoRA training framework
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from scripts import bench_serving
+from scripts.bench_serving import arrival_times, compare, percentile, run_benchmark, summarize
+from tests.utils.openai_stub import OpenAIStub
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def eval_config(tmp_path):
+    """Provide a config whose eval file holds three examples"""
+    eval_file = tmp_path / "eval.jsonl"
+    eval_file.write_text(
+        "".join(json.dumps({"instruction": f"Task {i}", "output": "x"}) + "\n" for i in range(3))
+    )
+    config = yaml.safe_load((REPO / "config" / "avorion.yaml").read_text())
+    config["data"] = {"train_file": str(tmp_path / "missing.jsonl"), "eval_file": str(eval_file)}
+    (tmp_path / "base.yaml").write_text((REPO / "config" / "base.yaml").read_text())
+    config_file = tmp_path / "avorion.yaml"
+    config_file.write_text(yaml.dump(config))
+    return str(config_file)
+
+
+def test_percentile_interpolates_between_ranks():
+    """Test percentiles on a known distribution"""
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == pytest.approx(50.5)
+    assert percentile(values, 99) == pytest.approx(99.01)
+    assert percentile([3.0], 95) == 3.0
+
+
+def test_arrival_times_follow_request_rate():
+    """Test that arrivals are simultaneous at an infinite rate and Poisson-spaced otherwise"""
+    assert arrival_times(4, float("inf")) == [0.0] * 4
+    times = arrival_times(2000, request_rate=10.0)
+    assert times == sorted(times) and times[0] == 0.0
+    assert times[-1] / (len(times) - 1) == pytest.approx(0.1, rel=0.1)
+    assert arrival_times(5, 10.0, seed=1) == arrival_times(5, 10.0, seed=1)
+
+
+def test_run_benchmark_measures_streaming_latency():
+    """Test TTFT, ITL and token counts against a stub streaming a token every 10 ms, within the concurrency cap"""
+    with OpenAIStub(["avorion"], token_delay=0.01) as stub:
+        results, duration = run_benchmark(
+            stub.url, "avorion", ["prompt"] * 6, concurrency=2, max_tokens=5
+        )
+
+    summary = summarize(results, duration)
+    assert summary["completed"] == 6 and summary["failed"] == 0
+    assert summary["output_tokens"] == 30
+    assert all(len(result["itl"]) == 4 for result in results)
+    assert summary["p50_itl_ms"] >= 9
+    assert summary["p99_e2e_ms"] >= summary["p50_e2e_ms"] >= summary["p50_ttft_ms"]
+    assert summary["decode_tokens_per_s"] <= 110
+    assert stub.max_in_flight <= 2
+    assert all(request["stream"] for request in stub.requests)
+
+
+def test_benchmark_command_saves_and_compares_runs(eval_config, tmp_path):
+    """Test the command end to end: prompts from eval_file, saved results, baseline comparison"""
+    output = tmp_path / "run.json"
+    with OpenAIStub(["avorion"]) as stub:
+        bench_serving.main(
+            [
+                "--config",
+                eval_config,
+                "--url",
+                stub.url,
+                "--num-prompts",
+                "4",
+                "--max-tokens",
+                "3",
+                "--output",
+                str(output),
+            ]
+        )
+        prompts = [request["prompt"] for request in stub.requests]
+
+    run = json.loads(output.read_text())
+    assert run["settings"]["model"] == "avorion"
+    assert run["summary"]["completed"] == 4 and len(run["requests"]) == 4
+    assert sorted(prompts)[0].startswith("### Instruction:\nTask 0")
+    assert (
+        sum("Task 0" in prompt for prompt in prompts) == 2
+    )  # three examples cycled to four requests
+
+    slower = dict(run["summary"], output_tokens_per_s=run["summary"]["output_tokens_per_s"] / 2)
+    lines, regressions = compare(slower, run["summary"], tolerance=0.1)
+    assert any("output_tokens_per_s" in line for line in lines)
+    assert regressions == [
+        f"output_tokens_per_s {run['summary']['output_tokens_per_s']:.2f} -> "
+        f"{slower['output_tokens_per_s']:.2f}"
+    ]
+
+
+def test_failed_requests_are_counted_not_timed():
+    """Test that requests the server rejects count as failures and are left out of the latency stats"""
+    with OpenAIStub(["avorion"]) as stub:
+        results, duration = run_benchmark(
+            stub.url, "gdscript", ["prompt"] * 2, concurrency=2, max_tokens=3
+        )
+
+    summary = summarize(results, duration)
+    assert summary["failed"] == 2 and summary["completed"] == 0
+    assert "mean_ttft_ms" not in summary
+    assert "404" in results[0]["error"]
@@ -0,0 +1,126 @@
+"""
+Chunked cross-entropy loss tests for LoRA training framework
+"""
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, pad_collator, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft")
+
+from scripts.bench_long_context import saved_tensor_bytes
+from scripts.chunked_loss import chunked_causal_lm_loss, chunked_loss_trainer
+
+
+def lora_model():
+    peft = require_real_module("peft")
+    return peft.get_peft_model(
+        build_tiny_causal_lm(),
+        peft.LoraConfig(
+            r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"
+        ),
+    )
+
+
+def chunked_forward(model, batch, chunk_size, num_items_in_batch=None):
+    inputs = {key: value for key, value in batch.items() if key != "labels"}
+    outputs = model(**inputs, output_hidden_states=True, logits_to_keep=1)
+    return chunked_causal_lm_loss(
+        outputs.hidden_states[-1],
+        model.get_output_embeddings(),
+        batch["labels"],
+        chunk_size,
+        num_items_in_batch,
+    )
+
+
+def lora_gradients(model):
+    return {name: p.grad.clone() for name, p in model.named_parameters() if p.requires_grad}
+
+
+@pytest.mark.parametrize("chunk_size", [7, 16, 1000])
+def test_chunked_loss_matches_standard_loss_and_gradients(chunk_size):
+    """Test that the chunked loss reproduces the model's own loss and LoRA gradients"""
+    torch = require_real_module("torch")
+    batch = pad_collator(random_token_examples(3, min_length=10, max_length=30))
+
+    model = lora_model()
+    expected = model(**batch).loss
+    expected.backward()
+    expected_grads = lora_gradients(model)
+    model.zero_grad()
+
+    loss = chunked_forward(model, batch, chunk_size)
+    loss.backward()
+
+    assert torch.allclose(loss, expected, atol=1e-6)
+    for name, grad in lora_gradients(model).items():
+        assert torch.allclose(grad, expected_grads[name], atol=1e-6), name
+
+
+def test_chunked_loss_honours_num_items_in_batch():
+    """Test that gradient-accumulation normalisation matches the model's loss kwargs"""
+    torch = require_real_module("torch")
+    batch = pad_collator(random_token_examples(2))
+    model = lora_model()
+
+    expected = model(**batch, num_items_in_batch=100).loss
+    loss = chunked_forward(model, batch, chunk_size=8, num_items_in_batch=torch.tensor(100))
+
+    assert torch.allclose(loss, expected, atol=1e-6)
+
+
+def test_chunked_loss_keeps_fewer_activations():
+    """Test that full-vocab logits are not kept for backward"""
+    batch = pad_collator(random_token_examples(2, min_length=64, max_length=64))
+    model = lora_model()
+
+    _, standard = saved_tensor_bytes(model, lambda: model(**batch).loss)
+    _, chunked = saved_tensor_bytes(model, lambda: chunked_forward(model, batch, chunk_size=16))
+
+    assert chunked < standard
+
+
+def test_trainer_with_chunked_loss_matches_standard_trainer(tmp_path):
+    """Test that a Trainer using the chunked loss logs the same training losses"""
+    transformers = require_real_module("transformers")
+
+    def train(trainer_class):
+        args = transformers.TrainingArguments(
+            output_dir=str(tmp_path),
+            per_device_train_batch_size=2,
+            gradient_accumulation_steps=2,
+            max_steps=3,
+            learning_rate=1e-2,
+            logging_steps=1,
+            save_strategy="no",
+            report_to="none",
+            use_cpu=True,
+        )
+        trainer = trainer_class(
+            model=lora_model(),
+            args=args,
+            train_dataset=random_token_examples(16),
+            data_collator=pad_collator,
+        )
+        trainer.train()
+        return [entry["loss"] for entry in trainer.state.log_history if "loss" in entry]
+
+    config = {"training": {"loss_chunk_size": 8}}
+    chunked_class = chunked_loss_trainer(transformers.Trainer, config)
+
+    assert chunked_class.__name__ == "ChunkedLossTrainer"
+    assert train(chunked_class) == pytest.approx(train(transformers.Trainer), rel=1e-5)
+
+
+def test_chunked_loss_is_opt_in(monkeypatch):
+    """Test that the trainer class is unchanged unless loss_chunk_size is set, and FSDP is refused"""
+    transformers = require_real_module("transformers")
+    assert chunked_loss_trainer(transformers.Trainer, {"training": {}}) is transformers.Trainer
+
+    monkeypatch.setenv("WORLD_SIZE", "2")
+    config = {"training": {"loss_chunk_size": 8}, "distributed": {"mode": "fsdp"}}
+    with pytest.raises(ValueError, match="FSDP"):
+        chunked_loss_trainer(transformers.Trainer, config)
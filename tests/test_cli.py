@@ -0,0 +1,98 @@
+"""
+Unified CLI and startup time tests for LoRA training framework
+"""
+
+import copy
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from scripts import cli
+from scripts.bench_startup import find_regressions, measure_command
+from scripts.validate import validate_config
+
+
+def test_parser_lists_every_command():
+    """Test that all pipeline stages are available as subcommands"""
+    help_text = cli.build_parser().format_help()
+    for command in ("generate", "train", "merge", "convert", "validate"):
+        assert command in help_text
+
+
+def test_main_dispatches_remaining_arguments(monkeypatch):
+    """Test that a subcommand's options are passed through to its module"""
+    calls = []
+    fake_module = SimpleNamespace(main=calls.append)
+    monkeypatch.setattr(cli.importlib, "import_module", lambda name: fake_module)
+    monkeypatch.setattr(sys, "argv", ["lora"])
+
+    cli.main(["train", "--config", "config/avorion.yaml", "config/gdscript.yaml"])
+
+    assert calls == [["--config", "config/avorion.yaml", "config/gdscript.yaml"]]
+    assert sys.argv[0] == "lora train"
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "generate",
+        "score",
+        "train",
+        "reduce-rank",
+        "compose",
+        "merge",
+        "reshard",
+        "quantize",
+        "convert",
+        "smoke",
+        "bench",
+        "validate",
+        "pipeline",
+    ],
+)
+def test_help_does_not_import_heavy_dependencies(command):
+    """Test that startup stays fast: --help must not pull in torch, transformers or anthropic"""
+    result = measure_command([command, "--help"], repeats=1)
+    assert result["heavy"] == []
+
+
+def test_find_regressions_flags_slow_or_heavy_startup():
+    """Test that the startup benchmark reports slowdowns against a baseline"""
+    baseline = {"lora train --help": {"median_s": 0.1, "heavy": []}}
+    fast = {"lora train --help": {"median_s": 0.12, "heavy": []}}
+    slow = {"lora train --help": {"median_s": 0.3, "heavy": []}}
+    heavy = {"lora train --help": {"median_s": 0.1, "heavy": ["torch"]}}
+
+    assert find_regressions(fast, baseline, tolerance=0.5) == []
+    assert "baseline" in find_regressions(slow, baseline, tolerance=0.5)[0]
+    assert "torch" in find_regressions(heavy, baseline, tolerance=0.5)[0]
+
+
+def test_validate_config_accepts_shipped_configs(base_config, avorion_config):
+    """Test that a merged base + domain config validates cleanly"""
+    config = copy.deepcopy(base_config)
+    for key, value in avorion_config.items():
+        if isinstance(value, dict) and key in config:
+            config[key].update(value)
+        else:
+            config[key] = value
+    config["output"]["save_steps"] = 100
+
+    assert validate_config(config) == []
+
+
+def test_validate_config_reports_problems(base_config):
+    """Test that missing keys, bad values and template typos are reported"""
+    config = copy.deepcopy(base_config)
+    config["training"]["batch_size"] = 0
+    config["prompt_template"] = "{instruction}\n{respnse}"
+    config["evaluation"] = {"eval_steps": 30}
+
+    errors = validate_config(config)
+
+    assert "missing 'domain'" in errors
+    assert "missing 'data.train_file'" in errors or "missing section 'data'" in errors
+    assert any("batch_size" in error for error in errors)
+    assert any("respnse" in error for error in errors)
+    assert any("eval_steps" in error for error in errors)
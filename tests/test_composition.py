@@ -0,0 +1,183 @@
+"""
+Adapter composition tests for LoRA training framework
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_moe
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "safetensors")
+
+from scripts import compose
+from scripts.composition import REPORT_NAME, combine, compose_adapters, drop, trim
+from scripts.stream_merge import load_adapter
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+def save_adapter(tmp_path, name, seed, targets, build=build_tiny_causal_lm, **lora_overrides):
+    """Save a trained-looking adapter for the tiny model"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    settings = {"r": 4, "lora_alpha": 8, "target_modules": targets, "task_type": "CAUSAL_LM"}
+    settings.update(lora_overrides)
+    model = peft.get_peft_model(build(), peft.LoraConfig(**settings))
+    torch.manual_seed(seed)
+    with torch.no_grad():
+        for parameter_name, parameter in model.named_parameters():
+            if "lora_" in parameter_name:
+                parameter.normal_(std=0.5)
+    adapter_dir = tmp_path / name
+    model.save_pretrained(adapter_dir)
+    return adapter_dir
+
+
+@pytest.fixture
+def adapters(tmp_path):
+    """Provide two adapters with different ranks, scalings and partly different targets"""
+    return [
+        save_adapter(tmp_path, "avorion", 1, ["q_proj", "v_proj"], use_rslora=True),
+        save_adapter(tmp_path, "gdscript", 2, ["q_proj", "down_proj"], r=8, lora_alpha=8),
+    ]
+
+
+def updates(adapter_dir):
+    return {key: delta.delta() for key, delta in load_adapter(adapter_dir).items()}
+
+
+def test_linear_composition_is_exact_weighted_sum(adapters, tmp_path):
+    """Test that linear composition reproduces w1 * delta1 + w2 * delta2 for every module, and PEFT loads it"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    report = compose_adapters(adapters, tmp_path / "unified", weights=[1.0, 0.5])
+
+    first, second, composed = (
+        updates(adapters[0]),
+        updates(adapters[1]),
+        updates(tmp_path / "unified"),
+    )
+    assert composed.keys() == first.keys() | second.keys()
+    for key, delta in composed.items():
+        expected = first.get(key, 0) + 0.5 * second.get(key, 0)
+        assert torch.allclose(delta, expected, atol=1e-5), key
+    ranks = {module["module"].rsplit(".", 1)[1]: module["rank"] for module in report["modules"]}
+    assert ranks == {"q_proj": 12, "v_proj": 4, "down_proj": 8}
+
+    config = json.loads((tmp_path / "unified" / "adapter_config.json").read_text())
+    assert config["r"] == config["lora_alpha"] == 12
+    assert sorted(config["target_modules"]) == ["down_proj", "q_proj", "v_proj"]
+    model = peft.PeftModel.from_pretrained(build_tiny_causal_lm(), tmp_path / "unified")
+    merged = model.merge_and_unload().state_dict()
+    base = build_tiny_causal_lm().state_dict()
+    key = "model.layers.0.mlp.down_proj.weight"
+    assert torch.allclose(merged[key] - base[key], composed[key], atol=1e-5)
+
+
+def test_fused_moe_experts_compose_per_expert(tmp_path):
+    """Test that fused expert stacks compose expert by expert, also when only one adapter targets a stack"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    adapters = [
+        save_adapter(
+            tmp_path, "avorion", 1, ["q_proj", "gate_proj", "up_proj", "down_proj"], build_tiny_moe
+        ),
+        save_adapter(tmp_path, "gdscript", 2, ["q_proj", "down_proj"], build_tiny_moe, r=8),
+    ]
+    report = compose_adapters(adapters, tmp_path / "unified", weights=[1.0, 0.5])
+
+    first, second, composed = (
+        updates(adapters[0]),
+        updates(adapters[1]),
+        updates(tmp_path / "unified"),
+    )
+    key = "model.layers.0.mlp.experts.down_proj"
+    assert composed.keys() == first.keys() | second.keys() and composed[key].shape == (4, 16, 8)
+    for name, delta in composed.items():
+        assert torch.allclose(delta, first.get(name, 0) + 0.5 * second.get(name, 0), atol=1e-5), (
+            name
+        )
+    ranks = {module["module"].rsplit(".", 1)[1]: module["rank"] for module in report["modules"]}
+    # 4 + 8 per expert, but an expert's down_proj has only 8 inputs
+    assert ranks == {"q_proj": 12, "gate_up_proj": 8, "down_proj": 8}
+
+    model = peft.PeftModel.from_pretrained(build_tiny_moe(), tmp_path / "unified")
+    merged = model.merge_and_unload().state_dict()
+    assert torch.allclose(
+        merged[key] - build_tiny_moe().state_dict()[key], composed[key], atol=1e-5
+    )
+
+
+def test_ties_trims_elects_signs_and_averages_agreement():
+    """Test TIES on hand-written updates: trimmed small entries, elected sign, disjoint mean"""
+    torch = require_real_module("torch")
+    first = torch.tensor([[4.0, -1.0, 0.1, 2.0]])
+    second = torch.tensor([[2.0, 3.0, -0.2, -1.0]])
+
+    assert torch.equal(trim(first, 0.5), torch.tensor([[4.0, 0.0, 0.0, 2.0]]))
+    merged = combine([first, second], [1.0, 1.0], "ties", density=0.5)
+    # Column 0: both agree -> mean 3; column 1: only second survives; column 3: +2 vs trimmed -1 -> 2
+    assert torch.equal(merged, torch.tensor([[3.0, 3.0, 0.0, 2.0]]))
+    assert torch.equal(combine([first, second], [1.0, 0.5], "linear"), first + 0.5 * second)
+
+
+def test_dare_drops_at_density_and_preserves_expectation():
+    """Test that DARE keeps about density of the entries, rescaled, reproducibly for a seed"""
+    torch = require_real_module("torch")
+    delta = torch.ones(200, 200)
+    dropped = drop(delta, 0.25, torch.Generator().manual_seed(0))
+    assert (dropped != 0).float().mean().item() == pytest.approx(0.25, abs=0.01)
+    assert dropped.mean().item() == pytest.approx(1.0, abs=0.05)
+    assert torch.equal(dropped, drop(delta, 0.25, torch.Generator().manual_seed(0)))
+
+
+@pytest.mark.parametrize("method", ["ties", "dare_linear", "dare_ties"])
+def test_dense_methods_factor_back_to_requested_rank(adapters, tmp_path, method):
+    """Test that TIES/DARE results are factored to the requested rank and report retained energy"""
+    report = compose_adapters(adapters, tmp_path / method, method=method, density=0.5, rank=6)
+
+    assert {module["rank"] for module in report["modules"]} == {6}
+    assert all(0.0 < module["retained_energy"] <= 1.0 for module in report["modules"])
+    config = json.loads((tmp_path / method / "adapter_config.json").read_text())
+    assert config["r"] == 6 and not config["use_rslora"]
+
+
+def test_compose_command_writes_report_and_refuses_mixed_bases(adapters, tmp_path):
+    """Test the command end to end from domain configs, and that different base models are refused"""
+    (tmp_path / "base.yaml").write_text((REPO / "config" / "base.yaml").read_text())
+    config_files = []
+    for domain, adapter_dir in zip(("avorion", "gdscript"), adapters, strict=True):
+        config = yaml.safe_load((REPO / "config" / f"{domain}.yaml").read_text())
+        config["output"] = {"adapter_dir": str(adapter_dir)}
+        config_files.append(tmp_path / f"{domain}.yaml")
+        config_files[-1].write_text(yaml.dump(config))
+
+    compose.main(
+        [
+            "--config",
+            *map(str, config_files),
+            "--output",
+            str(tmp_path / "unified"),
+            "--method",
+            "ties",
+            "--weights",
+            "1.0",
+            "0.8",
+            "--rank",
+            "4",
+        ]
+    )
+    report = json.loads((tmp_path / "unified" / REPORT_NAME).read_text())
+    assert report["domains"] == ["avorion", "gdscript"] and report["weights"] == [1.0, 0.8]
+    assert report["max_rank"] == 4
+
+    config = yaml.safe_load(config_files[1].read_text())
+    config["model"]["name"] = "Qwen/Qwen3-8B"
+    config_files[1].write_text(yaml.dump(config))
+    with pytest.raises(SystemExit):
+        compose.main(["--config", *map(str, config_files), "--output", str(tmp_path / "mixed")])
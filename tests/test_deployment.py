@@ -2,15 +2,10 @@
 Deployment workflow tests for LoRA training framework
 """
 
-import pytest
-from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
-import sys
-
-# Mock the required imports for testing
-sys.modules["torch"] = Mock()
-sys.modules["transformers"] = Mock()
-sys.modules["peft"] = Mock()
+from tests.utils.mock_helpers import mock_missing_modules
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft")
 
 
 def test_merge_workflow_structure():
@@ -0,0 +1,111 @@
+"""
+Distributed (DDP/FSDP) training tests for LoRA training framework
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from scripts.distributed import (
+    distributed_arguments,
+    distributed_mode,
+    fsdp_loading_env,
+    model_placement,
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WORKER = REPO_ROOT / "tests" / "utils" / "ddp_worker.py"
+
+
+@pytest.fixture
+def two_process_env(monkeypatch):
+    """Pretend to be rank 1 of a two-process launch"""
+    monkeypatch.setenv("WORLD_SIZE", "2")
+    monkeypatch.setenv("RANK", "1")
+    monkeypatch.setenv("LOCAL_RANK", "1")
+
+
+def test_single_process_keeps_auto_device_map():
+    """Test that a plain launch still spreads the model with device_map='auto'"""
+    config = {"distributed": {"mode": "fsdp"}}
+    assert distributed_mode(config) is None
+    assert model_placement(config) == {"device_map": "auto"}
+    assert distributed_arguments(config) == {}
+    assert fsdp_loading_env(config) == {}
+
+
+def test_ddp_places_replica_on_local_rank(two_process_env):
+    """Test that each DDP rank loads a full replica on its own device"""
+    config = {"distributed": {"mode": "ddp"}}
+
+    assert model_placement(config) == {"device_map": {"": 1}}
+    assert distributed_arguments(config)["ddp_find_unused_parameters"] is False
+
+
+def test_fsdp_arguments(two_process_env):
+    """Test that FSDP mode shards with auto-wrapping and keeps original parameters"""
+    config = {"distributed": {"mode": "fsdp", "fsdp_sharding": "shard_grad_op"}}
+
+    arguments = distributed_arguments(config)
+
+    assert model_placement(config) == {}
+    assert arguments["fsdp"] == "shard_grad_op auto_wrap"
+    assert arguments["fsdp_config"]["use_orig_params"] is True
+
+
+def test_fsdp_loads_weights_on_rank_zero_only(two_process_env):
+    """Test that FSDP mode sets the loading environment transformers reads inside from_pretrained"""
+    assert fsdp_loading_env({"distributed": {"mode": "ddp"}}) == {}
+    env = fsdp_loading_env({"distributed": {"mode": "fsdp"}})
+    assert env == {"ACCELERATE_USE_FSDP": "true", "FSDP_CPU_RAM_EFFICIENT_LOADING": "true"}
+
+
+def test_unknown_mode_is_rejected(two_process_env):
+    """Test that a typo in distributed.mode fails loudly"""
+    with pytest.raises(ValueError, match="distributed.mode"):
+        distributed_mode({"distributed": {"mode": "deepspeed"}})
+
+
+def test_ddp_training_on_cpu_with_gloo(tmp_path):
+    """Test two-process DDP training on CPU: sharded data, synced weights, rank-0-only saving"""
+    for module in ("torch", "transformers", "peft", "accelerate"):
+        pytest.importorskip(module)
+
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "OMP_NUM_THREADS": "1"}
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "torch.distributed.run",
+            "--standalone",
+            "--nproc_per_node",
+            "2",
+            str(WORKER),
+            str(tmp_path),
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=600,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    reports = [json.loads((tmp_path / f"rank{rank}.json").read_text()) for rank in (0, 1)]
+    assert all(report["world_size"] == 2 for report in reports)
+    assert all(report["backend"] == "gloo" for report in reports)
+    assert [report["agreed"] for report in reports] == [10, 10]
+
+    # Each rank trained on its own half of the data
+    seen = [set(report["seen"]) for report in reports]
+    assert seen[0].isdisjoint(seen[1])
+    assert seen[0] | seen[1] == set(range(16))
+
+    # Gradients were all-reduced, so both replicas ended with the same adapter
+    assert reports[0]["lora_checksum"] == pytest.approx(reports[1]["lora_checksum"])
+
+    assert (tmp_path / "adapter" / "adapter_model.safetensors").exists()
+    assert result.stdout.count("rank 0 finished") == 1
@@ -0,0 +1,157 @@
+"""
+Pre-flight training estimate tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from scripts.estimate import (
+    GIB,
+    ModelShape,
+    estimate_training,
+    format_estimate,
+    load_model_config,
+)
+from tests.utils.mock_helpers import require_real_module
+
+# Dimensions from Qwen/Qwen3-Coder-30B-A3B-Instruct's config.json
+QWEN3_30B_A3B = {
+    "hidden_size": 2048,
+    "num_hidden_layers": 48,
+    "num_attention_heads": 32,
+    "num_key_value_heads": 4,
+    "head_dim": 128,
+    "intermediate_size": 6144,
+    "moe_intermediate_size": 768,
+    "num_experts": 128,
+    "num_experts_per_tok": 8,
+    "decoder_sparse_step": 1,
+    "mlp_only_layers": [],
+    "vocab_size": 151936,
+    "max_position_embeddings": 262144,
+    "tie_word_embeddings": False,
+}
+
+
+@pytest.fixture
+def training_config(base_config):
+    """Provide a deep copy of the base config that tests can modify"""
+    return json.loads(json.dumps(base_config))
+
+
+def test_model_shape_counts_moe_parameters():
+    """Test that the 30B-A3B shape matches its published parameter counts"""
+    shape = ModelShape.from_config(QWEN3_30B_A3B)
+    groups = shape.linear_groups()
+    total = sum(g.params for g in groups) + shape.embedding_params
+    active = sum(g.in_features * g.out_features * g.active for g in groups)
+
+    assert shape.num_moe_layers == 48
+    assert total / 1e9 == pytest.approx(30.5, abs=0.2)
+    assert (active + shape.embedding_params / 2) / 1e9 == pytest.approx(3.3, abs=0.3)
+
+
+def test_estimate_components_scale_with_config(training_config):
+    """Test that memory components respond to the settings that drive them"""
+    base = estimate_training(training_config, QWEN3_30B_A3B)
+
+    training_config["training"]["max_seq_length"] *= 2
+    longer = estimate_training(training_config, QWEN3_30B_A3B)
+    assert longer["memory"]["activations"] > base["memory"]["activations"]
+    assert longer["memory"]["logits"] == pytest.approx(2 * base["memory"]["logits"])
+    assert longer["memory"]["weights"] == base["memory"]["weights"]
+
+    training_config["lora"]["target_modules"] = ["q_proj", "k_proj", "v_proj", "o_proj"]
+    attention_only = estimate_training(training_config, QWEN3_30B_A3B)
+    assert attention_only["lora_params"] < base["lora_params"] / 10
+
+
+def test_estimate_quantization_and_checkpointing(training_config):
+    """Test that 4-bit weights and gradient checkpointing shrink their components"""
+    quantized = estimate_training(training_config, QWEN3_30B_A3B)
+    assert quantized["gradient_checkpointing"] is True
+
+    training_config["model"]["load_in_4bit"] = False
+    full = estimate_training(training_config, QWEN3_30B_A3B)
+    assert full["memory"]["weights"] > 3 * quantized["memory"]["weights"]
+    assert full["memory"]["activations"] > quantized["memory"]["activations"]
+    assert full["step_time"] < quantized["step_time"]
+
+
+def test_estimate_selective_checkpointing(training_config):
+    """Test that selective checkpointing lands between full checkpointing and none"""
+    estimates = {}
+    for mode in ("off", "selective", "non_reentrant"):
+        training_config["training"]["gradient_checkpointing"] = mode
+        estimates[mode] = estimate_training(training_config, QWEN3_30B_A3B)
+
+    activations = {mode: e["memory"]["activations"] for mode, e in estimates.items()}
+    assert activations["off"] > activations["selective"] > activations["non_reentrant"]
+    assert estimates["off"]["step_time"] < estimates["selective"]["step_time"]
+    assert estimates["selective"]["step_time"] < estimates["non_reentrant"]["step_time"]
+    assert "Gradient checkpointing: selective" in format_estimate(estimates["selective"])
+
+
+def test_estimate_chunked_loss_bounds_logits(training_config):
+    """Test that the chunked loss caps logits memory at one chunk"""
+    full = estimate_training(training_config, QWEN3_30B_A3B)
+    training_config["training"]["loss_chunk_size"] = 256
+    chunked = estimate_training(training_config, QWEN3_30B_A3B)
+
+    tokens = (
+        training_config["training"]["batch_size"] * training_config["training"]["max_seq_length"]
+    )
+    assert chunked["memory"]["logits"] == pytest.approx(full["memory"]["logits"] * 256 / tokens)
+
+
+def test_estimate_report_flags_configs_that_do_not_fit(training_config):
+    """Test that the report says when a config will not fit the device"""
+    training_config["training"]["max_seq_length"] = 65536
+    training_config["training"]["batch_size"] = 8
+    estimate = estimate_training(training_config, QWEN3_30B_A3B, "rtx4090")
+    report = format_estimate(estimate)
+
+    assert estimate["device_memory"] == 24 * GIB
+    assert "rtx4090: 24 GiB available" in report
+    assert "does NOT fit" in report
+    assert "weights" in report and "optimizer" in report
+    assert "tokens/s" in report
+
+
+def test_load_model_config_from_local_directory(tmp_path):
+    """Test that a local model directory's config.json is read without the Hub"""
+    (tmp_path / "config.json").write_text(json.dumps(QWEN3_30B_A3B))
+    assert load_model_config(str(tmp_path))["num_experts"] == 128
+
+
+@pytest.mark.parametrize("moe", [False, True])
+def test_linear_groups_match_real_model(moe):
+    """Test that counted linear parameters match an instantiated tiny model"""
+    require_real_module("torch")
+    transformers = require_real_module("transformers")
+
+    settings = {
+        "vocab_size": 64,
+        "hidden_size": 32,
+        "intermediate_size": 48,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 4,
+        "num_key_value_heads": 2,
+        "head_dim": 8,
+        "tie_word_embeddings": False,
+    }
+    if moe:
+        config = transformers.Qwen3MoeConfig(
+            **settings, num_experts=4, num_experts_per_tok=2, moe_intermediate_size=16
+        )
+    else:
+        config = transformers.Qwen3Config(**settings)
+    model = transformers.AutoModelForCausalLM.from_config(config)
+
+    shape = ModelShape.from_config(config.to_dict())
+    counted = sum(g.params for g in shape.linear_groups()) + shape.embedding_params
+    actual = sum(
+        p.numel() for name, p in model.named_parameters() if p.dim() >= 2 and "norm" not in name
+    )
+    assert counted == actual
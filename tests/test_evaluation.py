@@ -0,0 +1,93 @@
+"""
+Evaluation and early stopping tests for LoRA training framework
+"""
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("datasets", "transformers")
+
+from scripts.evaluation import (
+    build_eval_dataset,
+    early_stopping_callbacks,
+    eval_cache_path,
+    evaluation_arguments,
+)
+
+
+@pytest.fixture
+def eval_config(tmp_path):
+    """Provide a merged config whose eval file exists on disk"""
+    eval_file = tmp_path / "eval.jsonl"
+    eval_file.write_text('{"instruction": "Spawn a ship", "output": "Sector():createShip()"}\n')
+    return {
+        "data": {"eval_file": str(eval_file)},
+        "prompt_template": "### Instruction:\n{instruction}\n\n### Response:\n{output}",
+        "training": {"batch_size": 2, "max_seq_length": 2048},
+        "output": {"save_steps": 100},
+        "evaluation": {"eval_steps": 50, "batch_size": 8, "early_stopping_patience": 3},
+    }
+
+
+def test_evaluation_arguments_enable_best_checkpoint(eval_config):
+    """Test that evaluation keeps the best checkpoint by eval loss"""
+    args = evaluation_arguments(eval_config, enabled=True)
+
+    assert args["eval_strategy"] == "steps"
+    assert args["eval_steps"] == 50
+    assert args["per_device_eval_batch_size"] == 8
+    assert args["prediction_loss_only"] is True
+    assert args["load_best_model_at_end"] is True
+    assert args["metric_for_best_model"] == "eval_loss"
+    assert args["greater_is_better"] is False
+    assert args["restore_callback_states_from_checkpoint"] is True
+
+
+def test_evaluation_arguments_disabled_without_eval_set(eval_config):
+    """Test that evaluation is turned off when there is no eval set"""
+    assert evaluation_arguments(eval_config, enabled=False) == {"eval_strategy": "no"}
+
+
+def test_evaluation_arguments_default_to_save_cadence(eval_config):
+    """Test that eval_steps and eval batch size fall back to training settings"""
+    eval_config = {**eval_config, "evaluation": {}}
+    args = evaluation_arguments(eval_config, enabled=True)
+
+    assert args["eval_steps"] == 100
+    assert args["per_device_eval_batch_size"] == 2
+
+
+def test_evaluation_arguments_reject_misaligned_steps(eval_config):
+    """Test that save_steps must line up with eval_steps"""
+    eval_config = {**eval_config, "evaluation": {"eval_steps": 30}}
+    with pytest.raises(ValueError, match="multiple"):
+        evaluation_arguments(eval_config, enabled=True)
+
+
+def test_early_stopping_requires_eval_and_patience(eval_config):
+    """Test that early stopping is only added when it can work"""
+    assert len(early_stopping_callbacks(eval_config, enabled=True)) == 1
+    assert early_stopping_callbacks(eval_config, enabled=False) == []
+
+    no_patience = {**eval_config, "evaluation": {"early_stopping_patience": 0}}
+    assert early_stopping_callbacks(no_patience, enabled=True) == []
+
+
+def test_eval_cache_path_tracks_inputs(eval_config):
+    """Test that the tokenized eval cache is invalidated by relevant changes"""
+    original = eval_cache_path(eval_config, "Qwen/Qwen3-Coder-30B-A3B-Instruct")
+
+    assert original == eval_cache_path(eval_config, "Qwen/Qwen3-Coder-30B-A3B-Instruct")
+    assert original.parent.name == ".cache"
+
+    longer = {**eval_config, "training": {"batch_size": 2, "max_seq_length": 4096}}
+    assert eval_cache_path(longer, "Qwen/Qwen3-Coder-30B-A3B-Instruct") != original
+    assert eval_cache_path(eval_config, "other/tokenizer") != original
+
+
+def test_build_eval_dataset_skips_missing_file(eval_config, tmp_path):
+    """Test that a missing eval file disables evaluation instead of failing"""
+    missing = {**eval_config, "data": {"eval_file": str(tmp_path / "missing.jsonl")}}
+    assert build_eval_dataset(missing, tokenizer=None) is None
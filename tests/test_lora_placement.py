@@ -0,0 +1,224 @@
+"""
+MoE-aware LoRA placement tests for LoRA training framework
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_moe, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft")
+
+from scripts.lora_placement import (
+    find_target_modules,
+    placement_report,
+    resolve_placement,
+    restrict_fused_experts,
+    routing_histogram,
+    select_targets,
+    top_experts,
+)
+
+TARGETS = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+
+def build_per_expert_moe():
+    """Two-layer module tree in the per-expert layout: 4 routed experts and a shared expert"""
+    torch = require_real_module("torch")
+    nn = torch.nn
+
+    def mlp():
+        block = nn.Module()
+        block.gate_proj = nn.Linear(16, 32, bias=False)
+        block.up_proj = nn.Linear(16, 32, bias=False)
+        block.down_proj = nn.Linear(32, 16, bias=False)
+        return block
+
+    def layer():
+        attention = nn.Module()
+        for name in ("q_proj", "k_proj", "v_proj", "o_proj"):
+            setattr(attention, name, nn.Linear(16, 16, bias=False))
+        moe = nn.Module()
+        moe.gate = nn.Linear(16, 4, bias=False)
+        moe.experts = nn.ModuleList([mlp() for _ in range(4)])
+        moe.shared_expert = mlp()
+        block = nn.Module()
+        block.self_attn = attention
+        block.mlp = moe
+        return block
+
+    model = nn.Module()
+    model.model = nn.Module()
+    model.model.layers = nn.ModuleList([layer(), layer()])
+    model.config = SimpleNamespace(num_experts=4, num_experts_per_tok=2)
+    return model
+
+
+def lora_config(placement="all", top_k=1):
+    return {
+        "lora": {"r": 4, "target_modules": TARGETS, "placement": placement, "top_k_experts": top_k},
+        "training": {"optim": "adamw_torch"},
+    }
+
+
+def test_modules_are_classified():
+    """Test that matched modules are split into attention, shared and routed experts"""
+    targets = find_target_modules(build_per_expert_moe(), TARGETS)
+    kinds = [t.kind for t in targets]
+
+    assert kinds.count("attention") == 8
+    assert kinds.count("shared_expert") == 6
+    assert kinds.count("routed_expert") == 24
+    routed = [t for t in targets if t.kind == "routed_expert"]
+    assert {(t.layer, t.expert) for t in routed} == {
+        (layer, e) for layer in range(2) for e in range(4)
+    }
+
+
+def test_policies_nest():
+    """Test that each placement policy adds to the one before it"""
+    targets = find_target_modules(build_per_expert_moe(), TARGETS)
+    chosen = {0: {1}, 1: {3}}
+
+    counts = {
+        policy: len(select_targets(targets, policy, chosen))
+        for policy in ("attention", "shared_expert", "top_k_experts", "all")
+    }
+
+    assert counts == {"attention": 8, "shared_expert": 14, "top_k_experts": 20, "all": 38}
+    selected = select_targets(targets, "top_k_experts", chosen)
+    assert "model.layers.1.mlp.experts.3.up_proj" in [t.name for t in selected]
+    assert "model.layers.1.mlp.experts.1.up_proj" not in [t.name for t in selected]
+    with pytest.raises(ValueError, match="lora.placement"):
+        select_targets(targets, "experts_only")
+
+
+def test_top_experts_follow_histogram():
+    """Test that the most-routed experts of each layer are chosen"""
+    torch = require_real_module("torch")
+    histogram = {0: torch.tensor([5, 40, 1, 30]), 1: torch.tensor([9, 0, 0, 2])}
+
+    assert top_experts(histogram, 2) == {0: {1, 3}, 1: {0, 3}}
+
+
+def test_report_shows_savings():
+    """Test that the report gives parameters, memory and compute of every policy relative to all"""
+    torch = require_real_module("torch")
+    model = build_per_expert_moe()
+    histogram = {0: torch.tensor([10, 0, 0, 10]), 1: torch.tensor([5, 5, 5, 5])}
+
+    rows = {row["policy"]: row for row in placement_report(model, lora_config(top_k=1), histogram)}
+
+    assert rows["all"]["params_vs_all"] == 1.0
+    assert rows["attention"]["lora_params"] == 8 * 4 * (16 + 16)
+    assert rows["attention"]["lora_params"] < rows["shared_expert"]["lora_params"]
+    assert (
+        rows["shared_expert"]["lora_params"]
+        < rows["top_k_experts"]["lora_params"]
+        < rows["all"]["lora_params"]
+    )
+    # fp32 weights + gradients + AdamW's two fp32 moments
+    assert rows["attention"]["memory_bytes"] == rows["attention"]["lora_params"] * 16
+    # Routed experts only see the tokens sent to them, so compute shrinks less than parameters
+    assert rows["top_k_experts"]["compute_vs_all"] > rows["top_k_experts"]["params_vs_all"]
+
+
+def test_routing_histogram_counts_every_routed_token():
+    """Test that the router hooks count top-k choices for every token and layer"""
+    model = build_tiny_moe()
+    examples = random_token_examples(3, min_length=5, max_length=9)
+
+    histogram = routing_histogram(model, examples)
+
+    tokens = sum(len(example["input_ids"]) for example in examples)
+    assert sorted(histogram) == [0, 1]
+    assert all(counts.sum().item() == tokens * 2 for counts in histogram.values())
+
+
+def test_attention_placement_trains_only_attention():
+    """Test that the resolved module list drives PEFT to adapt attention only"""
+    peft = require_real_module("peft")
+    model = build_tiny_moe()
+
+    placement = resolve_placement(model, lora_config("attention"))
+    peft_model = peft.get_peft_model(
+        model, peft.LoraConfig(r=4, target_modules=placement.target_modules)
+    )
+
+    trainable = [name for name, p in peft_model.named_parameters() if p.requires_grad]
+    assert trainable and all("self_attn" in name for name in trainable)
+
+
+def test_fused_experts_are_counted_per_expert():
+    """Test that stacked gate_up_proj/down_proj weights count as one target per expert"""
+    model = build_tiny_moe()
+    targets = find_target_modules(model, TARGETS)
+    fused = [t for t in targets if t.fused]
+
+    # 2 layers x 4 experts x (gate_up_proj, down_proj)
+    assert len(fused) == 16 and all(t.kind == "routed_expert" for t in fused)
+    gate_up = next(t for t in fused if t.name == "model.layers.0.mlp.experts.gate_up_proj")
+    assert (gate_up.in_features, gate_up.out_features) == (16, 2 * 8)
+    assert not find_target_modules(model, ["q_proj"])[-1].fused
+
+    rows = {row["policy"]: row for row in placement_report(model, lora_config(top_k=1))}
+    expert_params = 2 * 4 * 4 * ((16 + 16) + (8 + 16))
+    assert rows["all"]["lora_params"] - rows["attention"]["lora_params"] == expert_params
+    # One expert per layer trains, but each layer's whole stack is allocated
+    assert (
+        rows["top_k_experts"]["lora_params"]
+        == rows["attention"]["lora_params"] + expert_params // 4
+    )
+    assert rows["top_k_experts"]["memory_bytes"] == rows["all"]["memory_bytes"]
+    # PEFT maps the projection names onto the stacks itself, but they rule out lora_dropout
+    assert resolve_placement(model, lora_config("all")).fused_experts
+
+
+def test_top_k_trains_only_chosen_fused_experts():
+    """Test that top-k placement on fused experts goes through target_parameters and trains only those slices"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    model = build_tiny_moe()
+    examples = random_token_examples(4, min_length=6, max_length=10)
+    chosen = top_experts(routing_histogram(model, examples), 1)
+
+    placement = resolve_placement(model, lora_config("top_k_experts"), examples)
+    assert placement.target_parameters == [
+        f"model.layers.{layer}.mlp.experts.{name}"
+        for layer in (0, 1)
+        for name in ("down_proj", "gate_up_proj")
+    ]
+    assert placement.experts["model.layers.1.mlp.experts.down_proj"] == chosen[1]
+    peft_model = peft.get_peft_model(
+        model,
+        peft.LoraConfig(
+            r=4,
+            target_modules=placement.target_modules,
+            target_parameters=placement.target_parameters,
+        ),
+    )
+    restrict_fused_experts(peft_model, placement.experts)
+
+    optimizer = torch.optim.AdamW([p for p in peft_model.parameters() if p.requires_grad], lr=1e-2)
+    for example in examples:
+        input_ids = torch.tensor([example["input_ids"]])
+        peft_model(input_ids=input_ids, labels=input_ids).loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    for name, module in peft_model.named_modules():
+        if getattr(module, "parameter_name", None):
+            layer = int(name.split(".layers.")[1].split(".")[0])
+            delta = module.get_delta_weight("default")
+            trained = {expert for expert in range(4) if delta[expert].abs().sum() > 0}
+            assert trained == chosen[layer], name
+
+
+def test_dense_models_keep_configured_targets():
+    """Test that placement is a no-op on dense models"""
+    model = build_tiny_causal_lm()
+    placement = resolve_placement(model, lora_config("attention"))
+    assert placement.target_modules == TARGETS and not placement.fused_experts
@@ -0,0 +1,89 @@
+"""
+Multi-adapter training tests for LoRA training framework
+"""
+
+import copy
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "trl", "datasets")
+
+from scripts.train import check_shared_base
+
+
+def merged(base_config, domain_config):
+    """Merge a domain config over the base config"""
+    config = copy.deepcopy(base_config)
+    for key, value in domain_config.items():
+        if isinstance(value, dict) and key in config:
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+def test_configs_sharing_a_base_model_are_accepted(base_config, avorion_config, gdscript_config):
+    """Test that the Avorion and GDScript configs can share one loaded base"""
+    check_shared_base([merged(base_config, avorion_config), merged(base_config, gdscript_config)])
+
+
+def test_configs_with_different_base_models_are_rejected(
+    base_config, avorion_config, gdscript_config
+):
+    """Test that configs needing different base weights cannot share a load"""
+    other = merged(base_config, gdscript_config)
+    other["model"] = {**other["model"], "load_in_4bit": False}
+
+    with pytest.raises(ValueError, match="load_in_4bit"):
+        check_shared_base([merged(base_config, avorion_config), other])
+
+
+@pytest.mark.parametrize(
+    "section, key, value",
+    [
+        ("training", "attn_implementation", "eager"),
+        ("training", "gradient_checkpointing", "off"),
+        ("training", "checkpoint_every", 4),
+        ("distributed", "mode", "fsdp"),
+    ],
+)
+def test_configs_preparing_the_base_differently_are_rejected(
+    base_config, avorion_config, gdscript_config, section, key, value
+):
+    """Test that settings applied when loading the base must match across configs"""
+    other = merged(base_config, gdscript_config)
+    other[section] = {**other.get(section, {}), key: value}
+
+    with pytest.raises(ValueError, match=f"{section}.{key}"):
+        check_shared_base([merged(base_config, avorion_config), other])
+
+
+def test_sequential_adapters_share_base_weights(tmp_path):
+    """Test that unloading one adapter leaves a clean base for the next"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+
+    base = build_tiny_causal_lm()
+    original = {name: p.detach().clone() for name, p in base.named_parameters()}
+
+    for domain, target_modules in [("avorion", ["q_proj", "v_proj"]), ("gdscript", ["o_proj"])]:
+        lora_config = peft.LoraConfig(r=4, lora_alpha=8, target_modules=target_modules)
+        model = peft.get_peft_model(base, lora_config)
+        for name, param in model.named_parameters():
+            if "lora_B" in name:
+                torch.nn.init.normal_(param)
+        model.save_pretrained(tmp_path / domain)
+        base = model.unload()
+
+    assert not any("lora" in name for name, _ in base.named_parameters())
+    for name, param in base.named_parameters():
+        assert torch.equal(param, original[name]), name
+
+    avorion = peft.PeftConfig.from_pretrained(tmp_path / "avorion")
+    gdscript = peft.PeftConfig.from_pretrained(tmp_path / "gdscript")
+    assert set(avorion.target_modules) == {"q_proj", "v_proj"}
+    assert set(gdscript.target_modules) == {"o_proj"}
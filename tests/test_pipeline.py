@@ -0,0 +1,186 @@
+"""
+Pipeline runner and config loading tests for LoRA training framework
+"""
+
+import json
+
+import yaml
+
+from scripts.config_loader import config_hash, deep_merge, load_config
+from scripts.pipeline import Stage, build_stages, run_pipeline
+
+
+def test_deep_merge_keeps_nested_siblings():
+    """Test that overriding one nested key keeps the other keys of that section"""
+    base = {"training": {"batch_size": 4, "learning_rate": 2e-4}, "lora": {"r": 16}}
+    override = {"training": {"batch_size": 2}, "domain": "gdscript"}
+
+    merged = deep_merge(base, override)
+
+    assert merged == {
+        "training": {"batch_size": 2, "learning_rate": 2e-4},
+        "lora": {"r": 16},
+        "domain": "gdscript",
+    }
+    assert base["training"]["batch_size"] == 4
+
+
+def test_load_config_uses_sibling_base(tmp_path):
+    """Test that the base.yaml next to a domain config is merged underneath it"""
+    (tmp_path / "base.yaml").write_text(
+        yaml.dump({"evaluation": {"eval_steps": 100, "batch_size": 4}})
+    )
+    (tmp_path / "domain.yaml").write_text(yaml.dump({"evaluation": {"eval_steps": 50}}))
+
+    config = load_config(tmp_path / "domain.yaml")
+
+    assert config["evaluation"] == {"eval_steps": 50, "batch_size": 4}
+
+
+def test_config_hash_ignores_key_order():
+    """Test that equal configs hash the same regardless of key order"""
+    assert config_hash({"a": 1, "b": {"c": 2, "d": 3}}) == config_hash(
+        {"b": {"d": 3, "c": 2}, "a": 1}
+    )
+    assert config_hash({"a": 1}) != config_hash({"a": 2})
+
+
+def make_stages(tmp_path):
+    """Three chained fake stages: raw file -> dataset -> adapter"""
+    raw = tmp_path / "raw.txt"
+    dataset = tmp_path / "dataset.jsonl"
+    adapter = tmp_path / "adapter.bin"
+    raw.write_text("print('hello')")
+    return [
+        Stage("generate", ["generate"], inputs=[raw], outputs=[dataset]),
+        Stage(
+            "train",
+            ["train"],
+            inputs=[dataset],
+            params={"lr": 1e-4},
+            outputs=[adapter],
+            deps=["generate"],
+        ),
+        Stage("merge", ["merge"], outputs=[tmp_path / "merged"], deps=["train"]),
+    ]
+
+
+def fake_runner(log):
+    def run(stage):
+        log.append(stage.name)
+        for output in stage.outputs:
+            output.write_text(f"{stage.name} output")
+
+    return run
+
+
+def test_second_run_skips_everything(tmp_path):
+    """Test that an unchanged pipeline does no work the second time"""
+    stages = make_stages(tmp_path)
+    state = tmp_path / "state.json"
+    log = []
+
+    assert run_pipeline(stages, state, runner=fake_runner(log)) == ["generate", "train", "merge"]
+    assert run_pipeline(stages, state, runner=fake_runner(log)) == []
+    assert log == ["generate", "train", "merge"]
+    assert set(json.loads(state.read_text())) == {"generate", "train", "merge"}
+
+
+def test_changed_input_reruns_only_downstream(tmp_path):
+    """Test that editing a stage's input reruns that stage and what follows it"""
+    stages = make_stages(tmp_path)
+    state = tmp_path / "state.json"
+    run_pipeline(stages, state, runner=fake_runner([]))
+
+    stages[1].params = {"lr": 2e-4}
+    log = []
+    run_pipeline(stages, state, runner=fake_runner(log))
+    assert log == ["train", "merge"]
+
+    (tmp_path / "raw.txt").write_text("print('changed')")
+    log = []
+    run_pipeline(stages, state, runner=fake_runner(log))
+    assert log == ["generate", "train", "merge"]
+
+
+def test_missing_output_and_force_trigger_reruns(tmp_path):
+    """Test that deleted outputs and --force rerun a stage even with unchanged inputs"""
+    stages = make_stages(tmp_path)
+    state = tmp_path / "state.json"
+    run_pipeline(stages, state, runner=fake_runner([]))
+
+    (tmp_path / "merged").unlink()
+    log = []
+    run_pipeline(stages, state, runner=fake_runner(log))
+    assert log == ["merge"]
+
+    log = []
+    run_pipeline(stages, state, runner=fake_runner(log), force={"train"})
+    assert log == ["train", "merge"]
+
+
+def test_dry_run_does_not_execute(tmp_path):
+    """Test that a dry run reports stale stages without running or recording them"""
+    stages = make_stages(tmp_path)
+    state = tmp_path / "state.json"
+    log = []
+
+    assert run_pipeline(stages, state, runner=fake_runner(log), dry_run=True) == [
+        "generate",
+        "train",
+        "merge",
+    ]
+    assert log == []
+    assert not state.exists()
+
+
+def test_existing_dataset_is_adopted_not_regenerated(tmp_path):
+    """Test that a hand-made dataset with no recorded state is kept, and regenerated once its inputs change"""
+    stages = make_stages(tmp_path)
+    stages[0].adopt_existing = True
+    state = tmp_path / "state.json"
+    (tmp_path / "dataset.jsonl").write_text("hand-made")
+    log = []
+
+    assert run_pipeline(stages, state, runner=fake_runner(log)) == ["train", "merge"]
+    assert (tmp_path / "dataset.jsonl").read_text() == "hand-made"
+    assert set(json.loads(state.read_text())) == {"generate", "train", "merge"}
+
+    (tmp_path / "raw.txt").write_text("print('changed')")
+    assert run_pipeline(stages, state, runner=fake_runner(log)) == ["generate", "train", "merge"]
+
+
+def test_build_stages_for_shipped_config():
+    """Test that the real configs produce the full stage chain"""
+    config = load_config("config/gdscript.yaml")
+    stages = build_stages("config/gdscript.yaml", config)
+
+    assert [stage.name for stage in stages] == ["generate", "train", "merge", "convert"]
+    assert stages[1].command[-2:] == ["--config", "config/gdscript.yaml"]
+    # generate_dataset.py defaults to 3 samples; the pipeline always says how many it wants
+    assert stages[0].command[-4:] == ["--mode", "live", "--limit", "0"]
+    assert stages[0].adopt_existing
+
+
+def test_pruning_adds_score_stage():
+    """Test that enabling pruning scores the dataset before training and feeds the scores in"""
+    config = load_config("config/gdscript.yaml")
+    config["pruning"]["drop_easiest"] = 0.2
+    stages = {stage.name: stage for stage in build_stages("config/gdscript.yaml", config)}
+
+    assert list(stages) == ["generate", "score", "train", "merge", "convert"]
+    assert stages["train"].deps == ["generate", "score"]
+    assert stages["score"].outputs[0] in stages["train"].inputs
+
+
+def test_quantization_adds_stage_without_retraining():
+    """Test that a quantization format quantizes before convert and leaves the training hash alone"""
+    config = load_config("config/gdscript.yaml")
+    plain = {stage.name: stage for stage in build_stages("config/gdscript.yaml", config)}
+    config["quantization"]["format"] = "int4"
+    stages = {stage.name: stage for stage in build_stages("config/gdscript.yaml", config)}
+
+    assert list(stages) == ["generate", "train", "merge", "quantize", "convert"]
+    assert stages["convert"].deps == ["quantize"]
+    assert stages["convert"].command[3] == str(stages["quantize"].outputs[0].parent)
+    assert stages["train"].params == plain["train"].params
@@ -0,0 +1,114 @@
+"""
+Batched tokenization tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_tokenizer
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("datasets", "transformers")
+
+from scripts.bench_preprocess import core_counts, format_results, run_benchmark
+from scripts.preprocess import (
+    build_train_dataset,
+    format_batch,
+    tokenize_dataset,
+    tokenized_cache_path,
+)
+
+TEMPLATE = "### Instruction:\n{instruction}\n\n### Response:\n{output}"
+
+
+def examples(count):
+    return [
+        {
+            "instruction": f"Write function {i}",
+            "output": f"function f{i}() return {i * 7} end",
+            "domain": "avorion",
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def train_config(tmp_path):
+    """Provide a merged config with a training file on disk"""
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text("".join(json.dumps(example) + "\n" for example in examples(40)))
+    return {
+        "data": {"train_file": str(train_file), "num_proc": 1, "tokenize_batch_size": 8},
+        "prompt_template": TEMPLATE,
+        "training": {"max_seq_length": 32},
+    }
+
+
+def test_format_batch_matches_template():
+    """Test that columnar batches format exactly like individual examples"""
+    rows = examples(3)
+    batch = {key: [row[key] for row in rows] for key in rows[0]}
+
+    assert format_batch(batch, TEMPLATE) == [TEMPLATE.format(**row) for row in rows]
+
+
+@pytest.mark.parametrize("num_proc", [1, 2])
+def test_batched_tokenization_matches_per_example(train_config, num_proc):
+    """Test that batched, multi-process tokenization gives the same ids as one example at a time"""
+    datasets = require_real_module("datasets")
+    tokenizer = build_tiny_tokenizer()
+    rows = examples(20)
+
+    tokenized = tokenize_dataset(
+        datasets.Dataset.from_list(rows), tokenizer, train_config, num_proc=num_proc
+    )
+
+    expected = [tokenizer(TEMPLATE.format(**row), truncation=True, max_length=32) for row in rows]
+    assert tokenized.column_names == ["input_ids", "attention_mask"]
+    assert tokenized["input_ids"] == [encoding["input_ids"] for encoding in expected]
+    assert max(len(ids) for ids in tokenized["input_ids"]) == 32
+
+
+def test_train_dataset_is_cached(train_config):
+    """Test that the tokenized training set is cached and the key follows the template"""
+    require_real_module("datasets")
+    tokenizer = build_tiny_tokenizer()
+
+    raw, dataset = build_train_dataset(train_config, tokenizer)
+    cache_file = tokenized_cache_path(train_config["data"]["train_file"], train_config, "", "train")
+
+    assert len(raw) == len(dataset) == 40
+    assert cache_file.exists()
+    _, again = build_train_dataset(train_config, tokenizer)
+    assert again.cache_files[0]["filename"] == str(cache_file)
+
+    edited = {**train_config, "prompt_template": TEMPLATE + "\n"}
+    assert (
+        tokenized_cache_path(train_config["data"]["train_file"], edited, "", "train") != cache_file
+    )
+
+
+def test_core_counts_double_up_to_limit():
+    """Test that the benchmark sweeps powers of two and the full core count"""
+    assert core_counts(1) == [1]
+    assert core_counts(6) == [1, 2, 4, 6]
+    assert core_counts(8) == [1, 2, 4, 8]
+
+
+def test_benchmark_reports_throughput(train_config):
+    """Test that the benchmark reports examples/s and speedup for every process count"""
+    datasets = require_real_module("datasets")
+    dataset = datasets.Dataset.from_list(examples(50))
+
+    results = run_benchmark(dataset, build_tiny_tokenizer(), train_config, [1, 2])
+
+    assert [(r["mode"], r["num_proc"]) for r in results] == [
+        ("per_example", 1),
+        ("batched", 1),
+        ("batched", 2),
+    ]
+    assert all(r["examples_per_s"] > 0 for r in results)
+    assert results[1]["speedup"] == pytest.approx(1.0)
+    assert "batched" in format_results(results, len(dataset))
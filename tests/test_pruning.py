@@ -0,0 +1,118 @@
+"""
+Loss scoring and data pruning tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers")
+
+from scripts.pruning import load_scores, pruned_indices, select_examples, source_of, write_scores
+from scripts.score import score_dataset
+
+
+def scores(losses, sources=None):
+    sources = sources or [None] * len(losses)
+    return [
+        {"loss": loss, "tokens": 10, "source": source}
+        for loss, source in zip(losses, sources, strict=True)
+    ]
+
+
+@pytest.fixture
+def scored_config(tmp_path):
+    """Provide a config whose training file has been scored"""
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text(
+        "".join(json.dumps({"instruction": str(i), "output": str(i)}) + "\n" for i in range(4))
+    )
+    config = {
+        "model": {"name": "tiny-base"},
+        "data": {"train_file": str(train_file)},
+        "prompt_template": "{instruction}\n{output}",
+        "training": {"max_seq_length": 64},
+        "pruning": {"drop_easiest": 0.5},
+    }
+    write_scores(tmp_path / "scores.json", config, "base", scores([0.5, 2.0, 0.1, 1.0]))
+    return config
+
+
+def test_drop_easiest_keeps_highest_loss():
+    """Test that the lowest-loss fraction is dropped and the original order is kept"""
+    assert select_examples(scores([0.5, 2.0, 0.1, 1.0]), drop_easiest=0.5) == [1, 3]
+    assert select_examples(scores([0.5, 2.0, 0.1, 1.0])) == [0, 1, 2, 3]
+    with pytest.raises(ValueError, match="drop_easiest"):
+        select_examples(scores([1.0]), drop_easiest=1.0)
+
+
+def test_max_per_source_keeps_hardest_of_each_file():
+    """Test that each source file contributes at most N examples, the hardest ones"""
+    entries = scores([0.3, 0.9, 0.5, 0.2, 0.8], ["a.lua", "a.lua", "a.lua", None, "b.lua"])
+
+    assert select_examples(entries, max_per_source=2) == [1, 2, 3, 4]
+
+
+def test_source_lookup_follows_dotted_key():
+    """Test that nested metadata fields name the source file"""
+    example = {"metadata": {"file_path": "ships/miner.lua"}}
+    assert source_of(example, "metadata.file_path") == "ships/miner.lua"
+    assert source_of(example, "metadata.missing") is None
+
+
+def test_pruned_indices_use_the_scores_file(scored_config, capsys):
+    """Test that training reads the scores next to the data and reports the tokens kept"""
+    assert pruned_indices(scored_config) == [1, 3]
+    assert "20/40 tokens" in capsys.readouterr().out
+
+
+def test_stale_scores_are_rejected(scored_config, tmp_path):
+    """Test that scores computed for another version of the data are not used"""
+    with open(scored_config["data"]["train_file"], "a") as f:
+        f.write(json.dumps({"instruction": "new", "output": "new"}) + "\n")
+    with pytest.raises(ValueError, match="train_file_sha256; rerun"):
+        load_scores(scored_config)
+
+    missing = {**scored_config, "pruning": {"scores_file": str(tmp_path / "nope.json")}}
+    with pytest.raises(FileNotFoundError, match="lora score"):
+        load_scores(missing)
+
+
+@pytest.mark.parametrize(
+    "section, key, value",
+    [
+        (None, "prompt_template", "{output}"),
+        ("model", "name", "other-base"),
+        ("training", "max_seq_length", 32),
+    ],
+)
+def test_scores_for_other_tokenization_are_rejected(scored_config, section, key, value):
+    """Test that a changed template, tokenizer or sequence length invalidates the scores"""
+    if section:
+        scored_config[section] = {**scored_config[section], key: value}
+    else:
+        scored_config[key] = value
+    with pytest.raises(ValueError, match="rerun `lora score`"):
+        load_scores(scored_config)
+
+
+def test_batched_scores_match_per_example_loss():
+    """Test that the length-sorted, padded, chunked pass gives each example's own loss"""
+    torch = require_real_module("torch")
+    datasets = require_real_module("datasets")
+    model = build_tiny_causal_lm()
+    examples = random_token_examples(7, min_length=4, max_length=20)
+    dataset = datasets.Dataset.from_list(examples)
+
+    results = score_dataset(model, dataset, pad_token_id=0, batch_size=3, chunk_size=5)
+
+    for example, result in zip(examples, results, strict=True):
+        input_ids = torch.tensor([example["input_ids"]])
+        with torch.no_grad():
+            expected = model(input_ids=input_ids, labels=input_ids).loss.item()
+        assert result["loss"] == pytest.approx(expected, rel=1e-5)
+        assert result["tokens"] == len(example["input_ids"])
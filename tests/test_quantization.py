@@ -0,0 +1,193 @@
+"""
+Offline weight quantization tests for LoRA training framework
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_moe, build_tiny_tokenizer
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "safetensors")
+
+from scripts import convert_vllm, quantize
+from scripts.quantization import (
+    REPORT_NAME,
+    collect_importance,
+    dequantized_shards,
+    load_dequantized,
+    pack_rows,
+    quantizable,
+    quantize_groups,
+    quantize_model,
+    unpack_rows,
+)
+
+CONFIG = str(Path(__file__).resolve().parents[1] / "config" / "avorion.yaml")
+VOCAB_SIZE = 257  # the tiny byte-level tokenizer's vocabulary
+
+
+@pytest.fixture
+def merged_dir(tmp_path):
+    """Save a tiny merged model in two shards with a tokenizer"""
+    model_dir = tmp_path / "merged"
+    build_tiny_causal_lm(vocab_size=VOCAB_SIZE).save_pretrained(model_dir, max_shard_size="40KB")
+    build_tiny_tokenizer().save_pretrained(model_dir)
+    return model_dir
+
+
+@pytest.mark.parametrize("bits", [4, 8])
+def test_pack_rows_round_trips(bits):
+    """Test that GPTQ packing into int32 words loses nothing, including the sign bit"""
+    torch = require_real_module("torch")
+    values = torch.randint(0, 2**bits, (64, 24))
+    values[: 32 // bits, 0] = 2**bits - 1
+
+    packed = pack_rows(values, bits)
+    assert packed.dtype == torch.int32 and packed.shape == (64 * bits // 32, 24)
+    assert torch.equal(unpack_rows(packed, bits), values)
+
+
+@pytest.mark.parametrize(
+    "key", ["mlp.gate.weight", "mlp.shared_expert_gate.weight", "block_sparse_moe.router.weight"]
+)
+def test_moe_gates_stay_unquantized(key):
+    """Test that routers and Qwen-MoE's 1 x hidden shared-expert gate keep full precision in every format"""
+    assert quantizable("model.layers.0.mlp.experts.0.up_proj.weight", [128, 128], "int4", 128)
+    for fmt in ("int4", "fp8"):
+        assert not quantizable(f"model.layers.0.{key}", [8, 128], fmt, 128)
+
+
+def test_calibrated_clipping_lowers_weighted_error():
+    """Test that searching the clipping range never does worse than round to nearest on the weighted error"""
+    torch = require_real_module("torch")
+    torch.manual_seed(0)
+    weight = torch.randn(16, 64)
+    weight[:, 3] *= 20  # an outlier channel that dominates its group's range
+    importance = torch.rand(64)
+
+    def weighted_error(levels, scales):
+        restored = levels.reshape(16, 4, 16) * scales.unsqueeze(-1)
+        return ((restored.reshape(16, 64) - weight) ** 2 * importance).sum()
+
+    assert weighted_error(*quantize_groups(weight, 4, 16, importance)) <= weighted_error(
+        *quantize_groups(weight, 4, 16)
+    )
+
+
+@pytest.mark.parametrize("fmt, max_error", [("int8", 0.01), ("int4", 0.15), ("fp8", 0.05)])
+def test_quantize_model_shrinks_and_restores_weights(merged_dir, tmp_path, fmt, max_error):
+    """Test that every layer weight is quantized, the size drops and dequantized weights stay close"""
+    torch = require_real_module("torch")
+    output_dir = tmp_path / fmt
+    report = quantize_model(merged_dir, output_dir, fmt, group_size=16)
+
+    assert report["quantized"] == 14  # 7 linear weights in each of 2 layers
+    assert report["output_bytes"] < report["input_bytes"]
+    assert report["weight_relative_error"] < max_error
+    config = json.loads((output_dir / "config.json").read_text())
+    assert config["quantization_config"]["quant_method"] == ("fp8" if fmt == "fp8" else "gptq")
+    assert (output_dir / "model.safetensors.index.json").exists()
+
+    original = build_tiny_causal_lm(vocab_size=VOCAB_SIZE).state_dict()
+    restored = {
+        key: tensor for state in dequantized_shards(output_dir) for key, tensor in state.items()
+    }
+    assert set(restored) == set(original)
+    assert torch.equal(restored["model.embed_tokens.weight"], original["model.embed_tokens.weight"])
+    key = "model.layers.0.mlp.down_proj.weight"
+    assert (restored[key] - original[key]).norm() / original[key].norm() < 2 * max_error
+
+
+def test_quantize_command_calibrates_and_reports(merged_dir, tmp_path, monkeypatch):
+    """Test the command end to end: calibration prompts from train.jsonl and a sample-prompt report"""
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text(
+        "".join(
+            json.dumps({"instruction": f"Write function {i}", "output": "return " * (i + 1)}) + "\n"
+            for i in range(6)
+        )
+    )
+    config = yaml.safe_load(Path(CONFIG).read_text())
+    config["data"] = {"train_file": str(train_file)}
+    config_file = tmp_path / "avorion.yaml"
+    config_file.write_text(yaml.dump(config))
+    (tmp_path / "base.yaml").write_text(Path(CONFIG).with_name("base.yaml").read_text())
+
+    output_dir = tmp_path / "int4"
+    quantize.main(
+        [
+            "--config",
+            str(config_file),
+            "--model",
+            str(merged_dir),
+            "--output",
+            str(output_dir),
+            "--format",
+            "int4",
+            "--group-size",
+            "16",
+            "--calibration-samples",
+            "4",
+            "--eval-samples",
+            "2",
+        ]
+    )
+
+    report = json.loads((output_dir / REPORT_NAME).read_text())
+    assert report["calibrated"] == 14
+    assert report["prompts"]["prompts"] == 2
+    assert 0.0 <= report["prompts"]["top1_agreement"] <= 1.0
+
+    monkeypatch.chdir(tmp_path)
+    convert_vllm.main(["--model", str(output_dir), "--name", "tiny", "--config", CONFIG])
+    assert (
+        yaml.safe_load((tmp_path / "tiny_vllm" / "vllm_config.yaml").read_text())["quantization"]
+        == "gptq"
+    )
+
+
+def test_fused_moe_experts_are_calibrated_and_loaded_per_expert(tmp_path):
+    """Test that fused experts get per-expert statistics and their quantized weights land in the fused tensors"""
+    torch = require_real_module("torch")
+    model = build_tiny_moe().eval()
+    model.save_pretrained(tmp_path / "merged")
+    prompts = [
+        torch.randint(0, 128, (16,), generator=torch.Generator().manual_seed(seed))
+        for seed in range(4)
+    ]
+
+    importance = collect_importance(model, prompts)
+    experts = {key: value for key, value in importance.items() if ".experts." in key}
+    assert len(experts) == 2 * 4 * 3  # checkpoint names of 4 experts x 3 projections per layer
+    gate, up = (
+        importance[f"model.layers.0.mlp.experts.1.{name}.weight"]
+        for name in ("gate_proj", "up_proj")
+    )
+    assert gate.shape == (16,) and torch.equal(gate, up)
+    assert importance["model.layers.0.mlp.experts.1.down_proj.weight"].shape == (8,)
+
+    report = quantize_model(
+        tmp_path / "merged", tmp_path / "int8", "int8", group_size=8, importance=importance
+    )
+    assert report["quantized"] == 2 * (
+        4 + 4 * 3
+    )  # attention and 4 experts x 3 projections per layer
+
+    restored = {
+        key: tensor
+        for state in dequantized_shards(tmp_path / "int8")
+        for key, tensor in state.items()
+    }
+    served = build_tiny_moe(seed=1)
+    load_dequantized(served, tmp_path / "int8")
+    gate_up = served.model.layers[1].mlp.experts.gate_up_proj
+    assert torch.equal(gate_up[2, :8], restored["model.layers.1.mlp.experts.2.gate_proj.weight"])
+    assert torch.equal(gate_up[2, 8:], restored["model.layers.1.mlp.experts.2.up_proj.weight"])
+
+    with pytest.raises(ValueError, match="not in the quantized checkpoint"):
+        load_dequantized(build_tiny_moe(num_hidden_layers=3), tmp_path / "int8")
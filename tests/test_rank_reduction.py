@@ -0,0 +1,189 @@
+"""
+LoRA rank reduction tests for LoRA training framework
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_moe, build_tiny_tokenizer
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "safetensors")
+
+from scripts import reduce_rank
+from scripts.rank_reduction import REPORT_NAME, reduce_adapter, truncated_factors
+
+REPO = Path(__file__).resolve().parents[1]
+VOCAB_SIZE = 257  # the tiny byte-level tokenizer's vocabulary
+TARGETS = ["q_proj", "v_proj", "down_proj"]
+MOE_TARGETS = ["q_proj", "v_proj", "gate_proj", "up_proj", "down_proj"]
+
+
+def save_adapter(
+    tmp_path, intrinsic_rank=2, build=build_tiny_causal_lm, targets=TARGETS, **lora_overrides
+):
+    """Save a tiny base model and an r=8 adapter whose updates have only intrinsic_rank directions"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    base_dir = tmp_path / "base"
+    build(vocab_size=VOCAB_SIZE).save_pretrained(base_dir)
+    build_tiny_tokenizer().save_pretrained(base_dir)
+
+    settings = {"r": 8, "lora_alpha": 16, "target_modules": targets, "task_type": "CAUSAL_LM"}
+    settings.update(lora_overrides)
+    model = peft.get_peft_model(build(vocab_size=VOCAB_SIZE), peft.LoraConfig(**settings))
+    torch.manual_seed(1)
+    with torch.no_grad():
+        for name, parameter in model.named_parameters():
+            if "lora_A" in name:
+                rows = parameter.shape[0]
+                parameter.copy_(
+                    torch.randn(rows, intrinsic_rank)
+                    @ torch.randn(intrinsic_rank, parameter.shape[1])
+                )
+            elif "lora_B" in name:
+                parameter.normal_(std=0.5)
+    adapter_dir = tmp_path / "adapter"
+    model.save_pretrained(adapter_dir)
+    return base_dir, adapter_dir
+
+
+def adapter_logits(base_dir, adapter_dir):
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+    transformers = require_real_module("transformers")
+    base = transformers.AutoModelForCausalLM.from_pretrained(base_dir)
+    model = peft.PeftModel.from_pretrained(base, adapter_dir).eval()
+    with torch.no_grad():
+        return model(torch.arange(16).unsqueeze(0)).logits
+
+
+def test_truncated_factors_keep_the_top_directions():
+    """Test that full rank reproduces the scaled update and truncation keeps the reported energy"""
+    torch = require_real_module("torch")
+    torch.manual_seed(0)
+    lora_a, lora_b = torch.randn(8, 48), torch.randn(32, 8)
+    delta = 2.0 * lora_b.double() @ lora_a.double()
+
+    new_a, new_b, stats = truncated_factors(lora_a, lora_b, 2.0, rank=8)
+    assert torch.allclose(new_b @ new_a, delta, atol=1e-9)
+    assert stats == {"rank_before": 8, "rank_after": 8, "retained_energy": pytest.approx(1.0)}
+
+    new_a, new_b, stats = truncated_factors(lora_a, lora_b, 2.0, rank=3)
+    singular = torch.linalg.svdvals(delta)
+    assert new_a.shape == (3, 48) and new_b.shape == (32, 3)
+    assert torch.linalg.matrix_norm(delta - new_b @ new_a) ** 2 == pytest.approx(
+        (singular[3:] ** 2).sum().item()
+    )
+    assert stats["retained_energy"] == pytest.approx(
+        ((singular[:3] ** 2).sum() / (singular**2).sum()).item()
+    )
+
+    _, _, stats = truncated_factors(lora_a, lora_b, 2.0, energy=stats["retained_energy"])
+    assert stats["rank_after"] == 3
+
+
+def test_energy_threshold_finds_intrinsic_rank_and_loads_in_peft(tmp_path):
+    """Test that a rank-2 update in an r=8 adapter shrinks to r=2 with the same outputs, rsLoRA included"""
+    torch = require_real_module("torch")
+    base_dir, adapter_dir = save_adapter(tmp_path, use_rslora=True, rank_pattern={"down_proj": 4})
+
+    report = reduce_adapter(adapter_dir, tmp_path / "reduced", energy=0.9999)
+
+    assert {module["rank_after"] for module in report["modules"]} == {2}
+    assert report["min_retained_energy"] > 0.9999
+    assert report["params_after"] < report["params_before"] / 3
+    config = json.loads((tmp_path / "reduced" / "adapter_config.json").read_text())
+    assert config["r"] == config["lora_alpha"] == 2 and not config["use_rslora"]
+    assert config["rank_pattern"] == {}
+    assert torch.allclose(
+        adapter_logits(base_dir, tmp_path / "reduced"),
+        adapter_logits(base_dir, adapter_dir),
+        atol=1e-4,
+    )
+
+
+def test_per_module_ranks_keep_unit_scaling(tmp_path):
+    """Test that modules reduced to different ranks get matching rank and alpha patterns"""
+    require_real_module("torch")
+    base_dir, adapter_dir = save_adapter(tmp_path, intrinsic_rank=8, rank_pattern={"down_proj": 2})
+
+    report = reduce_adapter(adapter_dir, tmp_path / "reduced", rank=4)
+
+    ranks = {
+        module["module"].rsplit(".", 1)[1]: module["rank_after"] for module in report["modules"]
+    }
+    assert ranks == {"q_proj": 4, "v_proj": 4, "down_proj": 2}
+    assert all(
+        module["retained_energy"] < 1.0
+        for module in report["modules"]
+        if "down_proj" not in module["module"]
+    )
+    config = json.loads((tmp_path / "reduced" / "adapter_config.json").read_text())
+    assert config["rank_pattern"] == config["alpha_pattern"]
+    assert set(config["rank_pattern"].values()) == {2}
+    # The reduced adapter loads in PEFT with each module's own rank
+    assert adapter_logits(base_dir, tmp_path / "reduced").shape[-1] == VOCAB_SIZE
+
+
+def test_fused_moe_experts_are_reduced_per_expert(tmp_path):
+    """Test that fused expert stacks shrink expert by expert to one rank and keep the adapter's outputs"""
+    torch = require_real_module("torch")
+    base_dir, adapter_dir = save_adapter(tmp_path, build=build_tiny_moe, targets=MOE_TARGETS)
+
+    report = reduce_adapter(adapter_dir, tmp_path / "reduced", energy=0.9999)
+
+    ranks = {
+        module["module"].rsplit(".", 1)[1]: module["rank_after"] for module in report["modules"]
+    }
+    assert ranks == {"q_proj": 2, "v_proj": 2, "gate_up_proj": 2, "down_proj": 2}
+    assert "model.layers.0.mlp.experts.gate_up_proj" in {
+        module["module"] for module in report["modules"]
+    }
+    assert torch.allclose(
+        adapter_logits(base_dir, tmp_path / "reduced"),
+        adapter_logits(base_dir, adapter_dir),
+        atol=1e-4,
+    )
+
+
+def test_reduce_command_reports_eval_loss_change(tmp_path):
+    """Test the command end to end: reduced adapter, report file and eval-loss change on held-out prompts"""
+    base_dir, adapter_dir = save_adapter(tmp_path)
+    eval_file = tmp_path / "eval.jsonl"
+    eval_file.write_text(
+        "".join(json.dumps({"instruction": f"Task {i}", "output": "done"}) + "\n" for i in range(3))
+    )
+    config = yaml.safe_load((REPO / "config" / "avorion.yaml").read_text())
+    config["model"]["name"] = str(base_dir)
+    config["data"] = {"train_file": str(tmp_path / "missing.jsonl"), "eval_file": str(eval_file)}
+    (tmp_path / "base.yaml").write_text((REPO / "config" / "base.yaml").read_text())
+    config_file = tmp_path / "avorion.yaml"
+    config_file.write_text(yaml.dump(config))
+
+    output_dir = tmp_path / "reduced"
+    reduce_rank.main(
+        [
+            "--config",
+            str(config_file),
+            "--adapter",
+            str(adapter_dir),
+            "--output",
+            str(output_dir),
+            "--rank",
+            "2",
+            "--eval-samples",
+            "3",
+        ]
+    )
+
+    report = json.loads((output_dir / REPORT_NAME).read_text())
+    assert report["target_rank"] == 2 and report["max_rank"] == 2
+    assert report["prompts"]["prompts"] == 3
+    assert report["prompts"]["loss_change"] == pytest.approx(0.0, abs=1e-4)
+    assert report["prompts"]["top1_agreement"] == 1.0
+    assert (output_dir / "adapter_model.safetensors").exists()
@@ -0,0 +1,133 @@
+"""
+Checkpoint resharding tests for LoRA training framework
+"""
+
+import json
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "safetensors")
+
+from scripts import reshard as reshard_command
+from scripts.reshard import (
+    INDEX_NAME,
+    SINGLE_SHARD_NAME,
+    cold_load_seconds,
+    natural_key,
+    plan_shards,
+    reshard,
+    shard_files,
+)
+
+
+def saved_model(tmp_path, max_shard_size="40KB"):
+    """Save a tiny model in uneven transformers-default shards"""
+    model_dir = tmp_path / "merged"
+    build_tiny_causal_lm().save_pretrained(model_dir, max_shard_size=max_shard_size)
+    return model_dir
+
+
+def load_tensors(model_dir):
+    safetensors = require_real_module("safetensors.torch")
+    tensors = {}
+    for path in shard_files(model_dir):
+        tensors.update(safetensors.load_file(path))
+    return tensors
+
+
+def test_reshard_preserves_every_tensor_in_even_shards(tmp_path):
+    """Test that resharding in small copy chunks keeps tensors bit-identical and balances shard sizes"""
+    torch = require_real_module("torch")
+    model_dir = saved_model(tmp_path)
+    total = json.loads((model_dir / INDEX_NAME).read_text())["metadata"]["total_size"]
+
+    summary = reshard(
+        model_dir, tmp_path / "resharded", shard_bytes=total // 3 + 1, chunk_bytes=1000
+    )
+
+    output_dir = tmp_path / "resharded"
+    assert summary["output_shards"] == 3
+    sizes = summary["output_shard_bytes"]
+    assert max(sizes) / min(sizes) < 1.5
+    index = json.loads((output_dir / INDEX_NAME).read_text())
+    assert index["metadata"]["total_size"] == total
+    assert sorted(set(index["weight_map"].values())) == [
+        f"model-0000{n}-of-00003.safetensors" for n in (1, 2, 3)
+    ]
+    assert not list(output_dir.glob("*.tmp"))
+
+    expected, actual = load_tensors(model_dir), load_tensors(output_dir)
+    assert expected.keys() == actual.keys()
+    assert all(torch.equal(expected[key], actual[key]) for key in expected)
+    # Each layer's tensors stay in one shard where they fit
+    assert (
+        index["weight_map"]["model.layers.0.mlp.up_proj.weight"]
+        == index["weight_map"]["model.layers.0.mlp.down_proj.weight"]
+    )
+
+
+def test_resharded_model_loads_and_old_layout_is_replaced(tmp_path):
+    """Test that transformers loads the output, and resharding again into one file removes the old shards"""
+    torch = require_real_module("torch")
+    transformers = require_real_module("transformers")
+    model_dir = saved_model(tmp_path)
+    output_dir = tmp_path / "resharded"
+    reshard(model_dir, output_dir, shard_bytes=20_000, ranks=4)
+    assert len(list(output_dir.glob("*.safetensors"))) % 4 == 0
+    assert (output_dir / "config.json").exists()
+
+    model = transformers.AutoModelForCausalLM.from_pretrained(output_dir)
+    reference = transformers.AutoModelForCausalLM.from_pretrained(model_dir)
+    tokens = torch.arange(8).unsqueeze(0)
+    assert torch.equal(model(tokens).logits, reference(tokens).logits)
+
+    reshard(model_dir, output_dir, shard_bytes=2**30)
+    assert [path.name for path in output_dir.glob("*.safetensors")] == [SINGLE_SHARD_NAME]
+    assert not (output_dir / INDEX_NAME).exists()
+
+
+def test_natural_key_orders_layers_numerically():
+    """Test that layer 10 sorts after layer 2"""
+    names = ["model.layers.10.mlp.weight", "model.layers.2.mlp.weight", "lm_head.weight"]
+    assert sorted(names, key=natural_key) == [
+        "lm_head.weight",
+        "model.layers.2.mlp.weight",
+        "model.layers.10.mlp.weight",
+    ]
+
+
+def test_shard_count_stays_a_multiple_of_ranks_around_large_tensors():
+    """Test that a tensor spanning several target shards does not leave a count that ranks cannot share"""
+    entries = [{"name": f"t{i}", "nbytes": nbytes} for i, nbytes in enumerate([10, 10, 60, 10, 10])]
+
+    # 4 slots of 25 bytes: the 60-byte tensor empties one, leaving 3 shards for 2 ranks
+    shards = plan_shards(entries, shard_bytes=25, ranks=2)
+
+    assert len(shards) % 2 == 0
+    assert [entry["name"] for shard in shards for entry in shard] == ["t0", "t1", "t2", "t3", "t4"]
+
+
+def test_reshard_command_benchmarks_cold_load(tmp_path, capsys):
+    """Test that the command reports shard sizes and cold-load times before and after"""
+    model_dir = saved_model(tmp_path)
+    assert cold_load_seconds(model_dir, threads=2) > 0
+
+    reshard_command.main(
+        [
+            "--model",
+            str(model_dir),
+            "--output",
+            str(tmp_path / "out"),
+            "--shard-size-gb",
+            "0.00005",
+            "--benchmark",
+            "--threads",
+            "2",
+        ]
+    )
+
+    output = capsys.readouterr().out
+    assert "before:" in output and "after:" in output
+    assert "Cold load with 2 threads" in output
@@ -0,0 +1,157 @@
+"""
+Fast resume tests for LoRA training framework
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, pad_collator, random_token_examples
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft")
+
+from scripts.async_checkpoint import AsyncCheckpointCallback
+from scripts.resume import (
+    DATALOADER_STATE_NAME,
+    DataloaderStateCallback,
+    ResumableSampler,
+    resumable_trainer,
+    rng_states,
+)
+
+
+class RecordingDataset:
+    """Token examples that record every index the dataloader reads"""
+
+    def __init__(self, examples):
+        self.examples = examples
+        self.reads = []
+
+    def __len__(self):
+        return len(self.examples)
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.examples[index]
+
+
+def lora_model():
+    peft = require_real_module("peft")
+    return peft.get_peft_model(
+        build_tiny_causal_lm(),
+        peft.LoraConfig(
+            r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"
+        ),
+    )
+
+
+def train(output_dir, max_steps, resume=None, callbacks=()):
+    """Train the tiny model for max_steps; return the indices read and the log entry of each step"""
+    transformers = require_real_module("transformers")
+    args = transformers.TrainingArguments(
+        output_dir=str(output_dir),
+        per_device_train_batch_size=2,
+        gradient_accumulation_steps=2,
+        num_train_epochs=3,
+        max_steps=max_steps,
+        learning_rate=1e-2,
+        lr_scheduler_type="constant",
+        logging_steps=1,
+        save_steps=3,
+        report_to="none",
+        use_cpu=True,
+    )
+    dataset = RecordingDataset(random_token_examples(18))
+    trainer = resumable_trainer(transformers.Trainer)(
+        model=lora_model(),
+        args=args,
+        train_dataset=dataset,
+        data_collator=pad_collator,
+        callbacks=[DataloaderStateCallback(), *callbacks],
+    )
+    trainer.train(resume_from_checkpoint=resume)
+    logs = {entry["step"]: entry for entry in trainer.state.log_history if "loss" in entry}
+    return dataset.reads, logs
+
+
+def test_sampler_state_round_trips():
+    """Test that a sampler restored from its state yields the rest of the same epoch"""
+    sampler = ResumableSampler(10, seed=3)
+    sampler.set_epoch(1)
+    full = list(sampler)
+
+    restored = ResumableSampler(10, seed=3)
+    restored.load_state_dict({"seed": 3, "epoch": 1, "position": 4, "num_examples": 10})
+    restored.set_epoch(1)
+
+    assert list(restored) == full[4:]
+    assert list(restored) == full  # the position applies once
+    assert len(restored) == 10
+    restored.set_epoch(2)
+    assert list(restored) != full
+    with pytest.raises(ValueError, match="examples"):
+        restored.load_state_dict({"seed": 3, "epoch": 1, "position": 4, "num_examples": 11})
+
+
+def test_resume_matches_uninterrupted_run_without_replay(tmp_path):
+    """Test that resuming mid-epoch reproduces the uninterrupted order and losses, reading nothing twice"""
+    # 18 examples, 2 per batch, 2 batches per step: epochs of 9 batches (a partial last step)
+    reference, reference_logs = train(tmp_path / "reference", max_steps=12)
+
+    train(tmp_path / "run", max_steps=6)
+    checkpoint = tmp_path / "run" / "checkpoint-6"
+    state = json.loads((checkpoint / DATALOADER_STATE_NAME).read_text())
+    assert state["epoch"] == 1 and state["position"] == 4
+
+    resumed, resumed_logs = train(tmp_path / "run", max_steps=12, resume=str(checkpoint))
+
+    # Six steps consumed all 18 examples of epoch 0 and 4 of epoch 1
+    assert resumed == reference[18 + 4 :]
+    for step in range(7, 13):
+        assert resumed_logs[step]["loss"] == pytest.approx(reference_logs[step]["loss"], rel=1e-5)
+        assert resumed_logs[step]["epoch"] == pytest.approx(reference_logs[step]["epoch"])
+
+
+def test_async_checkpoints_carry_dataloader_and_rng_state(tmp_path):
+    """Test that background-written checkpoints can be resumed at the saved position"""
+    reference, _ = train(tmp_path / "reference", max_steps=6)
+
+    train(tmp_path / "run", max_steps=3, callbacks=[AsyncCheckpointCallback()])
+    checkpoint = tmp_path / "run" / "checkpoint-3"
+    assert (checkpoint / "rng_state.pth").is_file()
+    assert json.loads((checkpoint / DATALOADER_STATE_NAME).read_text())["position"] == 12
+
+    resumed, _ = train(
+        tmp_path / "run", max_steps=6, resume=str(checkpoint), callbacks=[AsyncCheckpointCallback()]
+    )
+
+    assert resumed == reference[12:]
+
+
+def test_every_rank_gets_its_own_rng_state_file(monkeypatch):
+    """Test that multi-process checkpoints hold one rng_state_<rank>.pth per process, as the Trainer writes"""
+    torch = require_real_module("torch")
+
+    def all_gather_object(states, state):
+        states[:] = [{**state, "rank": rank} for rank in range(len(states))]
+
+    monkeypatch.setattr(torch.distributed, "all_gather_object", all_gather_object)
+
+    assert list(rng_states(SimpleNamespace(world_size=1))) == ["rng_state.pth"]
+    states = rng_states(SimpleNamespace(world_size=2))
+    assert list(states) == ["rng_state_0.pth", "rng_state_1.pth"]
+    assert [state["rank"] for state in states.values()] == [0, 1]
+
+
+def test_trainer_without_run_epoch_is_refused():
+    """Test that a Trainer without the per-epoch hook fails when the class is built, not mid-resume"""
+    transformers = require_real_module("transformers")
+
+    class OldTrainer(transformers.Trainer):
+        _run_epoch = None
+
+    with pytest.raises(RuntimeError, match="transformers>=5.3"):
+        resumable_trainer(OldTrainer)
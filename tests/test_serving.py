@@ -0,0 +1,162 @@
+"""
+Multi-LoRA serving config and smoke client tests for LoRA training framework
+"""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+
+from scripts import convert_vllm
+from scripts.config_loader import load_config
+from scripts.convert_vllm import vllm_lora_rank
+from scripts.smoke_client import smoke_test
+from tests.utils.openai_stub import OpenAIStub
+
+REPO = Path(__file__).resolve().parents[1]
+# Qwen3-30B-A3B's shape: 48 layers with 4 KV heads of 128 dims, 128 experts (8 active)
+BASE_CONFIG = {
+    "model_type": "qwen3_moe",
+    "hidden_size": 2048,
+    "intermediate_size": 6144,
+    "moe_intermediate_size": 768,
+    "num_hidden_layers": 48,
+    "num_attention_heads": 32,
+    "num_key_value_heads": 4,
+    "head_dim": 128,
+    "num_experts": 128,
+    "num_experts_per_tok": 8,
+    "vocab_size": 151936,
+    "max_position_embeddings": 262144,
+}
+
+
+def write_domain(tmp_path, domain, rank, **adapter_config):
+    """Write a domain config with a training example and a saved adapter of the given rank on a local base model"""
+    base_dir = tmp_path / "base-model"
+    base_dir.mkdir(exist_ok=True)
+    (base_dir / "config.json").write_text(json.dumps(BASE_CONFIG))
+    adapter_dir = tmp_path / "adapters" / domain
+    (adapter_dir / "checkpoint-100").mkdir(parents=True, exist_ok=True)
+    settings = {"r": rank, "lora_alpha": 2 * rank, "base_model_name_or_path": str(base_dir)}
+    (adapter_dir / "adapter_config.json").write_text(json.dumps({**settings, **adapter_config}))
+    (adapter_dir / "adapter_model.safetensors").write_bytes(os.urandom(256))
+    (adapter_dir / "checkpoint-100" / "optimizer.pt").write_bytes(b"state")
+
+    train_file = tmp_path / f"{domain}.jsonl"
+    train_file.write_text(
+        json.dumps({"instruction": f"Write a {domain} script", "output": "code"}) + "\n"
+    )
+    config = yaml.safe_load((REPO / "config" / f"{domain}.yaml").read_text())
+    config["data"] = {"train_file": str(train_file)}
+    config["model"]["name"] = str(base_dir)
+    config["output"] = {"adapter_dir": str(adapter_dir)}
+    config_file = tmp_path / f"{domain}.yaml"
+    config_file.write_text(yaml.dump(config))
+    return str(config_file)
+
+
+@pytest.fixture
+def domain_configs(tmp_path):
+    """Provide avorion (r=16, one layer at r=24) and gdscript (r=8) configs with their adapters"""
+    (tmp_path / "base.yaml").write_text((REPO / "config" / "base.yaml").read_text())
+    return [
+        write_domain(tmp_path, "avorion", 16, rank_pattern={"down_proj": 24}),
+        write_domain(tmp_path, "gdscript", 8),
+    ]
+
+
+def vllm_cli_args(config_file) -> list[str]:
+    """The arguments vLLM's FlexibleArgumentParser.load_config_file makes of a config file"""
+    args = []
+    for key, value in yaml.safe_load(Path(config_file).read_text()).items():
+        if isinstance(value, bool):
+            args += [f"--{key}"] if value else []
+        elif isinstance(value, list):
+            args += [f"--{key}", *map(str, value)] if value else []
+        elif isinstance(value, dict):
+            args += [f"--{key}", json.dumps(value)]
+        else:
+            args += [f"--{key}", str(value)]
+    return args
+
+
+def test_vllm_lora_rank_rounds_up_to_supported_value():
+    """Test that adapter ranks map to the smallest max_lora_rank vLLM accepts"""
+    assert vllm_lora_rank(8) == 8
+    assert vllm_lora_rank(24) == 32
+    with pytest.raises(ValueError, match="exceeds"):
+        vllm_lora_rank(1024)
+
+
+def test_multi_lora_config_registers_every_domain(domain_configs, tmp_path, monkeypatch):
+    """Test that one base model serves each adapter under its domain name, sized from the adapters"""
+    monkeypatch.chdir(tmp_path)
+    convert_vllm.main(["--multi-lora", "--name", "game", "--config", *domain_configs])
+
+    vllm_config = yaml.safe_load((tmp_path / "game_vllm" / "vllm_config.yaml").read_text())
+    assert vllm_config["model"] == str(tmp_path / "base-model")
+    assert vllm_config["enable_lora"] is True
+    assert vllm_config["max_lora_rank"] == 32
+    assert vllm_config["max_loras"] == vllm_config["max_cpu_loras"] == 2
+    assert (
+        "quantization" not in vllm_config
+    )  # an unquantized base; "--quantization None" would be rejected
+
+    # --lora-modules reads each flattened value with json.loads
+    args = vllm_cli_args(tmp_path / "game_vllm" / "vllm_config.yaml")
+    assert "None" not in args
+    start = args.index("--lora_modules") + 1
+    modules = [json.loads(item) for item in args[start : start + 2]]
+    assert [module["name"] for module in modules] == ["avorion", "gdscript"]
+    assert {module["base_model_name"] for module in modules} == {str(tmp_path / "base-model")}
+
+    staged = tmp_path / modules[0]["path"]
+    assert os.path.samefile(
+        staged / "adapter_model.safetensors",
+        tmp_path / "adapters/avorion/adapter_model.safetensors",
+    )
+    assert not (staged / "checkpoint-100").exists()
+
+    # 30B bf16 weights fit one GB10; both domains trained at 2048 tokens
+    assert vllm_config["tensor_parallel_size"] == 1
+    assert vllm_config["max_model_len"] == 2048
+    assert vllm_config["max_num_seqs"] == 256
+    assert "kv_cache_dtype" not in vllm_config
+    assert (
+        "48 attention layers x 4 KV heads"
+        in (tmp_path / "game_vllm" / "serving_params.md").read_text()
+    )
+
+
+def test_multi_lora_refuses_dora_and_mixed_bases(domain_configs, tmp_path, monkeypatch):
+    """Test that adapters vLLM cannot serve (DoRA, fused MoE experts) or trained on different bases are rejected"""
+    monkeypatch.chdir(tmp_path)
+    write_domain(tmp_path, "gdscript", 8, use_dora=True)
+    with pytest.raises(ValueError, match="DoRA"):
+        convert_vllm.main(["--multi-lora", "--name", "game", "--config", *domain_configs])
+
+    write_domain(tmp_path, "gdscript", 8, target_parameters=["gate_up_proj", "down_proj"])
+    with pytest.raises(ValueError, match="serve the merged model"):
+        convert_vllm.main(["--multi-lora", "--name", "game", "--config", *domain_configs])
+
+    config = yaml.safe_load(Path(domain_configs[1]).read_text())
+    config["model"]["name"] = "Qwen/Qwen3-8B"
+    Path(domain_configs[1]).write_text(yaml.dump(config))
+    with pytest.raises(ValueError, match="share one base model"):
+        convert_vllm.main(["--multi-lora", "--name", "game", "--config", *domain_configs])
+
+
+def test_smoke_client_routes_one_request_per_domain(domain_configs):
+    """Test that each domain is requested under its own model name and missing adapters fail"""
+    configs = [load_config(path) for path in domain_configs]
+    with OpenAIStub([configs[0]["model"]["name"], "avorion"]) as stub:
+        results = smoke_test(stub.url, configs, max_tokens=8)
+
+    assert [request["model"] for request in stub.requests] == ["avorion", "gdscript"]
+    assert stub.requests[0]["prompt"].endswith("### Response:\n")
+    assert "Write a avorion script" in stub.requests[0]["prompt"]
+    assert [result["ok"] for result in results] == [True, False]
+    assert not results[1]["served"] and "error" in results[1]
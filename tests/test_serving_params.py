@@ -0,0 +1,104 @@
+"""
+vLLM serving parameter tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from scripts.estimate import GIB
+from scripts.serving_params import context_limit, example_lengths, kv_bytes_per_token, recommend
+from tests.utils.tiny_model import build_tiny_tokenizer
+
+QWEN3_8B = {
+    "hidden_size": 4096,
+    "intermediate_size": 12288,
+    "num_hidden_layers": 36,
+    "num_attention_heads": 32,
+    "num_key_value_heads": 8,
+    "head_dim": 128,
+    "vocab_size": 151936,
+    "max_position_embeddings": 40960,
+}
+
+
+def lengths(totals, prompts=None):
+    return {
+        "prompt": prompts or [total // 2 for total in totals],
+        "total": totals,
+        "counted_with": "test",
+    }
+
+
+def test_kv_bytes_per_token_counts_attention_layers():
+    """Test K and V bytes for every attention layer's KV heads, halved by an fp8 cache"""
+    assert kv_bytes_per_token(QWEN3_8B) == 2 * 36 * 8 * 128 * 2
+    assert kv_bytes_per_token(QWEN3_8B, "fp8") == 36 * 8 * 128 * 2
+    hybrid = dict(QWEN3_8B, layer_types=["linear_attention"] * 27 + ["full_attention"] * 9)
+    assert kv_bytes_per_token(hybrid) == kv_bytes_per_token(QWEN3_8B) // 4
+
+
+def test_context_limit_includes_rope_scaling():
+    """Test that YaRN scaling extends the model's context limit"""
+    assert context_limit(QWEN3_8B) == 40960
+    scaled = dict(QWEN3_8B, rope_scaling={"factor": 4.0, "original_max_position_embeddings": 32768})
+    assert context_limit(scaled) == 131072
+
+
+def test_recommend_sizes_context_and_batch_from_lengths():
+    """Test max_model_len from the p99 length with headroom, capped at the model's limit"""
+    result = recommend(QWEN3_8B, 16 * GIB, lengths([900] * 90 + [3000] * 10), min_context=1024)
+    params = result["params"]
+    assert params["max_model_len"] == 4096  # p99 3000 x 1.25, rounded up to 1024
+    assert params["tensor_parallel_size"] == 1
+    assert params["max_num_seqs"] == 256
+    assert params["max_num_batched_tokens"] == 2048
+    assert params["gpu_memory_utilization"] == 0.9
+    assert result["kv_cache_tokens"] * kv_bytes_per_token(QWEN3_8B) < 128 * GIB * 0.9 - 16 * GIB
+
+    long = recommend(QWEN3_8B, 16 * GIB, lengths([60000] * 10))
+    assert long["params"]["max_model_len"] == 40960
+    assert any("capped at the model's context limit" in line for line in long["reasoning"])
+
+
+def test_recommend_splits_or_refuses_models_that_do_not_fit():
+    """Test that tensor parallelism is used only when one device is too small, and errors otherwise"""
+    data = lengths([1000] * 10)
+    assert (
+        recommend(QWEN3_8B, 65e9, data, hardware="h100", gpus=2)["params"]["tensor_parallel_size"]
+        == 1
+    )
+    assert (
+        recommend(QWEN3_8B, 100e9, data, hardware="h100", gpus=2)["params"]["tensor_parallel_size"]
+        == 2
+    )
+    with pytest.raises(ValueError, match="no room for a KV cache"):
+        recommend(QWEN3_8B, 100e9, data, hardware="h100", gpus=1)
+
+    tight = recommend(QWEN3_8B, 68e9, lengths([30000] * 10), hardware="h100")
+    assert tight["params"]["max_model_len"] <= tight["kv_cache_tokens"]
+    assert tight["params"]["max_num_seqs"] < 8
+
+
+def test_example_lengths_use_tokenizer_or_character_estimate(tmp_path):
+    """Test that prompt and full-example lengths come from the tokenizer, or characters without one"""
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text(
+        json.dumps({"instruction": "Add two numbers", "output": "return a + b"}) + "\n"
+    )
+    config = {
+        "prompt_template": "### Instruction:\n{instruction}\n\n### Response:\n{output}",
+        "data": {"train_file": str(train_file), "eval_file": str(tmp_path / "missing.jsonl")},
+    }
+
+    counted = example_lengths([config], build_tiny_tokenizer())
+    assert counted["counted_with"] == "the model's tokenizer"
+    assert len(counted["total"]) == 1 and counted["total"][0] > counted["prompt"][0] > 0
+
+    estimated = example_lengths([config])
+    assert "characters per token" in estimated["counted_with"]
+    assert estimated["total"][0] > estimated["prompt"][0]
+    assert (
+        example_lengths([dict(config, data={"train_file": str(tmp_path / "none.jsonl")})])["total"]
+        == []
+    )
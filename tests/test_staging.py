@@ -0,0 +1,106 @@
+"""
+Zero-copy staging tests for LoRA training framework
+"""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+
+from scripts import convert_vllm, staging
+from scripts.staging import stage_directory
+
+CONFIG = str(Path(__file__).resolve().parents[1] / "config" / "avorion.yaml")
+QWEN3_8B = {
+    "model_type": "qwen3",
+    "hidden_size": 4096,
+    "intermediate_size": 12288,
+    "num_hidden_layers": 36,
+    "num_attention_heads": 32,
+    "num_key_value_heads": 8,
+    "head_dim": 128,
+    "vocab_size": 151936,
+    "max_position_embeddings": 40960,
+}
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """Provide a small merged-model directory with a nested file"""
+    model = tmp_path / "merged"
+    (model / "extra").mkdir(parents=True)
+    (model / "config.json").write_text(json.dumps(QWEN3_8B))
+    (model / "model.safetensors").write_bytes(os.urandom(4096))
+    (model / "extra" / "notes.txt").write_text("notes")
+    return model
+
+
+def test_stage_directory_hardlinks_and_skips_unchanged(model_dir, tmp_path):
+    """Test that files are hardlinked and a second staging touches nothing"""
+    target = tmp_path / "staged"
+    counts = stage_directory(model_dir, target)
+    assert counts["hardlink"] == 3 and counts["bytes_copied"] == 0
+    assert os.path.samefile(model_dir / "model.safetensors", target / "model.safetensors")
+    assert (target / "extra" / "notes.txt").read_text() == "notes"
+
+    counts = stage_directory(model_dir, target)
+    assert counts["unchanged"] == 3 and counts["hardlink"] == 0
+
+
+def test_stage_directory_falls_back_to_copy(model_dir, tmp_path, monkeypatch):
+    """Test that copying is used only when no link works, and copies are recognised by hash"""
+
+    def refuse(*args, **kwargs):
+        raise OSError("links not supported")
+
+    monkeypatch.setattr(staging.os, "link", refuse)
+    monkeypatch.setattr(staging.os, "symlink", refuse)
+    monkeypatch.setattr(staging, "reflink", refuse)
+
+    target = tmp_path / "staged"
+    counts = stage_directory(model_dir, target)
+    assert counts["copy"] == 3
+    assert counts["bytes_copied"] == sum(
+        path.stat().st_size for path in model_dir.rglob("*") if path.is_file()
+    )
+    assert not os.path.samefile(model_dir / "model.safetensors", target / "model.safetensors")
+
+    assert stage_directory(model_dir, target)["unchanged"] == 3
+    (model_dir / "config.json").write_text('{"model_type": "llama"}')
+    counts = stage_directory(model_dir, target)
+    assert counts["copy"] == 1 and counts["unchanged"] == 2
+    assert (target / "config.json").read_text() == '{"model_type": "llama"}'
+
+
+def test_stage_directory_symlinks_and_prunes_stale_files(model_dir, tmp_path):
+    """Test symlink staging and that files gone from the source are removed, except kept ones"""
+    target = tmp_path / "staged"
+    target.mkdir()
+    (target / "old.safetensors").write_text("stale")
+    (target / "keep.yaml").write_text("kept")
+
+    counts = stage_directory(model_dir, target, ("symlink", "copy"), keep={"keep.yaml"})
+    assert counts["symlink"] == 3
+    assert (target / "model.safetensors").is_symlink()
+    assert not (target / "old.safetensors").exists()
+    assert (target / "keep.yaml").read_text() == "kept"
+
+
+def test_convert_vllm_stages_model_and_writes_config(model_dir, tmp_path, monkeypatch):
+    """Test that conversion stages files flat into <name>_vllm without touching the merged model"""
+    monkeypatch.chdir(tmp_path)
+    argv = ["--model", str(model_dir), "--name", "tiny", "--config", CONFIG]
+    convert_vllm.main(argv)
+    convert_vllm.main(argv)
+
+    output_dir = tmp_path / "tiny_vllm"
+    assert os.path.samefile(model_dir / "model.safetensors", output_dir / "model.safetensors")
+    assert not (output_dir / "merged").exists()
+    vllm_config = yaml.safe_load((output_dir / "vllm_config.yaml").read_text())
+    assert vllm_config["model"] == "tiny_vllm"
+    assert vllm_config["max_model_len"] == 2048  # no data in tmp_path: training max_seq_length
+    assert vllm_config["tensor_parallel_size"] == 1
+    assert "max_num_seqs" in (output_dir / "serving_params.md").read_text()
+    assert not (model_dir / "vllm_config.yaml").exists()
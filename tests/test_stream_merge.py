@@ -0,0 +1,190 @@
+"""
+Streaming LoRA merge tests for LoRA training framework
+"""
+
+import json
+
+import pytest
+
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_moe
+
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "safetensors")
+
+from scripts.bench_merge import run_benchmark
+from scripts.stream_merge import (
+    INDEX_NAME,
+    load_adapter,
+    shard_names,
+    shard_peak_bytes,
+    stream_merge,
+)
+
+TARGETS = ["q_proj", "v_proj", "down_proj"]
+MOE_TARGETS = ["q_proj", "v_proj", "gate_proj", "up_proj", "down_proj"]
+
+
+def save_base_and_adapter(
+    tmp_path, max_shard_size="40KB", build=build_tiny_causal_lm, targets=TARGETS, **lora_overrides
+):
+    """Save a tiny base checkpoint in several shards and a trained-looking LoRA adapter for it"""
+    torch = require_real_module("torch")
+    peft = require_real_module("peft")
+
+    base_dir = tmp_path / "base"
+    build().save_pretrained(base_dir, max_shard_size=max_shard_size)
+
+    settings = {"r": 4, "lora_alpha": 8, "target_modules": targets, "task_type": "CAUSAL_LM"}
+    settings.update(lora_overrides)
+    model = peft.get_peft_model(build(), peft.LoraConfig(**settings))
+    torch.manual_seed(1)
+    with torch.no_grad():
+        for name, parameter in model.named_parameters():
+            if "lora_" in name:
+                parameter.normal_(std=0.5)  # lora_B starts at zero; make every delta non-trivial
+    adapter_dir = tmp_path / "adapter"
+    model.save_pretrained(adapter_dir)
+    return base_dir, adapter_dir
+
+
+def merge_and_unload(base_dir, adapter_dir, dtype):
+    """The reference: PEFT's in-memory merge"""
+    peft = require_real_module("peft")
+    transformers = require_real_module("transformers")
+    base = transformers.AutoModelForCausalLM.from_pretrained(base_dir, torch_dtype=dtype)
+    return peft.PeftModel.from_pretrained(base, adapter_dir).merge_and_unload().state_dict()
+
+
+@pytest.mark.parametrize("dtype", ["float16", "bfloat16", "float32"])
+def test_streaming_merge_is_bit_identical_to_merge_and_unload(tmp_path, dtype):
+    """Test that every merged tensor equals merge_and_unload's bit for bit"""
+    torch = require_real_module("torch")
+    safetensors = require_real_module("safetensors.torch")
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path)
+    assert (base_dir / INDEX_NAME).exists()
+
+    summary = stream_merge(str(base_dir), adapter_dir, tmp_path / "merged", dtype)
+    expected = merge_and_unload(base_dir, adapter_dir, getattr(torch, dtype))
+
+    merged = {}
+    for shard in (tmp_path / "merged").glob("*.safetensors"):
+        merged.update(safetensors.load_file(shard))
+    assert summary["shards"] > 1
+    assert summary["merged"] == 2 * len(TARGETS)
+    assert merged.keys() == expected.keys()
+    for key, tensor in expected.items():
+        assert merged[key].dtype == tensor.dtype, key
+        assert torch.equal(merged[key], tensor), key
+
+
+def test_merged_checkpoint_loads_with_transformers(tmp_path):
+    """Test that the output directory is a complete checkpoint with an index and config"""
+    transformers = require_real_module("transformers")
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path)
+
+    stream_merge(str(base_dir), adapter_dir, tmp_path / "merged")
+
+    index = json.loads((tmp_path / "merged" / INDEX_NAME).read_text())
+    assert set(index["weight_map"].values()) == {
+        p.name for p in (tmp_path / "merged").glob("*.safetensors")
+    }
+    config = json.loads((tmp_path / "merged" / "config.json").read_text())
+    assert "float16" in (config.get("dtype"), config.get("torch_dtype"))
+    transformers.AutoModelForCausalLM.from_pretrained(tmp_path / "merged")
+
+
+def test_rslora_and_rank_pattern_scaling(tmp_path):
+    """Test that per-module ranks and rsLoRA scaling match PEFT"""
+    torch = require_real_module("torch")
+    safetensors = require_real_module("safetensors.torch")
+    base_dir, adapter_dir = save_base_and_adapter(
+        tmp_path,
+        max_shard_size="10GB",
+        use_rslora=True,
+        rank_pattern={"down_proj": 2},
+        alpha_pattern={"v_proj": 3},
+    )
+
+    stream_merge(str(base_dir), adapter_dir, tmp_path / "merged", "float32")
+    merged = safetensors.load_file(tmp_path / "merged" / "model.safetensors")
+    expected = merge_and_unload(base_dir, adapter_dir, torch.float32)
+
+    for key in expected:
+        assert torch.equal(merged[key], expected[key]), key
+    assert not (tmp_path / "merged" / INDEX_NAME).exists()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_fused_moe_experts_merge_into_per_expert_weights(tmp_path, workers):
+    """Test that LoRA on fused experts is split onto the checkpoint's per-expert weights, bit for bit"""
+    torch = require_real_module("torch")
+    transformers = require_real_module("transformers")
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path, "20KB", build_tiny_moe, MOE_TARGETS)
+    assert (
+        "model.layers.0.mlp.experts.3.up_proj.weight"
+        in json.loads((base_dir / INDEX_NAME).read_text())["weight_map"]
+    )
+
+    summary = stream_merge(
+        str(base_dir), adapter_dir, tmp_path / "merged", "bfloat16", workers=workers
+    )
+    merged = transformers.AutoModelForCausalLM.from_pretrained(
+        tmp_path / "merged", dtype=torch.bfloat16
+    ).state_dict()
+    expected = merge_and_unload(base_dir, adapter_dir, torch.bfloat16)
+
+    # Per layer: q_proj, v_proj and 4 experts x (gate_proj, up_proj, down_proj)
+    assert summary["merged"] == 2 * (2 + 4 * 3)
+    assert merged.keys() == expected.keys()
+    for key, tensor in expected.items():
+        assert torch.equal(merged[key], tensor), key
+
+
+def test_unsupported_adapters_are_refused(tmp_path):
+    """Test that DoRA and modules_to_save adapters point to the in-memory merge"""
+    _, adapter_dir = save_base_and_adapter(tmp_path, modules_to_save=["lm_head"])
+    with pytest.raises(ValueError, match="in-memory"):
+        load_adapter(adapter_dir)
+
+
+def test_parallel_merge_matches_single_process(tmp_path):
+    """Test that merging shards on a process pool writes the same files and index"""
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path)
+
+    single = stream_merge(str(base_dir), adapter_dir, tmp_path / "single")
+    parallel = stream_merge(str(base_dir), adapter_dir, tmp_path / "parallel", workers=2)
+
+    assert single["workers"] == 1 and parallel["workers"] == 2
+    for path in (tmp_path / "single").iterdir():
+        assert (tmp_path / "parallel" / path.name).read_bytes() == path.read_bytes(), path.name
+
+
+def test_memory_budget_limits_shards_in_flight(tmp_path):
+    """Test that no more shards run at once than fit in the memory budget"""
+    torch = require_real_module("torch")
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path)
+    adapter_bytes = (adapter_dir / "adapter_model.safetensors").stat().st_size
+    peaks = [
+        shard_peak_bytes(base_dir / name, torch.float16, adapter_bytes)
+        for name in shard_names(base_dir)
+    ]
+    budget = max(peaks) + min(peaks) - 1  # never room for the two largest together
+
+    summary = stream_merge(
+        str(base_dir), adapter_dir, tmp_path / "merged", workers=4, memory_budget=budget
+    )
+
+    assert summary["max_in_flight_bytes"] <= budget
+    assert (tmp_path / "merged" / INDEX_NAME).exists()
+
+
+def test_benchmark_reports_speedup(tmp_path):
+    """Test that the merge benchmark times single-process first and reports speedups against it"""
+    base_dir, adapter_dir = save_base_and_adapter(tmp_path)
+
+    results = run_benchmark(str(base_dir), adapter_dir, [2], scratch=tmp_path)
+
+    assert [r["workers"] for r in results] == [1, 2]
+    assert results[0]["speedup"] == 1.0 and results[1]["speedup"] > 0
+    assert not list(tmp_path.glob("merge-*"))
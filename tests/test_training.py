@@ -2,17 +2,11 @@
 Training pipeline tests for LoRA training framework
 """
 
-import pytest
-from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
-import sys
+from tests.utils.mock_helpers import mock_missing_modules, require_real_module
+from tests.utils.tiny_model import build_tiny_causal_lm, build_tiny_tokenizer
 
-# Mock the required imports for testing
-sys.modules["torch"] = Mock()
-sys.modules["transformers"] = Mock()
-sys.modules["peft"] = Mock()
-sys.modules["trl"] = Mock()
-sys.modules["datasets"] = Mock()
+# Mock the required imports for testing when they are not installed
+mock_missing_modules("torch", "transformers", "peft", "trl", "datasets")
 
 
 def test_training_config_structure():
@@ -174,3 +168,115 @@ def test_configuration_inheritance():
     assert merged_config["training"]["num_epochs"] == 5  # From domain override
     assert merged_config["model"]["load_in_4bit"] == True  # From base
     assert merged_config["domain"] == "avorion"  # From domain
+
+
+def test_train_adapter_builds_sft_trainer_on_tiny_model(tmp_path, monkeypatch):
+    """Test that train_adapter builds SFTConfig/SFTTrainer for the installed trl on the tiny model"""
+    import json
+    from argparse import Namespace
+
+    trl = require_real_module("trl")
+    from scripts.config_loader import load_config
+    from scripts.train import train_adapter
+
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text(
+        "".join(
+            json.dumps({"instruction": f"Task {i}", "output": "print('done')"}) + "\n"
+            for i in range(4)
+        )
+    )
+    config = load_config("config/gdscript.yaml")
+    config["data"] = {"train_file": str(train_file), "num_proc": 1}
+    config["training"].update(
+        num_epochs=1,
+        batch_size=2,
+        gradient_accumulation=1,
+        bf16=False,
+        optim="adamw_torch",
+        max_seq_length=64,
+    )
+    config["output"].update(adapter_dir=str(tmp_path / "adapter"), save_steps=100, logging_steps=1)
+    tokenizer = build_tiny_tokenizer()
+    tokenizer.pad_token = tokenizer.eos_token
+
+    # trl's fused LM-head kernel needs a GPU, so stop at the built trainer
+    built = []
+    monkeypatch.setattr(trl.SFTTrainer, "train", lambda self, **kwargs: built.append(self))
+    model = train_adapter(
+        build_tiny_causal_lm(vocab_size=len(tokenizer)),
+        tokenizer,
+        config,
+        Namespace(auto_batch=False, resume=None),
+    )
+
+    trainer = built[0]
+    assert isinstance(trainer.args, trl.SFTConfig)
+    assert trainer.args.max_length == 64 and not trainer.args.gradient_checkpointing
+    assert trainer.args.learning_rate == 2e-4 and trainer.args.warmup_steps == 0.03
+    assert trainer.processing_class is tokenizer
+    assert trainer.train_dataset.column_names == ["input_ids", "attention_mask"]
+    assert (tmp_path / "adapter" / "adapter_model.safetensors").exists()
+    assert not any("lora_" in name for name, _ in model.named_parameters())
+
+
+def test_train_adapter_trains_end_to_end_on_cpu(tmp_path):
+    """Test that a real trainer.train() on the chunked-loss path writes the adapter, checkpoints and telemetry"""
+    import json
+    from argparse import Namespace
+
+    require_real_module("trl")
+    torch = require_real_module("torch")
+    safetensors = require_real_module("safetensors.torch")
+    from scripts.config_loader import load_config
+    from scripts.train import train_adapter
+
+    train_file = tmp_path / "train.jsonl"
+    train_file.write_text(
+        "".join(
+            json.dumps({"instruction": f"Task {i}", "output": "print('done')"}) + "\n"
+            for i in range(8)
+        )
+    )
+    config = load_config("config/gdscript.yaml")
+    config["data"] = {"train_file": str(train_file), "num_proc": 1}
+    # The chunked loss never calls trl's fused LM-head kernel, which needs a GPU
+    config["training"].update(
+        num_epochs=1,
+        batch_size=2,
+        gradient_accumulation=1,
+        bf16=False,
+        optim="adamw_torch",
+        max_seq_length=64,
+        loss_chunk_size=16,
+    )
+    config["output"].update(adapter_dir=str(tmp_path / "adapter"), save_steps=2, logging_steps=1)
+    tokenizer = build_tiny_tokenizer()
+    tokenizer.pad_token = tokenizer.eos_token
+
+    train_adapter(
+        build_tiny_causal_lm(vocab_size=len(tokenizer)),
+        tokenizer,
+        config,
+        Namespace(auto_batch=False, resume=None),
+    )
+
+    adapter_dir = tmp_path / "adapter"
+    weights = safetensors.load_file(adapter_dir / "adapter_model.safetensors")
+    lora_b = [tensor for name, tensor in weights.items() if "lora_B" in name]
+    assert lora_b and any(
+        torch.count_nonzero(tensor) for tensor in lora_b
+    )  # trained away from zero init
+
+    # 8 examples in batches of 2: 4 steps, saved every 2
+    for step in (2, 4):
+        checkpoint = adapter_dir / f"checkpoint-{step}"
+        assert (checkpoint / "adapter_model.safetensors").exists()
+        assert json.loads((checkpoint / "trainer_state.json").read_text())["global_step"] == step
+
+    records = [
+        json.loads(line) for line in (adapter_dir / "telemetry.jsonl").read_text().splitlines()
+    ]
+    steps = [record for record in records if record["event"] == "step"]
+    assert [record["step"] for record in steps] == [1, 2, 3, 4]
+    assert all(record["tokens"] > 0 and record["tokens_per_s"] > 0 for record in steps)
@@ -0,0 +1,76 @@
+"""
+Worker for the multi-process training test; run with torchrun --nproc_per_node 2
+Usage: python -m torch.distributed.run --standalone --nproc_per_node 2 tests/utils/ddp_worker.py <output_dir>
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import torch
+from peft import LoraConfig, get_peft_model
+from transformers import Trainer, TrainingArguments
+
+from scripts.distributed import (
+    distributed_arguments,
+    log,
+    min_across_ranks,
+    rank,
+    save_adapter,
+    world_size,
+)
+from tests.utils.tiny_model import build_tiny_causal_lm, pad_collator, random_token_examples
+
+
+def main():
+    output = Path(sys.argv[1])
+    config = {"distributed": {"mode": "ddp", "backend": "gloo"}}
+
+    model = build_tiny_causal_lm()
+    model = get_peft_model(
+        model,
+        LoraConfig(r=4, lora_alpha=8, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"),
+    )
+
+    examples = random_token_examples(16)
+    for index, example in enumerate(examples):
+        example["index"] = index
+
+    seen = []
+
+    def collate(features):
+        seen.extend(feature.pop("index") for feature in features)
+        return pad_collator(features)
+
+    args = TrainingArguments(
+        output_dir=str(output / "checkpoints"),
+        per_device_train_batch_size=2,
+        num_train_epochs=1,
+        learning_rate=1e-2,
+        logging_steps=1,
+        save_strategy="no",
+        report_to="none",
+        use_cpu=True,
+        remove_unused_columns=False,
+        **distributed_arguments(config),
+    )
+    trainer = Trainer(model=model, args=args, train_dataset=examples, data_collator=collate)
+    trainer.train()
+    save_adapter(trainer, None, str(output / "adapter"))
+    log("rank 0 finished")
+
+    lora_weights = [p.detach() for name, p in model.named_parameters() if "lora_" in name]
+    report = {
+        "world_size": world_size(),
+        "seen": seen,
+        "lora_checksum": float(sum(weight.double().sum() for weight in lora_weights)),
+        "backend": torch.distributed.get_backend(),
+        "agreed": min_across_ranks(10 + rank()),
+    }
+    (output / f"rank{rank()}.json").write_text(json.dumps(report))
+    # Tearing gloo down at interpreter exit instead can abort ("terminate called without an active exception")
+    torch.distributed.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,15 @@
 Helper functions for creating mock objects in tests
 """
 
+import importlib.util
 import json
+import sys
+import types
 from unittest.mock import Mock, MagicMock
 from pathlib import Path
 
+import pytest
+
 
 def create_mock_anthropic_client(real_responses=None):
     """Create a mock Anthropic client for testing, optionally with real responses"""
@@ -98,3 +103,18 @@ def get_real_anthropic_response(response_name, real_responses):
 
     # Return a default mock response if no real response is available
     return '{"prompt": "Test prompt", "response": "Test response"}'
+
+
+def mock_missing_modules(*names):
+    """Replace heavy optional dependencies with mocks, but only when they are not installed"""
+    for name in names:
+        if name not in sys.modules and importlib.util.find_spec(name) is None:
+            sys.modules[name] = Mock()
+
+
+def require_real_module(name):
+    """Import a module for a test, skipping when it is missing or has been mocked out"""
+    module = sys.modules.get(name)
+    if module is not None and not isinstance(module, types.ModuleType):
+        pytest.skip(f"{name} is mocked in this environment")
+    return pytest.importorskip(name)
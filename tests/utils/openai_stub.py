@@ -0,0 +1,110 @@
+"""
+A local stand-in for an OpenAI-compatible (vLLM) server, for client tests
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OpenAIStub:
+    """Serve /v1/models and /v1/completions on a free local port; use as a context manager
+
+    Completions answer only for listed models, echoing the model name, and every request
+    body is recorded in self.requests. Streaming requests get max_tokens one-token chunks,
+    token_delay seconds apart, and a usage chunk when stream_options asks for one;
+    self.max_in_flight records the most streams served at once.
+    """
+
+    def __init__(self, models, token_delay=0.0):
+        self.models = list(models)
+        self.token_delay = token_delay
+        self.requests = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/v1/models":
+                    self._send(
+                        200, {"object": "list", "data": [{"id": model} for model in stub.models]}
+                    )
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append(body)
+                if self.path != "/v1/completions" or body.get("model") not in stub.models:
+                    self._send(404, {"error": f"model {body.get('model')} not found"})
+                    return
+                if body.get("stream"):
+                    self._stream(body)
+                    return
+                self._send(
+                    200,
+                    {
+                        "model": body["model"],
+                        "choices": [{"index": 0, "text": f"-- {body['model']}"}],
+                    },
+                )
+
+            def _event(self, event):
+                self.wfile.write(
+                    f"data: {json.dumps(event) if isinstance(event, dict) else event}\n\n".encode()
+                )
+                self.wfile.flush()
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                tokens = body.get("max_tokens", 16)
+                with stub.lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    for _ in range(tokens):
+                        time.sleep(stub.token_delay)
+                        self._event(
+                            {"model": body["model"], "choices": [{"index": 0, "text": " tok"}]}
+                        )
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._event(
+                        {
+                            "model": body["model"],
+                            "choices": [],
+                            "usage": {"completion_tokens": tokens},
+                        }
+                    )
+                self._event("[DONE]")
+
+        return Handler
@@ -0,0 +1,96 @@
+"""
+Helpers for building tiny models and token datasets for CPU tests
+"""
+
+from tests.utils.mock_helpers import require_real_module
+
+TINY_VOCAB_SIZE = 128
+
+
+def build_tiny_causal_lm(seed=0, **overrides):
+    """Build a randomly initialised two-layer Qwen2 model that trains on CPU in milliseconds"""
+    torch = require_real_module("torch")
+    transformers = require_real_module("transformers")
+
+    torch.manual_seed(seed)
+    settings = {
+        "vocab_size": TINY_VOCAB_SIZE,
+        "hidden_size": 32,
+        "intermediate_size": 64,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 4,
+        "num_key_value_heads": 2,
+        "max_position_embeddings": 512,
+        "tie_word_embeddings": False,
+    }
+    settings.update(overrides)
+    config = transformers.Qwen2Config(**settings)
+    return transformers.AutoModelForCausalLM.from_config(config)
+
+
+def build_tiny_moe(seed=0, **overrides):
+    """Build a randomly initialised two-layer Qwen3-MoE (4 experts, fused 3D expert weights in transformers 5)"""
+    torch = require_real_module("torch")
+    transformers = require_real_module("transformers")
+
+    torch.manual_seed(seed)
+    settings = {
+        "vocab_size": TINY_VOCAB_SIZE,
+        "hidden_size": 16,
+        "intermediate_size": 32,
+        "moe_intermediate_size": 8,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 2,
+        "num_key_value_heads": 1,
+        "head_dim": 8,
+        "num_experts": 4,
+        "num_experts_per_tok": 2,
+    }
+    settings.update(overrides)
+    config = transformers.Qwen3MoeConfig(**settings)
+    return transformers.AutoModelForCausalLM.from_config(config)
+
+
+def random_token_examples(count, min_length=8, max_length=32, seed=0):
+    """Create pre-tokenized examples of varying length, as a tokenized dataset would hold"""
+    torch = require_real_module("torch")
+
+    generator = torch.Generator().manual_seed(seed)
+    examples = []
+    for _ in range(count):
+        length = int(torch.randint(min_length, max_length + 1, (1,), generator=generator))
+        input_ids = torch.randint(1, TINY_VOCAB_SIZE, (length,), generator=generator).tolist()
+        examples.append({"input_ids": input_ids, "attention_mask": [1] * length})
+    return examples
+
+
+def pad_collator(features):
+    """Right-pad a list of tokenized examples and mask padding out of the labels"""
+    torch = require_real_module("torch")
+
+    width = max(len(feature["input_ids"]) for feature in features)
+    input_ids = torch.zeros(len(features), width, dtype=torch.long)
+    attention_mask = torch.zeros(len(features), width, dtype=torch.long)
+    for row, feature in enumerate(features):
+        length = len(feature["input_ids"])
+        input_ids[row, :length] = torch.tensor(feature["input_ids"])
+        attention_mask[row, :length] = 1
+    labels = input_ids.masked_fill(attention_mask == 0, -100)
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+
+def build_tiny_tokenizer():
+    """Build a byte-level fast tokenizer (no merges, 256 tokens) that needs no download"""
+    tokenizers = require_real_module("tokenizers")
+    transformers = require_real_module("transformers")
+
+    alphabet = tokenizers.pre_tokenizers.ByteLevel.alphabet()
+    vocab = {token: index for index, token in enumerate(sorted(alphabet))}
+    vocab["<eos>"] = len(vocab)
+    model = tokenizers.models.BPE(vocab=vocab, merges=[])
+    tokenizer = tokenizers.Tokenizer(model)
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = tokenizers.decoders.ByteLevel()
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token="<eos>", pad_token="<eos>"
+    )